@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Columnar archive for old weather readings
+Readings older than a configurable age are moved out of weather_data into
+compressed files partitioned by device and month: Parquet when pyarrow is
+installed, otherwise a NumPy .npz fallback. A manifest lists every
+partition so query paths can read archived data alongside the hot table.
+Partitions are written a batch of rows at a time (Parquet row groups,
+numbered .npz members) and the archived rows deleted in small
+transactions, so a month of readings never sits in memory at once and
+ingest never waits long for the write lock.
+"""
+
+import json
+import os
+import threading
+import time
+import zipfile
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from itertools import chain
+
+import numpy as np
+
+from schema import WEATHER_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# id / device_id / epoch are int64, measurements are float64 (NULL -> NaN)
+VALUE_COLUMNS = WEATHER_COLUMNS[2:]
+ARCHIVE_COLUMNS = ('id', 'device_id', 'epoch') + VALUE_COLUMNS
+INT_COLUMNS = ('id', 'device_id', 'epoch')
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def epoch_to_datetime(epoch):
+    """Station-local 'YYYY-MM-DD HH:MM:SS' string for an archived epoch value"""
+    return datetime.utcfromtimestamp(int(epoch)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _select(columns, keep):
+    return {name: values[keep] for name, values in columns.items()}
+
+
+class _PartitionWriter:
+    """Writes a partition file batch by batch into path.tmp, moved into place by close()
+
+    Counts the rows written and their epoch range for the manifest.
+    """
+
+    def __init__(self, path, fmt):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.tmp = path + '.tmp'
+        self.fmt = fmt
+        self.chunks = 0
+        self.rows = 0
+        self.min_epoch = self.max_epoch = None
+        self._file = None
+
+    def write(self, columns):
+        if not columns['id'].size:
+            return
+        self.rows += int(columns['id'].size)
+        low, high = int(columns['epoch'].min()), int(columns['epoch'].max())
+        self.min_epoch = low if self.min_epoch is None else min(self.min_epoch, low)
+        self.max_epoch = high if self.max_epoch is None else max(self.max_epoch, high)
+        if self.fmt == 'parquet':
+            table = pa.table(columns)
+            if self._file is None:
+                self._file = pq.ParquetWriter(self.tmp, table.schema, compression='zstd')
+            self._file.write_table(table)  # one row group per batch
+        else:
+            if self._file is None:
+                self._file = zipfile.ZipFile(self.tmp, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+            for name, values in columns.items():
+                # What np.savez_compressed writes, as members <column>.<batch>
+                with self._file.open(f'{name}.{self.chunks}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, np.asanyarray(values), allow_pickle=False)
+        self.chunks += 1
+
+    def close(self):
+        self._file.close()
+        with open(self.tmp, 'rb') as file:
+            os.fsync(file.fileno())
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def _npz_column(npz, name):
+    """A column of an .npz partition: one member, or one per batch (<column>.<n>)"""
+    if name in npz.files:
+        return npz[name]
+    parts, index = [], 0
+    while f'{name}.{index}' in npz.files:
+        parts.append(npz[f'{name}.{index}'])
+        index += 1
+    return np.concatenate(parts)
+
+
+def _month_bounds(month):
+    start = datetime.strptime(month, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Archive:
+    """Partitioned columnar archive with a JSON manifest"""
+
+    def __init__(self, root, archive_after_days=90, batch_rows=50000, delete_chunk=2000):
+        self.root = root
+        self.archive_after_days = archive_after_days
+        self.batch_rows = batch_rows  # rows read, converted and written at a time
+        self.delete_chunk = delete_chunk  # archived rows deleted per transaction
+        self.format = 'parquet' if pq is not None else 'npz'
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+
+    # Manifest
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def manifest(self):
+        """Current manifest: {'partitions': {'<device>/<YYYY-MM>': {...}}}
+
+        Reread when the file changed, as another worker process may run the archiver.
+        """
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if self._manifest is None or mtime != self._manifest_mtime:
+                try:
+                    with open(self.manifest_path, 'r') as file:
+                        self._manifest = json.load(file)
+                except (OSError, ValueError):
+                    self._manifest = {'partitions': {}}
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, self.manifest_path)
+        with self._lock:
+            self._manifest = manifest
+            self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    # Partition files
+
+    def _partition_path(self, device_id, month, fmt):
+        return os.path.join(self.root, f'device={device_id}', f'{month}.{fmt}')
+
+    def _read_partition(self, entry, columns=ARCHIVE_COLUMNS):
+        path = os.path.join(self.root, entry['path'])
+        if entry['format'] == 'parquet':
+            table = pq.read_table(path, columns=list(columns), memory_map=True)
+            return {name: table.column(name).to_numpy() for name in columns}
+        with np.load(path) as npz:
+            # NpzFile decompresses members lazily, only requested columns are read
+            return {name: _npz_column(npz, name) for name in columns}
+
+    def _iter_partition(self, entry):
+        """All columns of a partition, a batch (row group, .npz member set) at a time"""
+        path = os.path.join(self.root, entry['path'])
+        if entry['format'] == 'parquet':
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=self.batch_rows, columns=list(ARCHIVE_COLUMNS)):
+                yield {name: batch.column(i).to_numpy(zero_copy_only=False) for i, name in enumerate(ARCHIVE_COLUMNS)}
+            return
+        with np.load(path) as npz:
+            if 'id' in npz.files:
+                yield {name: npz[name] for name in ARCHIVE_COLUMNS}  # written in one piece
+                return
+            index = 0
+            while f'id.{index}' in npz.files:
+                yield {name: npz[f'{name}.{index}'] for name in ARCHIVE_COLUMNS}
+                index += 1
+
+    # Archiving
+
+    def _fetch(self, conn, device_id, start, end):
+        """The readings of a device/time range to archive, in id order, as columns of at most batch_rows rows"""
+        cursor = conn.execute(f'''
+            SELECT id, device_id, CAST(strftime('%s', datetime) AS INTEGER), {', '.join(VALUE_COLUMNS)}
+            FROM weather_data
+            WHERE device_id = ? AND datetime >= ? AND datetime < ?
+              AND id NOT IN (SELECT reading_id FROM latest_reading)
+            ORDER BY id
+        ''', (device_id, start, end))
+        while True:
+            rows = cursor.fetchmany(self.batch_rows)
+            if not rows:
+                return
+            matrix = np.array(rows, dtype=np.float64)
+            yield {name: matrix[:, i].astype(np.int64) if name in INT_COLUMNS else matrix[:, i]
+                   for i, name in enumerate(ARCHIVE_COLUMNS)}
+
+    def _delete(self, conn, device_id, start, end, last_id, write_lock):
+        """Delete the archived rows a chunk per transaction, taking write_lock for each"""
+        while True:
+            with write_lock:
+                with conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    removed = conn.execute('''
+                        DELETE FROM weather_data WHERE id IN (
+                            SELECT id FROM weather_data
+                            WHERE device_id = ? AND datetime >= ? AND datetime < ? AND id <= ?
+                              AND id NOT IN (SELECT reading_id FROM latest_reading)
+                            LIMIT ?
+                        )
+                    ''', (device_id, start, end, last_id, self.delete_chunk)).rowcount
+            if removed < self.delete_chunk:
+                return
+            time.sleep(0)  # let the ingest writer take the lock between chunks
+
+    def archive_partition(self, conn, device_id, month, cutoff, write_lock=None):
+        """Move one device/month of readings older than cutoff into its partition file
+
+        `write_lock` is the lock the ingest writer holds per batch, taken per delete chunk.
+        """
+        start, end = _month_bounds(month)
+        end = min(end, cutoff)
+        batches = self._fetch(conn, device_id, start, end)
+        first = next(batches, None)
+        if first is None:
+            return 0
+
+        key = f'{device_id}/{month}'
+        manifest = self.manifest()
+        existing = manifest['partitions'].get(key)
+        path = self._partition_path(device_id, month, self.format)
+        writer = _PartitionWriter(path, self.format)
+        moved = 0
+        try:
+            # Copy what was archived before; its ids dedupe a rerun after a crash
+            archived_ids = []
+            if existing:
+                for columns in self._iter_partition(existing):
+                    writer.write(columns)
+                    archived_ids.append(columns['id'])
+            archived_ids = np.concatenate(archived_ids) if archived_ids else None
+
+            for columns in chain([first], batches):
+                moved += int(columns['id'].size)
+                last_id = int(columns['id'][-1])  # fetched in id order
+                if archived_ids is not None:
+                    columns = _select(columns, ~np.isin(columns['id'], archived_ids))
+                writer.write(columns)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+
+        partitions = dict(manifest['partitions'])
+        partitions[key] = {
+            'device_id': device_id,
+            'month': month,
+            'path': os.path.relpath(path, self.root),
+            'format': self.format,
+            'rows': writer.rows,
+            'min_epoch': writer.min_epoch,
+            'max_epoch': writer.max_epoch,
+            'bytes': os.path.getsize(path),
+        }
+        self._save_manifest(dict(manifest, partitions=partitions))
+        if existing and existing['path'] != partitions[key]['path']:
+            # Partition was rewritten in the other format
+            os.remove(os.path.join(self.root, existing['path']))
+
+        # Rows are only deleted once the partition and manifest are on disk
+        self._delete(conn, device_id, start, end, last_id, write_lock or nullcontext())
+        return moved
+
+    def run(self, conn, now=None, write_lock=None):
+        """Archive every device/month with readings older than archive_after_days"""
+        now = now or datetime.now()
+        cutoff = (now - timedelta(days=self.archive_after_days)).strftime('%Y-%m-%d %H:%M:%S')
+        partitions = conn.execute('''
+            SELECT DISTINCT device_id, substr(datetime, 1, 7)
+            FROM weather_data
+            WHERE datetime < ? AND datetime GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-*'
+        ''', (cutoff,)).fetchall()
+        moved = 0
+        for device_id, month in partitions:
+            moved += self.archive_partition(conn, device_id, month, cutoff, write_lock)
+        return moved
+
+    # Reading
+
+    def load_columns(self, device_id, start_epoch, end_epoch, columns):
+        """Archived readings of one device in [start_epoch, end_epoch] as float64 columns"""
+        wanted = tuple(dict.fromkeys(('epoch',) + tuple(columns)))
+        parts = []
+        for entry in self.manifest()['partitions'].values():
+            if entry['device_id'] != device_id:
+                continue
+            if entry['max_epoch'] < start_epoch or entry['min_epoch'] > end_epoch:
+                continue
+            data = self._read_partition(entry, wanted)
+            mask = (data['epoch'] >= start_epoch) & (data['epoch'] <= end_epoch)
+            parts.append({name: data[name][mask].astype(np.float64) for name in wanted})
+        if not parts:
+            return {name: np.empty(0) for name in wanted}
+        return {name: np.concatenate([part[name] for part in parts]) for name in wanted}
+
+    def iter_batches(self, device_id=None, start_epoch=None, end_epoch=None):
+        """Archived readings (of one device, or all) in [start_epoch, end_epoch] as ARCHIVE_COLUMNS arrays
+
+        Partition by partition (device, then month) and batch by batch, so
+        an export of the whole archive holds one batch in memory at a time.
+        """
+        entries = sorted(self.manifest()['partitions'].values(), key=lambda entry: (entry['device_id'], entry['month']))
+        for entry in entries:
+            if device_id is not None and entry['device_id'] != device_id:
+                continue
+            if (start_epoch is not None and entry['max_epoch'] < start_epoch
+                    or end_epoch is not None and entry['min_epoch'] > end_epoch):
+                continue
+            for columns in self._iter_partition(entry):
+                keep = np.ones(columns['epoch'].size, dtype=bool)
+                if start_epoch is not None:
+                    keep &= columns['epoch'] >= start_epoch
+                if end_epoch is not None:
+                    keep &= columns['epoch'] <= end_epoch
+                if keep.any():
+                    yield _select(columns, keep)
+
+    def archived_epochs(self, device_id, start_epoch, end_epoch):
+        """Epochs of a device's archived readings in [start_epoch, end_epoch], for duplicate checks
+
+        Reads no partition file unless one of the device's partitions overlaps the range.
+        """
+        return set(self.load_columns(device_id, start_epoch, end_epoch, ())['epoch'].astype(np.int64).tolist())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Asyncio server for the Weather Station (aiohttp)
+Serves what stations and dashboards keep connections open for - /post,
+/api/weather, /api/weather/binary, /api/weather/latest, /serial and the
+two event streams -
+from a single event loop, so thousands of keep-alive connections and
+long-lived streams cost no threads. Handlers never touch SQLite: readings
+go to the write-behind queue, whose writer thread does all database work,
+and the read routes are answered from memory. The dashboard page and the
+other APIs are not served: this server replaces the Flask one and must not
+run next to it on the same data directory, as both would run the
+background services (weather_station.claim_data_directory refuses to).
+
+Usage: python weather_station.py --server async [--host 0.0.0.0] [--port 5000]
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+from aiohttp import web
+
+
+def _json(data, status=200, headers=None):
+    return web.Response(text=json.dumps(data, default=str), status=status, headers=headers,
+                        content_type='application/json')
+
+
+class SerialNotifier:
+    """Wakes streaming /serial clients on the loop when the serial buffer gets a line
+
+    One thread waits on the buffer for all clients; each client awaits the
+    current `changed` event, which is replaced after it fires.
+    """
+
+    def __init__(self, serial_buffer, loop, timeout=15.0):
+        self.serial_buffer = serial_buffer
+        self.loop = loop
+        self.timeout = timeout
+        self.changed = asyncio.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='serial-notifier', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _fire(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def _run(self):
+        seq = self.serial_buffer.last_seq
+        while not self._stop.is_set():
+            entries = self.serial_buffer.wait(seq, timeout=self.timeout)
+            if entries and not self._stop.is_set():
+                seq = entries[-1][0]
+                try:
+                    self.loop.call_soon_threadsafe(self._fire)
+                except RuntimeError:
+                    return  # the loop closed while this thread waited
+
+
+def create_app(station):
+    """aiohttp application over the state of the weather_station module `station`
+
+    The module object is passed in rather than imported, so running
+    weather_station.py as a script does not load a second copy of it.
+    """
+    config = station.config
+
+    @web.middleware
+    async def record_request_metrics(request, handler):
+        started = time.perf_counter()
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        status, streamed = 500, False
+        try:
+            response = await handler(request)
+            status, streamed = response.status, not isinstance(response, web.Response)
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            station.http_requests.labels(route, request.method, str(status)).inc()
+            if not streamed:
+                # A stream's handler returns when the client leaves, that is no latency
+                station.http_duration.labels(route, request.method).observe(time.perf_counter() - started)
+
+    async def handle_post(request):
+        try:
+            # dict() keeps the first value per key; multidict's to_dict() would give lists
+            text, status, headers = station.accept_form_reading(dict(await request.post()))
+            return web.Response(text=text, status=status, headers=headers)
+        except Exception as e:
+            station.add_to_serial_buffer(f"Error in handle_post: {str(e)}")
+            return web.Response(text=f"Error: {str(e)}", status=500)
+
+    async def api_weather(request):
+        try:
+            try:
+                payload = await request.json()
+            except ValueError:
+                payload = None
+            result, status, headers = station.accept_json_reading(payload)
+            return _json(result, status, headers)
+        except Exception as e:
+            return _json({"status": "error", "message": str(e)}, 500)
+
+    async def api_weather_latest(request):
+        try:
+            device = request.query.get('device')
+            if device is not None:
+                try:
+                    data = station.latest_readings.get(int(device))
+                except ValueError:
+                    data = None
+            else:
+                data = station.latest_readings.latest()
+            if data:
+                return _json(data)
+            return _json({"message": "No data available"}, 404)
+        except Exception as e:
+            return _json({"error": str(e)}, 500)
+
+    async def api_weather_binary(request):
+        try:
+            if request.content_length is not None and request.content_length > station.binary_max_bytes():
+                return _json({"status": "error",
+                              "message": f"at most {config.binary_max_records} records per message"}, 413)
+            result, status, headers = station.accept_binary_readings(await request.read())
+            return _json(result, status, headers)
+        except Exception as e:
+            return _json({"status": "error", "message": str(e)}, 500)
+
+    async def handle_serial(request):
+        serial_buffer = station.serial_buffer
+        try:
+            since = int(request.query['since'])
+        except (KeyError, ValueError):
+            return web.Response(text="".join(line + "\n" for line in serial_buffer.lines()))
+        entries = serial_buffer.since(since)
+        return _json({
+            "seq": entries[-1][0] if entries else serial_buffer.last_seq,
+            "lines": [line for _, line in entries]
+        })
+
+    async def start_event_stream(request):
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'
+        })
+        await response.prepare(request)
+        return response
+
+    async def handle_serial_stream(request):
+        notifier = request.app['serial_notifier']
+        serial_buffer = station.serial_buffer
+        seq = request.headers.get('Last-Event-ID') or request.query.get('since') or 0
+        try:
+            seq = int(seq)
+        except ValueError:
+            seq = 0
+        response = await start_event_stream(request)
+        while True:
+            changed = notifier.changed
+            entries = serial_buffer.since(seq)
+            if not entries:
+                try:
+                    await asyncio.wait_for(changed.wait(), config.serial_keepalive)
+                except asyncio.TimeoutError:
+                    await response.write(b": keep-alive\n\n")
+                continue
+            for seq, line in entries:
+                data = line.replace('\n', '\ndata: ')
+                await response.write(f"id: {seq}\ndata: {data}\n\n".encode())
+
+    async def api_weather_stream(request):
+        try:
+            devices = station.parse_device_list(request.query.get('device'))
+        except ValueError:
+            return _json({"error": "device must be a comma-separated list of ids"}, 400)
+        subscriber = station.live_feed.subscribe(devices, loop=asyncio.get_running_loop())
+        try:
+            response = await start_event_stream(request)
+            await response.write(b"retry: 3000\n\n")
+            while True:
+                message = await subscriber.get(timeout=config.serial_keepalive)
+                if message is not None:
+                    await response.write(f"event: reading\ndata: {message}\n\n".encode())
+                elif subscriber.dropped:
+                    # Too slow to keep up; the browser reconnects and starts fresh
+                    await response.write(b"event: dropped\ndata: {}\n\n")
+                    return response
+                else:
+                    await response.write(b": keep-alive\n\n")
+        finally:
+            station.live_feed.unsubscribe(subscriber)
+
+    async def handle_metrics(request):
+        if request.query.get('format') == 'json':
+            return _json({"metrics": station.metrics.as_dict()})
+        return web.Response(body=station.metrics.render_prometheus().encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def start_notifier(app):
+        app['serial_notifier'] = SerialNotifier(station.serial_buffer, asyncio.get_running_loop(),
+                                                config.serial_keepalive)
+        app['serial_notifier'].start()
+
+    async def stop_notifier(app):
+        app['serial_notifier'].stop()
+
+    app = web.Application(middlewares=[record_request_metrics], client_max_size=config.async_max_body)
+    app.router.add_post('/post', handle_post)
+    app.router.add_post('/api/weather', api_weather)
+    app.router.add_post('/api/weather/binary', api_weather_binary)
+    app.router.add_get('/api/weather/latest', api_weather_latest)
+    app.router.add_get('/api/weather/stream', api_weather_stream)
+    app.router.add_get('/serial', handle_serial)
+    app.router.add_get('/serial/stream', handle_serial_stream)
+    app.router.add_get('/metrics', handle_metrics)
+    app.on_startup.append(start_notifier)
+    app.on_cleanup.append(stop_notifier)
+    return app
+
+
+def serve(station, host='0.0.0.0', port=5000):
+    """Run the asyncio server until SIGINT / SIGTERM (the caller has run start_worker())"""
+    web.run_app(create_app(station), host=host, port=port, backlog=station.config.async_backlog,
+                access_log=None, print=None, keepalive_timeout=station.config.async_keepalive)
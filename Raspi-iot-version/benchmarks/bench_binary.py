@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Binary ingest benchmark
+Compares the compact binary format (binary.py) with the /post form: the
+in-process decode cost and wire bytes per reading, then readings accepted
+per second end to end - one form per POST /post, --batch records per POST
+/api/weather/binary and records packed into UDP datagrams - against a
+server started on a scratch data directory. Results are saved as JSON
+under benchmarks/results/.
+
+Usage: python benchmarks/bench_binary.py [--server waitress|async] [--clients 8]
+                                         [--readings 20000] [--batch 100]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import requests
+
+from bench_ingest import APP_DIR, RESULTS_DIR, free_port, git_revision, wait_for_flush
+
+sys.path.insert(0, APP_DIR)
+
+from binary import ACK, ACK_OK, MAX_DATAGRAM_RECORDS, decode, encode, encode_datagrams  # noqa: E402
+from fields import parse_form  # noqa: E402
+
+FORM = {
+    'tempinf': '80.1', 'tempf': '78.5', 'windspeedmph': '12.8', 'windgustmph': '15.2', 'winddir': '270',
+    'rainratein': '0.00', 'humidityin': '55', 'humidity': '68', 'uv': '3', 'solarradiation': '512.4',
+    'baromrelin': '29.85', 'baromabsin': '29.71', 'dailyrainin': '0.12', 'raintodayin': '0.12',
+    'totalrainin': '14.30', 'weeklyrainin': '0.50', 'monthlyrainin': '2.10', 'yearlyrainin': '14.30',
+    'maxdailygust': '21.9', 'wh65batt': '0',
+}
+START_TS = 1700000000
+
+
+def forms(device_id, count, first):
+    """Forms of consecutive readings (one a second) of a device"""
+    for i in range(first, first + count):
+        stamp = datetime.fromtimestamp(START_TS + i, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        yield dict(FORM, id=str(device_id), dateutc=stamp)
+
+
+def readings(device_id, count, first):
+    """The same readings as forms(), as dicts for the binary encoder"""
+    result = []
+    for form in forms(device_id, count, first):
+        data, errors = parse_form(form, device_id, 0)
+        assert not errors, errors
+        data['ts'] = START_TS + len(result) + first
+        result.append(data)
+    return result
+
+
+def measure_decode(iterations):
+    form = next(forms(1, 1, 0))
+    message = encode(readings(1, 100, 0))
+    form_us = min(timeit.repeat(lambda: parse_form(form, 1, 7), number=iterations, repeat=3)) / iterations * 1e6
+    binary_us = min(timeit.repeat(lambda: decode(message, 1, 7), number=iterations // 100,
+                                  repeat=3)) / (iterations // 100 * 100) * 1e6
+    return {
+        'form_decode_us': round(form_us, 2),
+        'binary_decode_us': round(binary_us, 2),
+        'form_bytes': len(urlencode(form)),
+        'binary_bytes': round(len(message) / 100, 1),
+    }
+
+
+def start_server(args, workdir, port, udp_port):
+    os.makedirs(os.path.join(workdir, 'data'), exist_ok=True)
+    with open(os.path.join(workdir, 'data', 'settings.json'), 'w') as file:
+        json.dump({'csvMirror': False, 'timezoneOffset': 0}, file)
+    command = [sys.executable, os.path.join(APP_DIR, 'weather_station.py'), '--server', args.server,
+               '--host', '127.0.0.1', '--port', str(port), '--udp-port', str(udp_port)]
+    process = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}, see {workdir}/logs")
+        try:
+            if requests.get(f"{url}/metrics", timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not come up within 30s")
+
+
+def send_forms(url, device_id, count, first):
+    with requests.Session() as session:
+        for form in forms(device_id, count, first):
+            while session.post(f"{url}/post", data=form, timeout=10).status_code == 503:
+                time.sleep(0.05)
+
+
+def send_binary(url, device_id, count, first, batch):
+    records = readings(device_id, count, first)
+    messages = [encode(records[start:start + batch]) for start in range(0, count, batch)]
+    headers = {'Content-Type': 'application/octet-stream'}
+    with requests.Session() as session:
+        for message in messages:
+            while session.post(f"{url}/api/weather/binary", data=message, headers=headers,
+                               timeout=10).status_code == 503:
+                time.sleep(0.05)
+
+
+def send_udp(port, device_id, count, first):
+    records = readings(device_id, count, first)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(2)
+        for message in encode_datagrams(records):
+            while True:
+                sock.sendto(message, ('127.0.0.1', port))
+                try:
+                    _, _, status, _ = ACK.unpack(sock.recv(ACK.size))
+                except socket.timeout:
+                    continue  # lost datagram or ACK; resending is harmless
+                if status == ACK_OK:
+                    break
+                time.sleep(0.05)
+
+
+def run_clients(target, clients, per_client, first_device):
+    """Readings per second of `clients` threads each sending per_client readings of its own device"""
+    threads = [threading.Thread(target=target, args=(first_device + i, per_client, 0)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * per_client / (time.perf_counter() - started)
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='weather-binary-')
+    data_dir = os.path.join(workdir, 'data')
+    udp_port = free_port()
+    process, url = start_server(args, workdir, free_port(), udp_port)
+    per_client = args.readings // args.clients
+    try:
+        results = {}
+        stored = 0
+        modes = (
+            ('form', lambda device, count, first: send_forms(url, device, count, first)),
+            ('binary', lambda device, count, first: send_binary(url, device, count, first, args.batch)),
+            ('udp', lambda device, count, first: send_udp(udp_port, device, count, first)),
+        )
+        for index, (name, target) in enumerate(modes):
+            rate = run_clients(target, args.clients, per_client, 100 * (index + 1))
+            stored = wait_for_flush(data_dir, stored + args.clients * per_client)
+            results[f'{name}_readings_per_s'] = round(rate, 1)
+        results['stored'] = stored
+        return results
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('dev', 'waitress', 'async'), default='waitress')
+    parser.add_argument('--clients', type=int, default=8, help="sending threads, one device each")
+    parser.add_argument('--readings', type=int, default=20000, help="readings sent per mode")
+    parser.add_argument('--batch', type=int, default=100, help="records per binary HTTP message")
+    parser.add_argument('--iterations', type=int, default=20000, help="decode micro-benchmark iterations")
+    parser.add_argument('--output', help="result file (default: benchmarks/results/binary-<time>-<rev>.json)")
+    args = parser.parse_args()
+
+    results = {
+        'benchmark': 'binary',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'server': args.server, 'clients': args.clients, 'readings': args.readings,
+                   'batch': args.batch, 'udp_records_per_datagram': MAX_DATAGRAM_RECORDS},
+    }
+    results.update(measure_decode(args.iterations))
+    results.update(run(args))
+    for key, value in results.items():
+        if key not in ('config', 'platform'):
+            print(f"{key:<28} {value}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"binary-{stamp}-{results['revision'] or 'unknown'}.json")
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == '__main__':
+    main()
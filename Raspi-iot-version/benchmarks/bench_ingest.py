@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+End-to-end ingest benchmark
+Starts the server on a scratch data directory, drives it with simulated
+stations (simulator.py) and reports throughput, p50/p95/p99 latency, CPU
+time per stored reading and bytes written to disk per reading. Results are
+saved as JSON under benchmarks/results/ so runs of different versions can
+be compared (--compare <earlier result>)
+
+Usage: python benchmarks/bench_ingest.py [--server dev|waitress|gunicorn] [--workers 2]
+                                         [--stations 20] [--interval 0] [--duration 30]
+                                         [--shards 0]
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from simulator import percentile, run_load  # noqa: E402
+
+RESULTS_DIR = os.path.join(APP_DIR, 'benchmarks', 'results')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# Metrics compared by --compare, and whether higher is better
+COMPARED = (
+    ('throughput_rps', True), ('latency_p50_ms', False), ('latency_p95_ms', False),
+    ('latency_p99_ms', False), ('cpu_ms_per_reading', False), ('bytes_written_per_reading', False),
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid):
+    """pid and all its descendants (Linux /proc), for gunicorn's workers"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                parent = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def process_counters(pids):
+    """Summed CPU seconds and storage write bytes of processes (None where /proc is unavailable)"""
+    cpu, written = 0.0, 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as file:
+                fields = file.read().rsplit(')', 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS  # utime + stime
+        except (OSError, IndexError, ValueError):
+            return None, None
+        try:
+            with open(f'/proc/{pid}/io') as file:
+                io = dict(line.split(': ') for line in file.read().splitlines())
+            written += int(io['write_bytes'])
+        except (OSError, KeyError, ValueError):
+            written = None
+    return cpu, written
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def stored_readings(data_dir):
+    """Readings in weather.db, or in the shard files when the server runs sharded"""
+    total = 0
+    for path in [os.path.join(data_dir, 'weather.db')] + glob.glob(os.path.join(data_dir, 'shards', 'weather-*.db')):
+        if not os.path.exists(path):
+            continue
+        try:
+            conn = sqlite3.connect(path, timeout=10)
+            try:
+                total += conn.execute('SELECT COUNT(*) FROM weather_data').fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+    return total
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(args, workdir, port):
+    os.makedirs(os.path.join(workdir, 'data'), exist_ok=True)
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+    with open(os.path.join(workdir, 'data', 'settings.json'), 'w') as file:
+        json.dump({'csvMirror': not args.no_csv}, file)
+
+    command = [sys.executable, os.path.join(APP_DIR, 'weather_station.py'), '--server', args.server,
+               '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(args.workers), '--threads', str(args.threads), '--shards', str(args.shards)]
+    process = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}, see {workdir}/logs")
+        try:
+            if requests.get(f"{url}/serial", timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not come up within 30s")
+
+
+def wait_for_flush(data_dir, expected, timeout=15.0):
+    """Wait until the write-behind queue has stored what was acknowledged"""
+    deadline = time.monotonic() + timeout
+    stored = stored_readings(data_dir)
+    while stored < expected and time.monotonic() < deadline:
+        time.sleep(0.25)
+        stored = stored_readings(data_dir)
+    return stored
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='weather-bench-')
+    data_dir = os.path.join(workdir, 'data')
+    process, url = start_server(args, workdir, free_port())
+    try:
+        # Warm-up: imports, connection pools, statement caches
+        run_load(url, stations=2, interval=0, duration=1.0, json_share=args.json_share,
+                 first_device=10000)
+        time.sleep(1.5)
+
+        pids = process_tree(process.pid)
+        stored_before = stored_readings(data_dir)
+        size_before = directory_size(data_dir)
+        cpu_before, written_before = process_counters(pids)
+
+        result = run_load(url, stations=args.stations, interval=args.interval, duration=args.duration,
+                          json_share=args.json_share)
+        stored = wait_for_flush(data_dir, stored_before + result.accepted) - stored_before
+
+        cpu_after, written_after = process_counters(pids)
+        size_growth = directory_size(data_dir) - size_before
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = result.latencies
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    if written_before is not None and written_after is not None and written_after > written_before:
+        written, written_source = written_after - written_before, 'proc_io_write_bytes'
+    else:
+        # No per-process block I/O accounting (containers, tmpfs): fall back to file growth
+        written, written_source = size_growth, 'data_dir_growth'
+
+    return {
+        'benchmark': 'ingest',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'server': args.server, 'workers': args.workers, 'threads': args.threads,
+            'stations': args.stations, 'interval': args.interval, 'duration': args.duration,
+            'json_share': args.json_share, 'csv_mirror': not args.no_csv, 'shards': args.shards,
+        },
+        'requests': sum(result.statuses.values()) + result.errors,
+        'statuses': {str(status): count for status, count in sorted(result.statuses.items())},
+        'connection_errors': result.errors,
+        'accepted': result.accepted,
+        'stored': stored,
+        'elapsed_s': round(result.elapsed, 3),
+        'throughput_rps': round(result.accepted / result.elapsed, 1),
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'latency_max_ms': round(max(latencies) * 1000, 3) if latencies else None,
+        'cpu_s': round(cpu, 3) if cpu is not None else None,
+        'cpu_ms_per_reading': round(cpu * 1000 / stored, 4) if cpu is not None and stored else None,
+        'request_bytes': result.request_bytes,
+        'bytes_written': written,
+        'bytes_written_source': written_source,
+        'bytes_written_per_reading': round(written / stored, 1) if stored else None,
+        # Bytes hitting storage per byte of reading payload received
+        'write_amplification': round(written / result.request_bytes, 2) if result.request_bytes else None,
+    }
+
+
+def compare(current, previous_path):
+    with open(previous_path) as file:
+        previous = json.load(file)
+    print(f"\nvs {previous_path} (revision {previous.get('revision')}):")
+    for key, higher_is_better in COMPARED:
+        old, new = previous.get(key), current.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        verdict = 'better' if better else 'worse' if abs(change) >= 1 else 'same'
+        print(f"  {key:<28} {old:>12} -> {new:<12} {change:+6.1f}% {verdict}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('dev', 'waitress', 'gunicorn'), default='waitress')
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--stations', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.0,
+                        help="seconds between posts per station (0 = as fast as the server answers)")
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--json-share', type=float, default=0.2)
+    parser.add_argument('--no-csv', action='store_true', help="disable the legacy CSV mirror")
+    parser.add_argument('--shards', type=int, default=0, help="database files the stations are split over")
+    parser.add_argument('--output', help="result file (default: benchmarks/results/ingest-<time>-<rev>.json)")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    parser.add_argument('--keep', action='store_true', help="keep the scratch data directory")
+    args = parser.parse_args()
+
+    results = run(args)
+    for key, value in results.items():
+        if key not in ('config', 'platform'):
+            print(f"{key:<28} {value}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"ingest-{stamp}-{results['revision'] or 'unknown'}.json")
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
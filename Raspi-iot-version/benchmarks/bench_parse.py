@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of /post form parsing
+Compares the per-request cost of the original inline parsing (22 form
+lookups, float()/int(), unit math and a strptime/strftime round-trip)
+with the compiled field table in fields.py
+
+Usage: python benchmarks/bench_parse.py [--iterations 50000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fields import parse_form  # noqa: E402
+
+FORM = ImmutableMultiDict({
+    'id': '44', 'dateutc': '2024-01-15 14:30:00', 'tempinf': '80.1', 'tempf': '78.5',
+    'windspeedmph': '12.8', 'windgustmph': '15.2', 'winddir': '270', 'rainratein': '0.00',
+    'humidityin': '55', 'humidity': '68', 'uv': '3', 'solarradiation': '512.4',
+    'baromrelin': '29.85', 'baromabsin': '29.71', 'dailyrainin': '0.12', 'raintodayin': '0.12',
+    'totalrainin': '14.30', 'weeklyrainin': '0.50', 'monthlyrainin': '2.10',
+    'yearlyrainin': '14.30', 'maxdailygust': '21.9', 'wh65batt': '0',
+})
+
+
+def legacy_parse(form, default_device=1):
+    """The parsing handle_post did before the field table"""
+    device_id = form.get('id')
+    if device_id:
+        device_id = int(device_id)
+    else:
+        device_id = default_device
+
+    weather_data = {
+        'device_id': device_id,
+        'datetime': form.get('dateutc', ''),
+        'windspeed_kmh': float(form.get('windspeedmph', 0)) * 1.60934,
+        'wind_direction': int(form.get('winddir', 0)),
+        'rain_rate_in': float(form.get('rainratein', 0)),
+        'temp_in_c': (5.0 / 9.0) * (float(form.get('tempinf', 0)) - 32.0),
+        'temp_out_c': (5.0 / 9.0) * (float(form.get('tempf', 0)) - 32.0),
+        'humidity_in': int(form.get('humidityin', 0)),
+        'humidity_out': int(form.get('humidity', 0)),
+        'uv_index': float(form.get('uv', 0)),
+        'wind_gust_kmh': float(form.get('windgustmph', 0)) * 1.60934,
+        'barometric_pressure_rel_in': float(form.get('baromrelin', 0)),
+        'barometric_pressure_abs_in': float(form.get('baromabsin', 0)),
+        'solar_radiation_wm2': float(form.get('solarradiation', 0)),
+        'daily_rain_in': float(form.get('dailyrainin', 0)),
+        'rain_today_in': float(form.get('raintodayin', 0)),
+        'total_rain_in': float(form.get('totalrainin', 0)),
+        'weekly_rain_in': float(form.get('weeklyrainin', 0)),
+        'monthly_rain_in': float(form.get('monthlyrainin', 0)),
+        'yearly_rain_in': float(form.get('yearlyrainin', 0)),
+        'max_daily_gust': float(form.get('maxdailygust', 0)),
+        'wh65_batt': float(form.get('wh65batt', 0))
+    }
+
+    if weather_data['datetime']:
+        dt = datetime.strptime(weather_data['datetime'], '%Y-%m-%d %H:%M:%S')
+        dt += timedelta(hours=7)
+        weather_data['datetime'] = dt.strftime('%Y-%m-%d %H:%M:%S')
+    return weather_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50000)
+    args = parser.parse_args()
+
+    old = legacy_parse(FORM)
+    new, errors = parse_form(FORM, 1, 7)
+    assert not errors, errors
+    for column, value in old.items():
+        assert abs(new[column] - value) < 1e-9 if isinstance(value, float) else new[column] == value, column
+
+    results = {}
+    for label, func in (('legacy inline parse', lambda: legacy_parse(FORM)),
+                        ('compiled field table', lambda: parse_form(FORM, 1, 7))):
+        best = min(timeit.repeat(func, number=args.iterations, repeat=5))
+        results[label] = best / args.iterations * 1e6
+        print(f"{label:<24} {results[label]:8.2f} us/request")
+    speedup = results['legacy inline parse'] / results['compiled field table']
+    print(f"{'speedup':<24} {speedup:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Sharded storage benchmark
+Runs the real ingest path (queue_weather_data, the shards' ingest writers,
+rollups and quality control) in several writer processes at once, as
+gunicorn workers do, once with every station in one database file and
+once split over --shards files. Reports readings stored per second, the
+mean time per batch transaction and the time per batch spent in BEGIN
+IMMEDIATE, i.e. waiting for SQLite's write lock (with more writer threads
+than cores this includes waiting for the CPU). Results are saved as JSON
+under benchmarks/results/.
+
+Usage: python benchmarks/bench_shards.py [--writers 3] [--shards 4] [--stations 12]
+                                         [--duration 10] [--synchronous NORMAL|FULL]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench_ingest import APP_DIR, RESULTS_DIR, git_revision, stored_readings
+
+sys.path.insert(0, APP_DIR)
+
+from shards import prepare_storage  # noqa: E402
+
+
+def histogram(snapshot, name, **labels):
+    """(sum, count) of a histogram series in a Registry.as_dict() snapshot"""
+    for metric_name, metric in snapshot.items():
+        if metric_name.endswith(name):
+            for series in metric['series']:
+                if all(series['labels'].get(key) == value for key, value in labels.items()):
+                    return series['sum'], series['count']
+    return 0.0, 0
+
+
+def writer(workdir, args, shard_count, index, start, results):
+    """One writer process: queue readings of its own stations as fast as the queues take them"""
+    os.chdir(workdir)
+    os.environ['WEATHER_STATION_SHARDS'] = str(shard_count)
+    os.environ['WEATHER_STATION_WORKERS'] = str(args.writers)
+    import weather_station as station
+    station.create_app()
+    station.config.settings['csvMirror'] = False
+    if args.synchronous != 'NORMAL':
+        for shard in station.shards:
+            shard.db.connection().execute(f'PRAGMA synchronous = {args.synchronous}')
+    for shard in station.shards:
+        shard.ingest_queue.start()
+    for shard in station.shards:
+        shard.warmed.wait()
+
+    devices = range(index * args.stations + 1, (index + 1) * args.stations + 1)
+    ts = 1700000000
+    accepted = 0
+    start.wait()
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        ts += 3
+        for device_id in devices:
+            data = {
+                'device_id': device_id, 'ts': ts, 'datetime': station.format_timestamp(ts),
+                'temp_out_c': 20.0 + device_id % 7 * 0.1, 'humidity_out': 60, 'windspeed_kmh': 5.0,
+                'wind_direction': 180, 'barometric_pressure_rel_in': 29.9, 'total_rain_in': 1.0,
+            }
+            while not station.queue_weather_data(data):
+                time.sleep(0.001)
+            accepted += 1
+    for shard in station.shards:
+        shard.ingest_queue.stop(timeout=60)
+
+    snapshot = station.metrics.as_dict()
+    batch_sum, batch_count = histogram(snapshot, 'ingest_batch_seconds')
+    begin_sum, begin_count = histogram(snapshot, 'sqlite_statement_seconds', kind='begin')
+    results.put({'accepted': accepted, 'batch_s': batch_sum, 'batches': batch_count,
+                 'begin_s': begin_sum, 'begins': begin_count})
+
+
+def run_layout(args, shard_count):
+    workdir = tempfile.mkdtemp(prefix='weather-shards-')
+    try:
+        os.makedirs(os.path.join(workdir, 'data'))
+        with open(os.path.join(workdir, 'data', 'settings.json'), 'w') as file:
+            json.dump({'csvMirror': False}, file)
+        # What the gunicorn master does before forking the workers
+        prepare_storage(os.path.join(workdir, 'data', 'weather.db'), os.path.join(workdir, 'data', 'shards'),
+                        shard_count)
+
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=writer, args=(workdir, args, shard_count, index, start, results))
+                     for index in range(args.writers)]
+        for process in processes:
+            process.start()
+        time.sleep(2)  # imports and cache warm-up
+        started = time.perf_counter()
+        start.set()
+        reports = [results.get(timeout=args.duration + 120) for _ in processes]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+
+        stored = stored_readings(os.path.join(workdir, 'data'))
+        batches = sum(report['batches'] for report in reports)
+        return {
+            'shards': shard_count,
+            'accepted': sum(report['accepted'] for report in reports),
+            'stored': stored,
+            'elapsed_s': round(elapsed, 3),
+            'stored_per_s': round(stored / elapsed, 1),
+            'batch_ms_mean': round(sum(report['batch_s'] for report in reports) * 1000 / batches, 3) if batches else None,
+            'begin_ms_per_batch': round(sum(report['begin_s'] for report in reports) * 1000 / batches, 3)
+            if batches else None,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=3, help="writer processes (gunicorn workers)")
+    parser.add_argument('--shards', type=int, default=4, help="shard files compared with a single database")
+    parser.add_argument('--stations', type=int, default=12, help="stations per writer")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of ingest per layout")
+    parser.add_argument('--synchronous', choices=('NORMAL', 'FULL'), default='NORMAL',
+                        help="FULL syncs every commit, closer to an SD card under load")
+    parser.add_argument('--output', help="result file (default: benchmarks/results/shards-<time>-<rev>.json)")
+    args = parser.parse_args()
+
+    layouts = [run_layout(args, 0), run_layout(args, args.shards)]
+    results = {
+        'benchmark': 'shards',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {'writers': args.writers, 'stations_per_writer': args.stations, 'duration': args.duration,
+                   'synchronous': args.synchronous},
+        'layouts': layouts,
+    }
+    for layout in layouts:
+        print(f"shards={layout['shards']:<3} " + '  '.join(f"{key} {value}" for key, value in layout.items()
+                                                         if key != 'shards'))
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"shards-{stamp}-{results['revision'] or 'unknown'}.json")
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == '__main__':
+    main()
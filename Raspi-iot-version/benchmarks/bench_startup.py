@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark
+Measures what a service restart costs: the import time of weather_station
+(`python -X importtime`, with the heaviest imports listed) and the time
+from starting the server process until its first POST /post is accepted.
+Each run starts a fresh interpreter on a scratch data directory, optionally
+seeded with a copy of an existing database. Results are saved as JSON
+under benchmarks/results/; the exit status is 1 when the median time to
+the first accepted POST misses --target.
+
+Usage: python benchmarks/bench_startup.py [--server dev|waitress|async] [--runs 5]
+                                          [--db data/weather.db] [--target 2.0]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from bench_ingest import APP_DIR, RESULTS_DIR, free_port, git_revision
+
+
+def parse_importtime(stderr, module='weather_station'):
+    """(total seconds, [(name, cumulative seconds)] of the module's direct imports) from -X importtime output"""
+    total, children, pending = None, [], []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        try:
+            cumulative = int(cumulative) / 1e6
+        except ValueError:
+            continue  # header line
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            pending.append((name, cumulative))
+        elif depth == 0:
+            # A module's imports are listed before it
+            if name == module:
+                total, children = cumulative, pending
+            pending = []
+    return total, sorted(children, key=lambda item: -item[1])
+
+
+def measure_imports(workdir):
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import weather_station'],
+                               cwd=workdir, capture_output=True, text=True,
+                               env=dict(os.environ, PYTHONPATH=APP_DIR))
+    if completed.returncode != 0:
+        raise RuntimeError(f"import failed: {completed.stderr.strip().splitlines()[-1:]}")
+    return parse_importtime(completed.stderr)
+
+
+def prepare_workdir(args):
+    workdir = tempfile.mkdtemp(prefix='weather-startup-')
+    os.makedirs(os.path.join(workdir, 'data'))
+    if args.db:
+        shutil.copy(args.db, os.path.join(workdir, 'data', 'weather.db'))
+    return workdir
+
+
+def time_to_first_post(args, workdir, port):
+    """Seconds from spawning the server until POST /post answers 200"""
+    command = [sys.executable, os.path.join(APP_DIR, 'weather_station.py'), '--server', args.server,
+               '--host', '127.0.0.1', '--port', str(port)]
+    url = f"http://127.0.0.1:{port}/post"
+    form = {'id': '1', 'tempf': '68.0', 'humidity': '50', 'baromrelin': '29.92',
+            'dateutc': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with status {process.returncode}, see {workdir}/logs")
+            try:
+                if requests.post(url, data=form, timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError("server did not accept a reading within 60s")
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run(args):
+    import_totals, first_posts, heaviest = [], [], []
+    for _ in range(args.runs):
+        workdir = prepare_workdir(args)
+        try:
+            total, children = measure_imports(workdir)
+            import_totals.append(total)
+            heaviest = heaviest or children[:args.top]
+            first_posts.append(time_to_first_post(args, workdir, free_port()))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    median_first_post = statistics.median(first_posts)
+    return {
+        'benchmark': 'startup',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'server': args.server, 'runs': args.runs, 'db': args.db, 'target_s': args.target},
+        'import_s_median': round(statistics.median(import_totals), 4),
+        'import_s_min': round(min(import_totals), 4),
+        'heaviest_imports_s': {name: round(seconds, 4) for name, seconds in heaviest},
+        'first_post_s_median': round(median_first_post, 3),
+        'first_post_s_min': round(min(first_posts), 3),
+        'first_post_s_max': round(max(first_posts), 3),
+        'target_met': median_first_post <= args.target,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('dev', 'waitress', 'async'), default='waitress')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--db', help="database copied into every scratch directory (default: start empty)")
+    parser.add_argument('--top', type=int, default=8, help="heaviest imports listed")
+    parser.add_argument('--target', type=float, default=2.0,
+                        help="seconds to the first accepted POST (median); missing it exits with 1")
+    parser.add_argument('--output', help="result file (default: benchmarks/results/startup-<time>-<rev>.json)")
+    args = parser.parse_args()
+    if args.db:
+        args.db = os.path.abspath(args.db)
+
+    results = run(args)
+    for key, value in results.items():
+        if key not in ('config', 'platform'):
+            print(f"{key:<28} {value}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"startup-{stamp}-{results['revision'] or 'unknown'}.json")
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nSaved {output}")
+    sys.exit(0 if results['target_met'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark for /api/weather/stats
+Times the vectorized statistics on a year of synthetic readings, both as
+raw 3-second rows and as the minute rollup the endpoint reads for long
+spans, and the SQLite bulk load of raw rows and rollups for a shorter span
+
+Usage: python benchmarks/bench_stats.py [--days 365] [--load-days 7]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stats  # noqa: E402
+from rollups import RollupAggregator  # noqa: E402
+from schema import migrate  # noqa: E402
+
+INTERVAL = 3  # seconds between readings
+
+
+def synthetic_columns(days, interval=INTERVAL, seed=1):
+    """Columns shaped like stats.load_raw output with diurnal temperature curves"""
+    rng = np.random.default_rng(seed)
+    epoch = np.arange(0, days * 86400, interval, dtype=np.float64) + 1704067200
+    hours = (epoch % 86400) / 3600.0
+    temp = 26 + 5 * np.sin((hours - 9) / 24 * 2 * np.pi) + rng.normal(0, 0.5, epoch.size)
+    columns = {
+        'epoch': epoch,
+        'temp_out_c': temp,
+        'temp_in_c': temp - 1,
+        'humidity_out': np.clip(80 - 2 * (temp - 26) + rng.normal(0, 3, epoch.size), 10, 100),
+        'humidity_in': np.full(epoch.size, 60.0),
+        'barometric_pressure_rel_in': 29.8 + rng.normal(0, 0.05, epoch.size),
+        'windspeed_kmh': np.abs(rng.normal(8, 4, epoch.size)),
+        'wind_gust_kmh': np.abs(rng.normal(12, 5, epoch.size)),
+        'wind_direction': rng.uniform(0, 360, epoch.size),
+        'solar_radiation_wm2': np.clip(900 * np.sin((hours - 6) / 12 * np.pi), 0, None),
+        'uv_index': np.zeros(epoch.size),
+    }
+    return columns
+
+
+def timed(label, func, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<40} {best * 1000:10.1f} ms")
+    return result
+
+
+def populate(path, days):
+    """Create a database holding `days` of 3-second readings for device 1"""
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    columns = synthetic_columns(days)
+    aggregator = RollupAggregator()
+    fields = ('temp_out_c', 'temp_in_c', 'humidity_out', 'humidity_in', 'barometric_pressure_rel_in',
+              'windspeed_kmh', 'wind_gust_kmh', 'wind_direction', 'solar_radiation_wm2', 'uv_index')
+    stamps = np.datetime_as_string(columns['epoch'].astype('datetime64[s]'), unit='s')
+    batch = []
+    for i in range(columns['epoch'].size):
+        reading = {field: float(columns[field][i]) for field in fields}
+        reading['device_id'] = 1
+        reading['datetime'] = stamps[i].replace('T', ' ')
+        batch.append(reading)
+        if len(batch) == 10000 or i == columns['epoch'].size - 1:
+            rows, counters = aggregator.prepare(batch)
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO weather_data (device_id, datetime, {', '.join(fields)}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(fields))})",
+                    [(r['device_id'], r['datetime']) + tuple(r[f] for f in fields) for r in batch])
+                aggregator.apply(conn, rows)
+            aggregator.commit(counters)
+            batch = []
+    return conn, stamps[0].replace('T', ' '), stamps[-1].replace('T', ' ')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=365, help='days of data for the compute benchmark')
+    parser.add_argument('--load-days', type=int, default=7, help='days of data written to SQLite for the load benchmark')
+    args = parser.parse_args()
+
+    columns = synthetic_columns(args.days)
+    print(f"compute: {args.days} days, {columns['epoch'].size:,} raw readings")
+    timed('compute_stats (raw arrays)', lambda: stats.compute_stats(columns), repeat=1)
+    del columns
+
+    columns = synthetic_columns(args.days, interval=60)
+    print(f"compute: {args.days} days, {columns['epoch'].size:,} minute buckets")
+    timed('compute_stats (1m arrays)', lambda: stats.compute_stats(columns))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\nload: {args.load_days} days in SQLite (populating...)")
+        conn, start, end = populate(os.path.join(tmp, 'bench.db'), args.load_days)
+        raw = timed('load_raw', lambda: stats.load_raw(conn, 1, start, end))
+        print(f"{'':<40} {raw['epoch'].size:,} rows")
+        rollup = timed('load_rollup 1m', lambda: stats.load_rollup(conn, '1m', 1, start, end))
+        print(f"{'':<40} {rollup['epoch'].size:,} rows")
+        timed('compute_stats (1m rollup)', lambda: stats.compute_stats(rollup))
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
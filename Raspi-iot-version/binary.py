@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Compact binary reading format for low-bandwidth stations
+A message is a 5-byte header followed by fixed-size 51-byte records, all
+little-endian, sent as the body of POST /api/weather/binary or as one UDP
+datagram. Measurements are scaled integers, and a presence bitmask keeps
+a value that was not measured apart from a zero.
+
+Header:  magic 'WS' (2 bytes), version u8 (1), record count u16
+Record:  device_id u16 (0: the settings id), ts u32 (UTC epoch seconds,
+         0: the arrival time, for at most one record per device and
+         message), presence u32 (bit i set: FIELDS[i] is
+         present), then FIELDS in order, each as round(value * 10 **
+         decimals) in its type
+
+On the station a record is a packed C struct (uint16_t device_id;
+uint32_t ts; uint32_t presence; then one member per FIELDS entry).
+`encode` below is the reference encoder; a form reading of ~450 bytes
+becomes 51 bytes plus the 5-byte header per message.
+"""
+
+import socket
+import struct
+import threading
+
+from fields import format_timestamp
+
+MAGIC = b'WS'
+VERSION = 1
+
+# (column, struct code, decimals): stored value = packed integer / 10 ** decimals
+FIELDS = (
+    ('windspeed_kmh', 'H', 1),
+    ('wind_direction', 'H', 0),
+    ('rain_rate_in', 'H', 3),
+    ('temp_in_c', 'h', 1),
+    ('temp_out_c', 'h', 1),
+    ('humidity_in', 'B', 0),
+    ('humidity_out', 'B', 0),
+    ('uv_index', 'B', 1),
+    ('wind_gust_kmh', 'H', 1),
+    ('barometric_pressure_rel_in', 'H', 3),
+    ('barometric_pressure_abs_in', 'H', 3),
+    ('solar_radiation_wm2', 'H', 1),
+    ('daily_rain_in', 'H', 3),
+    ('rain_today_in', 'H', 3),
+    ('total_rain_in', 'I', 3),
+    ('weekly_rain_in', 'H', 3),
+    ('monthly_rain_in', 'H', 3),
+    ('yearly_rain_in', 'I', 3),
+    ('max_daily_gust', 'H', 1),
+    ('wh65_batt', 'H', 2),
+)
+
+HEADER = struct.Struct('<2sBH')
+RECORD = struct.Struct('<HII' + ''.join(code for _, code, _ in FIELDS))
+
+# Records that fit an unfragmented UDP datagram on Ethernet / Wi-Fi (1472-byte payload)
+MAX_DATAGRAM_RECORDS = (1472 - HEADER.size) // RECORD.size
+
+# (record index, column, divisor); a divisor of 1 keeps the value an int
+_DECODE = tuple((index + 3, column, 10 ** decimals) for index, (column, _, decimals) in enumerate(FIELDS))
+
+
+class BinaryFormatError(ValueError):
+    """The message is not a well-formed binary reading message"""
+
+
+def read_header(buffer):
+    """Record count of a message, after checking its header and that its length matches"""
+    if len(buffer) < HEADER.size:
+        raise BinaryFormatError(f"message of {len(buffer)} bytes is shorter than the header")
+    magic, version, count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise BinaryFormatError("not a binary reading message (bad magic)")
+    if version != VERSION:
+        raise BinaryFormatError(f"unsupported version {version}")
+    expected = HEADER.size + count * RECORD.size
+    if len(buffer) != expected:
+        raise BinaryFormatError(f"{count} records need {expected} bytes, got {len(buffer)}")
+    return count
+
+
+def decode(buffer, default_device, utc_offset_hours):
+    """Readings of a message, as dicts of the columns parse_form produces
+
+    `datetime` is station-local (UTC + utc_offset_hours) like readings
+    posted to /post; it is empty (and `ts` None) for records sent with
+    ts 0, which the caller stamps with the arrival time. A device_id of 0
+    stands for `default_device`. Two ts 0 records of one device would get
+    the same arrival second and be stored as one reading, so such a message
+    is refused (BinaryFormatError): a station without a clock sends one
+    reading per message.
+    """
+    expected = HEADER.size + read_header(buffer) * RECORD.size
+    offset_seconds = int(utc_offset_hours * 3600)
+    unpack_from = RECORD.unpack_from
+    readings = []
+    unstamped = set()
+    for offset in range(HEADER.size, expected, RECORD.size):
+        values = unpack_from(buffer, offset)
+        device_id, ts, presence = values[0], values[1], values[2]
+        data = {'device_id': device_id or default_device}
+        bit = 1
+        for index, column, divisor in _DECODE:
+            if presence & bit:
+                # Dividing by a power of ten gives the nearest float to the decimal value
+                data[column] = values[index] / divisor if divisor != 1 else values[index]
+            else:
+                data[column] = None
+            bit <<= 1
+        if ts:
+            data['ts'] = ts
+            data['datetime'] = format_timestamp(ts + offset_seconds)
+        else:
+            if data['device_id'] in unstamped:
+                raise BinaryFormatError(f"several records of device {data['device_id']} without ts; "
+                                        f"send them with their time or one per message")
+            unstamped.add(data['device_id'])
+            data['ts'], data['datetime'] = None, ''
+        readings.append(data)
+    return readings
+
+
+def encode(readings):
+    """Reference encoder: one message of readings (dicts with the weather_data column names)
+
+    `ts` is UTC epoch seconds (omitted or None: the server's arrival
+    time); a value of None or a missing key is sent as absent. Raises
+    ValueError when a value does not fit its field.
+    """
+    if len(readings) > 0xFFFF:
+        raise ValueError("at most 65535 records per message")
+    parts = [HEADER.pack(MAGIC, VERSION, len(readings))]
+    for data in readings:
+        presence, values = 0, []
+        for index, (column, _, decimals) in enumerate(FIELDS):
+            value = data.get(column)
+            if value is None:
+                values.append(0)
+            else:
+                presence |= 1 << index
+                values.append(int(round(value * 10 ** decimals)))
+        try:
+            parts.append(RECORD.pack(data.get('device_id') or 0, int(data.get('ts') or 0), presence, *values))
+        except struct.error as e:
+            raise ValueError(f"reading does not fit the binary format: {str(e)}")
+    return b''.join(parts)
+
+
+def encode_datagrams(readings):
+    """Messages of at most MAX_DATAGRAM_RECORDS readings each, for UDP"""
+    return [encode(readings[start:start + MAX_DATAGRAM_RECORDS])
+            for start in range(0, len(readings), MAX_DATAGRAM_RECORDS)]
+
+
+# UDP acknowledgement: magic, version, status, records accepted
+ACK = struct.Struct('<2sBBH')
+ACK_OK, ACK_BUSY, ACK_INVALID = 0, 1, 2
+
+
+class UDPListener:
+    """Receives binary messages as UDP datagrams and hands them to `handle`
+
+    `handle(buffer)` returns (status, accepted), which is sent back to the
+    sender as an ACK datagram so a station can resend what was not taken.
+    Only well-formed messages are answered: anything else is dropped
+    silently, so a datagram with a forged source address cannot turn the
+    listener into a reflector.
+    """
+
+    def __init__(self, host, port, handle, log=None):
+        self.host = host
+        self.port = port
+        self.handle = handle
+        self.log = log or (lambda message: None)
+        self._socket = None
+        self._thread = None
+        self.dropped = 0  # malformed datagrams, not answered
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)  # absorb bursts
+        self._socket.bind((self.host, self.port))
+        self.port = self._socket.getsockname()[1]  # the one picked for port 0
+        self._thread = threading.Thread(target=self._run, name='udp-ingest', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        buffer = bytearray(65535)
+        view = memoryview(buffer)
+        while True:
+            try:
+                size, address = self._socket.recvfrom_into(buffer)
+            except OSError:
+                return  # socket closed
+            datagram = view[:size]
+            try:
+                read_header(datagram)
+            except BinaryFormatError:
+                self.dropped += 1
+                continue
+            try:
+                status, accepted = self.handle(datagram)
+                self._socket.sendto(ACK.pack(MAGIC, VERSION, status, accepted), address)
+            except Exception as e:
+                self.log(f"UDP ingest from {address[0]} failed: {str(e)}")
+
+    def stop(self):
+        if self._socket is not None:
+            self._socket.close()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Streaming parsers for bulk reading uploads
+A request body (JSON array, NDJSON or the legacy CSV lines the ESP32
+buffers in /data.txt) is read in chunks and decoded record by record, so a
+day of backlog is never held in memory as one document
+"""
+
+import codecs
+import csv
+import itertools
+import json
+
+from schema import WEATHER_COLUMNS
+
+FORMATS = ('json', 'ndjson', 'csv')
+
+# Column order of the CSV mirror and of the ESP32's /data.txt (no device_id)
+CSV_COLUMNS = WEATHER_COLUMNS[1:]
+
+CONTENT_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonlines': 'ndjson',
+    'text/csv': 'csv',
+}
+
+
+class BulkFormatError(ValueError):
+    """The body is not a well-formed document of the expected format"""
+
+
+def format_for(mimetype):
+    """Bulk format for a request Content-Type, None when it has to be sniffed"""
+    return CONTENT_TYPES.get((mimetype or '').lower())
+
+
+def _lines(chunks):
+    """Decoded text lines of a byte chunk iterator, without line endings"""
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8').rstrip('\r')
+    if pending:
+        yield pending.decode('utf-8').rstrip('\r')
+
+
+def _ndjson_records(chunks):
+    for number, line in enumerate(_lines(chunks), 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as e:
+            yield number, None, f"invalid JSON: {str(e)}"
+
+
+def _csv_records(chunks, columns=CSV_COLUMNS):
+    """Rows in CSV_COLUMNS order; a header row (as written by /api/weather/export) overrides it"""
+    for number, row in enumerate(csv.reader(_lines(chunks)), 1):
+        if not row or not any(row):
+            continue
+        if number == 1 and row[0].strip() in WEATHER_COLUMNS + ('id',):
+            columns = [name.strip() for name in row]
+            continue
+        if len(row) > len(columns):
+            yield number, None, f"expected at most {len(columns)} values, got {len(row)}"
+            continue
+        yield number, dict(zip(columns, row)), None
+
+
+def _json_array_records(chunks):
+    """Elements of a top-level JSON array, decoded one at a time with raw_decode"""
+    decoder = json.JSONDecoder()
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+    buffer, pos, eof = '', 0, False
+    state = 'start'  # start -> value_or_end -> separator_or_end <-> value
+    number = 0
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = next(chunks, b'')
+        eof = not chunk
+        buffer = buffer[pos:] + decode(chunk, final=eof)
+        pos = 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise BulkFormatError("unexpected end of JSON array")
+            read_more()
+            continue
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise BulkFormatError("expected a JSON array")
+            pos += 1
+            state = 'value_or_end'
+            continue
+        if char == ']' and state in ('value_or_end', 'separator_or_end'):
+            return
+        if state == 'separator_or_end':
+            if char != ',':
+                raise BulkFormatError(f"expected ',' or ']' after element {number}")
+            pos += 1
+            state = 'value'
+            continue
+
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except ValueError as e:
+            if eof:
+                raise BulkFormatError(f"invalid JSON in element {number + 1}: {str(e)}")
+            read_more()
+            continue
+        if end == len(buffer) and not eof:
+            # A bare number could continue in the next chunk
+            read_more()
+            continue
+        number += 1
+        pos = end
+        state = 'separator_or_end'
+        yield number, record, None
+
+
+def iter_records(stream, fmt=None, chunk_size=65536):
+    """Yield (record number, record, error) for every record of a bulk body
+
+    `fmt` is one of FORMATS; when None it is sniffed from the first byte
+    ('[' JSON array, '{' NDJSON, anything else CSV). A record that cannot
+    be decoded is yielded with an error message; structural errors in a
+    JSON array raise BulkFormatError since nothing after them can be read.
+    """
+    chunks = iter(lambda: stream.read(chunk_size), b'')
+    if fmt is None:
+        first = next(chunks, b'')
+        head = first.lstrip()
+        fmt = 'json' if head[:1] == b'[' else 'ndjson' if head[:1] == b'{' else 'csv'
+        chunks = itertools.chain([first], chunks)
+
+    if fmt == 'json':
+        return _json_array_records(chunks)
+    if fmt == 'ndjson':
+        return _ndjson_records(chunks)
+    return _csv_records(chunks)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+SQLite access layer for the Weather Station
+Keeps one tuned connection per thread and recycles connections of
+short-lived request threads through a small idle pool
+"""
+
+import sqlite3
+import threading
+import time
+
+
+# Statement kinds reported separately, anything else counts as 'other'
+STATEMENT_KINDS = frozenset(('select', 'insert', 'update', 'delete', 'begin', 'pragma'))
+
+
+def _statement_kind(sql):
+    """'select', 'insert', ... of a statement, for timing labels"""
+    words = sql.split(None, 1)
+    kind = words[0].lower() if words else ''
+    return kind if kind in STATEMENT_KINDS else 'other'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor reporting the time of each execute call to the connection's observer"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.observe(_statement_kind(sql), time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.observe(_statement_kind(sql), time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection timing statements and commits through an `observe(kind, seconds)` callback
+
+    Timing covers executing a statement (for SELECT: up to the first row),
+    not fetching the rest of its rows.
+    """
+
+    observe = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self.observe('commit', time.perf_counter() - started)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # sqlite3's own __exit__ commits in C without going through commit()
+        # above, so `with conn:` transactions would not be timed
+        if exc_type is not None:
+            self.rollback()
+            return False
+        try:
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+        return False
+
+
+class Database:
+    """Pooled, thread-local SQLite connections
+
+    Each thread gets its own connection (SQLite connections must not be used
+    concurrently). Long-lived threads such as the ingest writer keep theirs;
+    request threads hand theirs back with `release()` so the next request
+    reuses it instead of paying connect + schema parsing again. Because the
+    connection survives, sqlite3's per-connection statement cache keeps the
+    INSERT and SELECT statements prepared between calls.
+    """
+
+    def __init__(self, path, cache_size_kb=8192, mmap_size=64 * 1024 * 1024,
+                 busy_timeout_ms=5000, max_idle=8, cached_statements=128, observe=None):
+        self.path = path
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_idle = max_idle
+        self.cached_statements = cached_statements
+        self.observe = observe  # observe(kind, seconds) for every statement, None to disable
+
+        self._local = threading.local()
+        self._idle = []
+        self._all = set()
+        self._lock = threading.Lock()
+        self._wal_checked = False
+
+    def _connect(self):
+        if self.observe is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False,
+                                   cached_statements=self.cached_statements,
+                                   factory=InstrumentedConnection)
+            conn.observe = self.observe
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        if not self._wal_checked:
+            if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+                # New file: free pages can be returned by incremental vacuum. This
+                # only takes effect before the first table exists, older databases
+                # are converted by a full VACUUM (see maintenance.py)
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            # journal_mode is persistent in the database file, set it once
+            conn.execute('PRAGMA journal_mode = WAL')
+            self._wal_checked = True
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = {-int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def connection(self):
+        """Return the calling thread's connection, reusing an idle one if possible"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+            with self._lock:
+                self._all.add(conn)
+
+        self._local.conn = conn
+        return conn
+
+    def release(self):
+        """Hand the calling thread's connection back to the idle pool"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self._all.discard(conn)
+        conn.close()
+
+    def execute(self, sql, params=()):
+        """Run a single statement on the calling thread's connection"""
+        return self.connection().execute(sql, params)
+
+    def query(self, sql, params=()):
+        """Run a SELECT and return name-addressable rows (sqlite3.Row)"""
+        cursor = self.connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        return cursor.execute(sql, params).fetchall()
+
+    def executemany(self, sql, rows):
+        """Run a statement for many rows in one transaction"""
+        conn = self.connection()
+        with conn:
+            return conn.executemany(sql, rows)
+
+    def close_all(self):
+        """Close every connection opened by this pool (used on shutdown)"""
+        with self._lock:
+            connections = list(self._all)
+            self._all.clear()
+            self._idle.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Streaming export of weather data
+Rows are pulled from an open cursor a page at a time and yielded as CSV or
+NDJSON chunks (optionally gzip-compressed), so memory use does not depend
+on the size of the export; archived readings can be streamed ahead of the
+database rows (ChainedCursor)
+"""
+
+import csv
+import io
+import json
+import zlib
+from itertools import chain, islice
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+class ChainedCursor:
+    """Rows of an iterable (e.g. archived readings) ahead of an executed cursor's, with its columns
+
+    Provides the part of the DB-API cursor iter_export uses.
+    """
+
+    def __init__(self, rows, cursor):
+        self.description = cursor.description
+        self._rows = chain(rows, cursor)
+
+    def fetchmany(self, size):
+        return list(islice(self._rows, size))
+
+
+def _csv_chunks(cursor, columns, page_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    while True:
+        rows = cursor.fetchmany(page_size)
+        if rows:
+            writer.writerows(rows)
+        chunk = buffer.getvalue()
+        if chunk:
+            yield chunk.encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if not rows:
+            return
+
+
+def _ndjson_chunks(cursor, columns, page_size):
+    while True:
+        rows = cursor.fetchmany(page_size)
+        if not rows:
+            return
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows).encode('utf-8')
+
+
+def _gzip(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(cursor, fmt='csv', compress=False, page_size=1000):
+    """Yield encoded export chunks for every row of an executed cursor"""
+    columns = [description[0] for description in cursor.description]
+    if fmt == 'ndjson':
+        chunks = _ndjson_chunks(cursor, columns, page_size)
+    else:
+        chunks = _csv_chunks(cursor, columns, page_size)
+    return _gzip(chunks) if compress else chunks
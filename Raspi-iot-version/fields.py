@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Declarative field mapping for incoming readings
+One table per input format lists (source keys, target column, type,
+conversion, default); the tables are compiled once into converter
+closures and a reading is parsed in a single pass with per-field errors.
+A field the station did not send is stored as NULL, not as a zero that
+would look like a measurement (0 °F would become -17.8 °C).
+"""
+
+import calendar
+import time
+from collections import namedtuple
+
+MPH_TO_KMH = 1.60934
+
+Field = namedtuple('Field', 'sources column type convert default')
+
+
+def f_to_c(value):
+    return (5.0 / 9.0) * (value - 32.0)
+
+
+def mph_to_kmh(value):
+    return value * MPH_TO_KMH
+
+
+def to_int(value):
+    """int() that also accepts '68.0' as sent by some firmware versions"""
+    return int(float(value))
+
+
+# Ambient-Weather style form posted to /post (imperial units)
+FORM_FIELDS = (
+    Field(('windspeedmph',), 'windspeed_kmh', float, mph_to_kmh, None),
+    Field(('winddir',), 'wind_direction', to_int, None, None),
+    Field(('rainratein',), 'rain_rate_in', float, None, None),
+    Field(('tempinf',), 'temp_in_c', float, f_to_c, None),
+    Field(('tempf',), 'temp_out_c', float, f_to_c, None),
+    Field(('humidityin',), 'humidity_in', to_int, None, None),
+    Field(('humidity',), 'humidity_out', to_int, None, None),
+    Field(('uv',), 'uv_index', float, None, None),
+    Field(('windgustmph',), 'wind_gust_kmh', float, mph_to_kmh, None),
+    Field(('baromrelin',), 'barometric_pressure_rel_in', float, None, None),
+    Field(('baromabsin',), 'barometric_pressure_abs_in', float, None, None),
+    Field(('solarradiation',), 'solar_radiation_wm2', float, None, None),
+    Field(('dailyrainin',), 'daily_rain_in', float, None, None),
+    Field(('raintodayin',), 'rain_today_in', float, None, None),
+    Field(('totalrainin',), 'total_rain_in', float, None, None),
+    Field(('weeklyrainin',), 'weekly_rain_in', float, None, None),
+    Field(('monthlyrainin',), 'monthly_rain_in', float, None, None),
+    Field(('yearlyrainin',), 'yearly_rain_in', float, None, None),
+    Field(('maxdailygust',), 'max_daily_gust', float, None, None),
+    Field(('wh65batt',), 'wh65_batt', float, None, None),
+)
+
+# JSON posted to /api/weather: column names, or the keys the ESP32 uploads (metric already)
+JSON_FIELDS = (
+    Field(('windspeed_kmh', 'windspeedkmh'), 'windspeed_kmh', float, None, None),
+    Field(('wind_direction', 'winddir'), 'wind_direction', to_int, None, None),
+    Field(('rain_rate_in', 'rain_rate'), 'rain_rate_in', float, None, None),
+    Field(('temp_in_c', 'temp_in'), 'temp_in_c', float, None, None),
+    Field(('temp_out_c', 'temp_out'), 'temp_out_c', float, None, None),
+    Field(('humidity_in', 'hum_in'), 'humidity_in', to_int, None, None),
+    Field(('humidity_out', 'hum_out'), 'humidity_out', to_int, None, None),
+    Field(('uv_index', 'uv'), 'uv_index', float, None, None),
+    Field(('wind_gust_kmh', 'wind_gust'), 'wind_gust_kmh', float, None, None),
+    Field(('barometric_pressure_rel_in', 'air_press_rel'), 'barometric_pressure_rel_in', float, None, None),
+    Field(('barometric_pressure_abs_in', 'air_press_abs'), 'barometric_pressure_abs_in', float, None, None),
+    Field(('solar_radiation_wm2', 'solar_radiation'), 'solar_radiation_wm2', float, None, None),
+    Field(('daily_rain_in', 'dailyrainin'), 'daily_rain_in', float, None, None),
+    Field(('rain_today_in', 'raintodayin'), 'rain_today_in', float, None, None),
+    Field(('total_rain_in', 'totalrainin'), 'total_rain_in', float, None, None),
+    Field(('weekly_rain_in', 'weeklyrainin'), 'weekly_rain_in', float, None, None),
+    Field(('monthly_rain_in', 'monthlyrainin'), 'monthly_rain_in', float, None, None),
+    Field(('yearly_rain_in', 'yearlyrainin'), 'yearly_rain_in', float, None, None),
+    Field(('max_daily_gust', 'maxdailygust'), 'max_daily_gust', float, None, None),
+    Field(('wh65_batt', 'wh65batt'), 'wh65_batt', float, None, None),
+)
+
+FORM_DEVICE_KEYS = ('id',)
+FORM_DATETIME_KEYS = ('dateutc',)
+JSON_DEVICE_KEYS = ('device_id', 'idws', 'id')
+JSON_DATETIME_KEYS = ('datetime', 'date')
+
+# A reading cannot be stored when one of these is malformed
+IDENTITY_KEYS = frozenset(FORM_DEVICE_KEYS + FORM_DATETIME_KEYS + JSON_DEVICE_KEYS + JSON_DATETIME_KEYS)
+
+
+def _compile(fields):
+    """Fuse type and unit conversion of each field into one callable"""
+    compiled = []
+    for field in fields:
+        cast, convert = field.type, field.convert
+        if convert is None:
+            converter = cast
+        else:
+            converter = (lambda cast, convert: lambda value: convert(cast(value)))(cast, convert)
+        compiled.append((field.sources, field.column, converter, field.default))
+    return tuple(compiled)
+
+
+COMPILED_FORM_FIELDS = _compile(FORM_FIELDS)
+COMPILED_JSON_FIELDS = _compile(JSON_FIELDS)
+
+
+def parse_timestamp(value):
+    """Epoch seconds of a 'YYYY-MM-DD HH:MM:SS' string read as UTC (no strptime)
+
+    Every field is range-checked: timegm would silently carry month 13 or
+    hour 99 into the next year or day.
+    """
+    if (len(value) != 19 or value[4] != '-' or value[7] != '-' or value[10] not in ' T'
+            or value[13] != ':' or value[16] != ':'):
+        raise ValueError(f"expected YYYY-MM-DD HH:MM:SS, got {value!r}")
+    digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19]
+    if not (digits.isascii() and digits.isdigit()):
+        raise ValueError(f"expected YYYY-MM-DD HH:MM:SS, got {value!r}")
+    year, month, day = int(value[0:4]), int(value[5:7]), int(value[8:10])
+    hour, minute, second = int(value[11:13]), int(value[14:16]), int(value[17:19])
+    if (not 1 <= month <= 12 or not 1 <= day <= calendar.monthrange(year, month)[1]
+            or hour > 23 or minute > 59 or second > 59):
+        raise ValueError(f"no such date or time: {value!r}")
+    return calendar.timegm((year, month, day, hour, minute, second))
+
+
+def format_timestamp(epoch):
+    """'YYYY-MM-DD HH:MM:SS' for epoch seconds (UTC calendar)"""
+    t = time.gmtime(epoch)
+    return '%04d-%02d-%02d %02d:%02d:%02d' % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def _first(source, keys):
+    for key in keys:
+        value = source.get(key)
+        if value is not None and value != '':
+            return key, value
+    return None, None
+
+
+def _flat(source):
+    """Plain dict view of a request form (MultiDict.get is several times slower than dict.get)"""
+    to_dict = getattr(source, 'to_dict', None)
+    return to_dict() if to_dict is not None else source
+
+
+def _parse(source, compiled, device_keys, default_device, errors):
+    data = {}
+    key, value = _first(source, device_keys)
+    try:
+        data['device_id'] = to_int(value) if key else default_device
+    except (TypeError, ValueError):
+        errors[key] = f"invalid device id {value!r}"
+        data['device_id'] = default_device
+
+    get = source.get
+    for sources, column, converter, default in compiled:
+        if len(sources) == 1:
+            key = sources[0]
+            value = get(key)
+            if value is None or value == '':
+                key = None
+        else:
+            key, value = _first(source, sources)
+        if key is None:
+            data[column] = default
+            continue
+        try:
+            data[column] = converter(value)
+        except (TypeError, ValueError):
+            errors[key] = f"invalid number {value!r}"
+            data[column] = None
+    return data
+
+
+def parse_form(form, default_device, utc_offset_hours):
+    """Parse an Ambient-Weather form (dateutc in UTC), returns (reading, errors)
+
+    The stored datetime is station-local (UTC + utc_offset_hours, as the
+    ESP32 firmware does); `ts` holds the true UTC epoch seconds.
+    """
+    errors = {}
+    form = _flat(form)
+    data = _parse(form, COMPILED_FORM_FIELDS, FORM_DEVICE_KEYS, default_device, errors)
+    key, value = _first(form, FORM_DATETIME_KEYS)
+    data['datetime'], data['ts'] = '', None
+    if key:
+        try:
+            data['ts'] = parse_timestamp(value)
+            data['datetime'] = format_timestamp(data['ts'] + int(utc_offset_hours * 3600))
+        except ValueError as e:
+            errors[key] = str(e)
+    return data, errors
+
+
+def parse_json(payload, default_device, utc_offset_hours):
+    """Parse a JSON reading (datetime already station-local), returns (reading, errors)
+
+    The datetime is stored in the canonical 'YYYY-MM-DD HH:MM:SS' form
+    (a 'T' separator becomes a space), so it sorts and deduplicates like
+    the other readings'.
+    """
+    errors = {}
+    data = _parse(payload, COMPILED_JSON_FIELDS, JSON_DEVICE_KEYS, default_device, errors)
+    key, value = _first(payload, JSON_DATETIME_KEYS)
+    data['datetime'], data['ts'] = '', None
+    if key:
+        try:
+            offset = int(utc_offset_hours * 3600)
+            data['ts'] = parse_timestamp(str(value)) - offset
+            data['datetime'] = format_timestamp(data['ts'] + offset)
+        except ValueError as e:
+            errors[key] = str(e)
+    return data, errors
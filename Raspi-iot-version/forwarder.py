@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Store-and-forward uplink for the Weather Station
+Readings are written to a durable outbox table in the ingest transaction;
+this forwarder sends them upstream in batches and deletes them only once
+the server acknowledged them, so it resumes where it stopped after a
+restart or network outage
+"""
+
+import json
+import random
+import threading
+
+# Reading columns -> keys the ESP32 firmware posts upstream (constructJsonData in src/main.cpp)
+UPLINK_KEYS = (
+    ('datetime', 'date'), ('windspeed_kmh', 'windspeedkmh'), ('wind_direction', 'winddir'),
+    ('rain_rate_in', 'rain_rate'), ('temp_in_c', 'temp_in'), ('temp_out_c', 'temp_out'),
+    ('humidity_in', 'hum_in'), ('humidity_out', 'hum_out'), ('uv_index', 'uv'),
+    ('wind_gust_kmh', 'wind_gust'), ('barometric_pressure_rel_in', 'air_press_rel'),
+    ('barometric_pressure_abs_in', 'air_press_abs'), ('solar_radiation_wm2', 'solar_radiation'),
+    ('daily_rain_in', 'dailyrainin'), ('rain_today_in', 'raintodayin'), ('total_rain_in', 'totalrainin'),
+    ('weekly_rain_in', 'weeklyrainin'), ('monthly_rain_in', 'monthlyrainin'),
+    ('yearly_rain_in', 'yearlyrainin'), ('max_daily_gust', 'maxdailygust'), ('wh65_batt', 'wh65batt'),
+)
+
+INSERT_OUTBOX_SQL = 'INSERT INTO outbox (payload) VALUES (?)'
+
+
+def uplink_payload(data):
+    """JSON text of a reading in the upstream (ESP32) format"""
+    payload = {'idws': data.get('device_id', 1)}
+    for column, key in UPLINK_KEYS:
+        payload[key] = data.get(column)
+    return json.dumps(payload, default=str)
+
+
+class Forwarder:
+    """Background sender draining the outbox table
+
+    `get_url` is called before every batch so a changed postUrl setting
+    takes effect without a restart. A batch of one reading is posted as a
+    bare JSON object (what the ESP32 sends), larger batches as an array.
+    """
+
+    def __init__(self, db, get_url, batch_size=50, timeout=10, backoff_base=1.0, backoff_max=300.0,
+                 idle_interval=30.0, log=None):
+        self.db = db
+        self.get_url = get_url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_interval = idle_interval
+        self.log = log or (lambda message: None)
+        self._session = None
+
+        self.failures = 0
+        self.sent = 0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def session(self):
+        """HTTP session, created on first use (requests is imported only when forwarding)"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Content-Type'] = 'application/json'
+            self._session = session
+        return self._session
+
+    def notify(self):
+        """Wake the sender after new rows were committed to the outbox"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='uplink-forwarder', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._session is not None:
+            self._session.close()
+
+    def backoff_delay(self):
+        """Exponential backoff for the current failure streak, jittered over its upper half"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** min(self.failures, 30)))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def send_pending(self):
+        """Send one batch from the outbox, returns the number of readings acknowledged"""
+        conn = self.db.connection()
+        rows = conn.execute('SELECT id, payload FROM outbox ORDER BY id LIMIT ?', (self.batch_size,)).fetchall()
+        if not rows:
+            return 0
+
+        if len(rows) == 1:
+            body = rows[0][1]
+        else:
+            body = '[' + ','.join(payload for _, payload in rows) + ']'
+
+        response = self.session.post(self.get_url(), data=body.encode('utf-8'), timeout=self.timeout)
+        response.raise_for_status()
+
+        with conn:
+            conn.execute('DELETE FROM outbox WHERE id <= ?', (rows[-1][0],))
+        self.sent += len(rows)
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Cleared before reading the outbox so a notify() during the send is not lost
+            self._wakeup.clear()
+            try:
+                sent = self.send_pending()
+            except Exception as e:
+                self.failures += 1
+                delay = self.backoff_delay()
+                if self.failures == 1 or self.failures % 10 == 0:
+                    self.log(f"Uplink failed ({self.failures}x), retrying in {delay:.0f}s: {str(e)}")
+                self._stop.wait(delay)
+                continue
+
+            if self.failures:
+                self.log(f"Uplink recovered after {self.failures} failed attempts")
+                self.failures = 0
+
+            if sent < self.batch_size:
+                # Outbox drained, sleep until the writer adds more
+                self._wakeup.wait(self.idle_interval)
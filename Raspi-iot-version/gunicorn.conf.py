@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+gunicorn settings for the Weather Station
+Started by `python weather_station.py --server gunicorn` (or run.sh), which
+passes bind address, workers and threads through the environment; can also
+be used directly: gunicorn -c gunicorn.conf.py 'weather_station:create_app()'
+"""
+
+import json
+import os
+
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+chdir = os.environ.get('WEATHER_STATION_DIR', pythonpath)  # where data/ and logs/ live
+bind = os.environ.get('WEATHER_STATION_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEATHER_STATION_WORKERS', '2'))
+threads = int(os.environ.get('WEATHER_STATION_THREADS', '8'))
+worker_class = 'gthread'  # SSE / long-poll clients hold a thread, not a whole worker
+timeout = 60
+graceful_timeout = 15  # time for workers to flush their ingest queues
+
+
+def on_starting(server):
+    """Migrate the schema once in the master, before workers open the database files
+
+    weather_station itself is not imported here: workers must import it
+    fresh after the fork, with their own connections and threads.
+    """
+    os.environ['WEATHER_STATION_WORKERS'] = str(server.cfg.workers)
+    os.makedirs('data', exist_ok=True)
+    os.makedirs('logs', exist_ok=True)
+
+    # Config.owner_lock_file; held by a single-process server (e.g. --server async) on this directory
+    from workers import OwnerLock
+    owner_lock = OwnerLock('data/.owner.lock')
+    if not owner_lock.try_acquire():
+        raise SystemExit(f"Another Weather Station server (pid {owner_lock.holder()}) runs on this data directory")
+    owner_lock.release()  # the workers elect the owner among themselves
+
+    # Config.settings_file; the migrations backfill from the station's UTC offset (utc_offset_hours)
+    utc_offset = 7
+    try:
+        with open('data/settings.json') as file:
+            utc_offset = float(json.load(file).get('timezoneOffset', 7))
+    except (OSError, ValueError):
+        pass
+
+    # Config.db_file, Config.shard_dir; also moves stations when the shard layout changed
+    from shards import prepare_storage
+    prepare_storage('data/weather.db', 'data/shards', int(os.environ.get('WEATHER_STATION_SHARDS', '0')),
+                    log=server.log.info, utc_offset_hours=utc_offset)
+
+
+def post_worker_init(worker):
+    import weather_station
+    weather_station.start_worker()
+
+
+def worker_exit(server, worker):
+    import weather_station
+    weather_station.shutdown_ingest()
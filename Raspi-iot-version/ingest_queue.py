@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Write-behind ingest queue for the Weather Station
+Readings are acknowledged as soon as they are queued and a background
+writer thread stores them in batches (one transaction per batch). A batch
+that cannot be stored is retried, then kept in a spill file and stored
+once writes succeed again, so an acknowledged reading is not dropped.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process writes the spill file
+    fcntl = None
+
+
+def _lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingest queue is at capacity and the client should retry later"""
+
+
+class IngestQueue:
+    """Bounded queue drained by a single writer thread
+
+    `write_batch` is called with a list of readings from the writer thread
+    whenever `batch_size` readings are waiting or `flush_interval` seconds
+    have passed since the first reading of the batch was queued.
+    `on_start`, if given, runs once in the writer before its first batch
+    (e.g. loading state the writes depend on) while readings already queue.
+
+    A failing batch is tried `retries` more times, `retry_backoff` seconds
+    apart, doubling; the writer holds the next batches meanwhile, so the
+    queue fills up and clients get backpressure. A batch that still fails
+    goes to `on_error(error, batch)` and is appended to `spill_file` (one
+    JSON reading per line), which is written again after the next stored
+    batch and on start.
+    """
+
+    _STOP = object()
+
+    def __init__(self, write_batch, max_depth=1000, batch_size=100, flush_interval=1.0, on_error=None,
+                 on_start=None, name='ingest-writer', retries=3, retry_backoff=0.5, spill_file=None, log=None):
+        self.write_batch = write_batch
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.on_start = on_start
+        self.name = name  # of the writer thread
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.spill_file = spill_file
+        self.log = log or (lambda message: None)
+
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    @property
+    def depth(self):
+        """Number of readings waiting to be written"""
+        return self._queue.qsize()
+
+    def start(self):
+        """Start the background writer thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def put(self, reading):
+        """Queue a reading without blocking; raise IngestQueueFull on backpressure"""
+        if self._stopped:
+            raise IngestQueueFull("Ingest queue is shutting down")
+        try:
+            self._queue.put_nowait(reading)
+        except queue.Full:
+            raise IngestQueueFull(f"Ingest queue is full ({self.max_depth} readings pending)")
+
+    def stop(self, timeout=10.0):
+        """Flush everything still queued and stop the writer thread"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            thread = self._thread
+
+        if thread is None or not thread.is_alive():
+            # Writer never ran, drain synchronously so nothing is lost
+            self._starting()
+            self._write(self._drain_nowait())
+            return
+
+        # The sentinel must get in even when the queue is full
+        self._queue.put(self._STOP)
+        thread.join(timeout)
+
+    def _drain_nowait(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if item is not self._STOP:
+                batch.append(item)
+
+    def _store(self, batch):
+        """write_batch with retries, returns the last error or None once stored"""
+        delay = self.retry_backoff
+        for attempt in range(self.retries + 1):
+            try:
+                self.write_batch(batch)
+                return None
+            except Exception as e:
+                error = e
+            if attempt < self.retries:
+                time.sleep(delay)
+                delay *= 2
+        return error
+
+    def _write(self, batch):
+        if not batch:
+            return
+        error = self._store(batch)
+        if error is None:
+            self._replay_spill()
+            return
+        if self.on_error:
+            self.on_error(error, batch)
+        self._spill(batch)
+
+    # Spill file; worker processes share it, each access holds an exclusive lock on it
+
+    def _spill(self, batch):
+        if not self.spill_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.spill_file) or '.', exist_ok=True)
+            with open(self.spill_file, 'a', encoding='utf-8') as f:
+                _lock(f)
+                f.writelines(json.dumps(reading, default=str) + '\n' for reading in batch)
+            self.log(f"Kept {len(batch)} readings in {self.spill_file}, stored once writes succeed")
+        except OSError as e:
+            self.log(f"Could not keep {len(batch)} readings in {self.spill_file}, they are lost: {e}")
+
+    def _replay_spill(self):
+        """Store the readings of the spill file in batches; what fails stays in the file"""
+        try:
+            if not self.spill_file or os.path.getsize(self.spill_file) == 0:
+                return
+        except OSError:
+            return
+        with open(self.spill_file, 'r+', encoding='utf-8') as f:
+            _lock(f)
+            readings = []
+            for line in f:
+                try:
+                    readings.append(json.loads(line))
+                except ValueError:
+                    continue  # a line cut short by a crash while spilling
+            stored = 0
+            while stored < len(readings):
+                batch = readings[stored:stored + self.batch_size]
+                try:
+                    self.write_batch(batch)
+                except Exception as e:
+                    self.log(f"Spilled readings still cannot be stored: {e}")
+                    break
+                stored += len(batch)
+            # Emptied rather than removed: a writer waiting for the lock holds this file open
+            f.seek(0)
+            f.truncate()
+            f.writelines(json.dumps(reading, default=str) + '\n' for reading in readings[stored:])
+        if stored:
+            self.log(f"Stored {stored} readings from {self.spill_file}")
+
+    def _starting(self):
+        on_start, self.on_start = self.on_start, None
+        if on_start is not None:
+            on_start()
+        self._replay_spill()
+
+    def _run(self):
+        self._starting()
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._write(self._drain_nowait())
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            if stopping:
+                batch.extend(self._drain_nowait())
+                self._write(batch)
+                return
+
+            self._write(batch)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Per-device latest reading cache for the Weather Station
+The newest reading of every device is kept in memory, warmed from the
+database at startup and updated by the ingest path, so the read APIs
+(/api/weather/latest, /api/devices, the dashboard) never query for it
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from schema import WEATHER_COLUMNS
+
+# Keys of a cached reading: the stored columns plus the UTC epoch
+LATEST_COLUMNS = WEATHER_COLUMNS + ('ts',)
+
+
+class _DeviceState:
+    __slots__ = ('reading', 'stamps')
+
+    def __init__(self, rate_window):
+        self.reading = None
+        self.stamps = deque(maxlen=rate_window)  # epochs of the newest readings, ascending
+
+
+class LatestReadings:
+    """Newest reading and recent reading times per device_id
+
+    Cached readings are plain dicts keyed like the weather_data columns;
+    an update replaces a device's dict instead of changing it, so readers
+    can use what they got without copying. Updates are idempotent (a
+    reading older than the cached one is ignored), which lets the database
+    tail feed the same readings again in multi-worker mode.
+    """
+
+    def __init__(self, rate_window=20, low_battery_volts=2.5):
+        self.rate_window = rate_window  # readings the reading rate is computed over
+        self.low_battery_volts = low_battery_volts
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def warm(self, conn):
+        """Load the newest reading and recent timestamps of every device stored in `conn`
+
+        Devices loaded before are kept, so each shard's database can be loaded in turn.
+        """
+        devices = {}
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        for row in cursor.execute('''
+            SELECT w.* FROM latest_reading l
+            JOIN weather_data w ON w.id = l.reading_id
+        ''').fetchall():
+            data = dict(row)
+            state = devices[data['device_id']] = _DeviceState(self.rate_window)
+            state.reading = {column: data.get(column) for column in LATEST_COLUMNS}
+            stamps = conn.execute(
+                'SELECT ts FROM weather_data WHERE device_id = ? AND ts IS NOT NULL '
+                'ORDER BY datetime DESC LIMIT ?',
+                (data['device_id'], self.rate_window)
+            ).fetchall()
+            state.stamps.extend(sorted(stamp for (stamp,) in stamps))
+        with self._lock:
+            self._devices.update(devices)
+        return len(devices)
+
+    def update(self, readings):
+        """Take stored readings (dicts as produced by the parsers) into the cache"""
+        with self._lock:
+            for data in readings:
+                device_id = data.get('device_id', 1)
+                state = self._devices.get(device_id)
+                if state is None:
+                    state = self._devices[device_id] = _DeviceState(self.rate_window)
+                current = state.reading
+                if current is not None and str(data.get('datetime', '')) < str(current['datetime']):
+                    continue  # replayed backlog, older than what is cached
+                ts = data.get('ts')
+                if ts is not None and (not state.stamps or ts > state.stamps[-1]):
+                    state.stamps.append(ts)
+                state.reading = {column: data.get(column) for column in LATEST_COLUMNS}
+
+    def get(self, device_id):
+        """Newest reading of a device, None if it never reported"""
+        state = self._devices.get(device_id)
+        return state.reading if state is not None else None
+
+    def latest(self):
+        """Newest reading across all devices, None without any"""
+        readings = [state.reading for state in list(self._devices.values()) if state.reading is not None]
+        if not readings:
+            return None
+        return max(readings, key=lambda data: (data['ts'] is not None, data['ts'] or 0))
+
+    def devices(self, now=None):
+        """Summary per device: last reading time, age, reading rate and battery state"""
+        now = time.time() if now is None else now
+        with self._lock:
+            states = [(device_id, state.reading, tuple(state.stamps))
+                      for device_id, state in self._devices.items()]
+        summaries = []
+        for device_id, reading, stamps in sorted(states, key=lambda item: item[0]):
+            span = stamps[-1] - stamps[0] if len(stamps) > 1 else 0
+            battery = reading.get('wh65_batt')
+            if battery is None:
+                battery_low = None
+            elif battery in (0, 1):
+                battery_low = battery == 1  # gateways reporting a flag: 0 good, 1 low
+            else:
+                battery_low = battery < self.low_battery_volts  # gateways reporting the voltage
+            summaries.append({
+                "device_id": device_id,
+                "last_seen": reading['datetime'],
+                "last_seen_ts": reading['ts'],
+                "seconds_since": round(now - reading['ts'], 1) if reading['ts'] is not None else None,
+                "readings_per_min": round((len(stamps) - 1) * 60 / span, 2) if span > 0 else None,
+                "wh65_batt": battery,
+                "battery_low": battery_low
+            })
+        return summaries
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Live reading feed for the Weather Station
+Ingested readings are fanned out to subscribers (SSE / WebSocket clients),
+each with its own bounded queue and optional device filter
+"""
+
+import asyncio
+import queue
+import threading
+
+
+class Subscriber:
+    """One client's view of the feed"""
+
+    __slots__ = ('devices', 'queue', 'dropped')
+
+    def __init__(self, devices, maxsize):
+        self.devices = devices
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def wants(self, device_id):
+        return self.devices is None or device_id in self.devices
+
+    def get(self, timeout=None):
+        """Next message, or None on timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _LoopQueue:
+    """Bounded hand-over from publishing threads to an asyncio.Queue on an event loop
+
+    put_nowait() runs in the publisher's thread: it counts pending messages
+    itself (asyncio.Queue is not thread-safe) and schedules the actual put
+    on the loop.
+    """
+
+    __slots__ = ('loop', 'maxsize', 'pending', 'items', '_lock')
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.pending = 0
+        self.items = asyncio.Queue()
+        self._lock = threading.Lock()
+
+    def put_nowait(self, message):
+        with self._lock:
+            if self.pending >= self.maxsize:
+                raise queue.Full
+            self.pending += 1
+        self.loop.call_soon_threadsafe(self.items.put_nowait, message)
+
+    async def get(self):
+        message = await self.items.get()
+        with self._lock:
+            self.pending -= 1
+        return message
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber read from an asyncio event loop (async_server.py)"""
+
+    __slots__ = ()
+
+    def __init__(self, devices, maxsize, loop):
+        self.devices = devices
+        self.queue = _LoopQueue(loop, maxsize)
+        self.dropped = False
+
+    async def get(self, timeout=None):
+        """Next message, or None on timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LiveFeed:
+    """Publish/subscribe hub; subscribers that fall behind are dropped, never waited on"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, devices=None, loop=None):
+        """Register a subscriber for the given device ids (None for all devices)
+
+        With an event loop the subscriber's get() is a coroutine on that loop.
+        """
+        devices = frozenset(devices) if devices else None
+        if loop is None:
+            subscriber = Subscriber(devices, self.queue_size)
+        else:
+            subscriber = AsyncSubscriber(devices, self.queue_size, loop)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, device_id, message):
+        """Offer a message to every interested subscriber without blocking"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        slow = []
+        for subscriber in subscribers:
+            if not subscriber.wants(device_id):
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                subscriber.dropped = True
+                slow.append(subscriber)
+        if slow:
+            with self._lock:
+                self._subscribers.difference_update(slow)
+        return len(slow)
+
+
+class StreamSlots:
+    """Limit on open streams (SSE / WebSocket), each of which holds a request thread
+
+    A threaded server has a fixed number of request threads; streams never
+    end, so without a limit a few dashboard tabs would take all of them and
+    stations' posts would wait.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot, returns False when all are in use"""
+        with self._lock:
+            if self.open >= self.limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
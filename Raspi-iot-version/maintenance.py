@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Database and file maintenance for the Weather Station
+Retention per resolution (raw readings, each rollup table and the quality
+control quarantine), deleted in small transactions so ingest never waits
+long for the write lock; incremental VACUUM and ANALYZE, meant for quiet
+ingest periods; rotation and gzip compression of the legacy CSV file and
+the log file. Every run reports what it deleted, the bytes it reclaimed
+and how long it took.
+"""
+
+import glob
+import gzip
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from rollups import RESOLUTIONS
+
+# Resolution names of retention_days -> table
+RETENTION_TABLES = {'raw': 'weather_data', 'quarantine': 'quarantine'}
+RETENTION_TABLES.update({name: table for name, (table, _, _, _) in RESOLUTIONS.items()})
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _gzip_file(source, target):
+    """Compress source into target, returns the bytes saved"""
+    with open(source, 'rb') as src, gzip.open(target + '.tmp', 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(target + '.tmp', target)
+    return _file_size(source) - _file_size(target)
+
+
+class IngestRate:
+    """Readings per minute now and on average, to find quiet periods for heavy maintenance
+
+    `sample(total)` is fed a monotonically growing count of stored readings
+    (e.g. MAX(id) of weather_data) about once a minute. The average is an
+    exponential moving average over roughly `average_minutes`.
+    """
+
+    def __init__(self, average_minutes=360):
+        self.alpha = 1.0 / average_minutes
+        self.current = None
+        self.average = None
+        self._last = None
+
+    def sample(self, total, now=None):
+        now = time.monotonic() if now is None else now
+        if self._last is not None:
+            last_total, last_time = self._last
+            if now > last_time:
+                self.current = max(0, total - last_total) * 60.0 / (now - last_time)
+                if self.average is None:
+                    self.average = self.current
+                else:
+                    self.average += self.alpha * (self.current - self.average)
+        self._last = (total, now)
+
+    def quiet(self, fraction):
+        """Whether ingest is below `fraction` of its average (or nothing arrives at all)"""
+        if self.current is None:
+            return False
+        return self.current == 0 or self.current <= fraction * self.average
+
+
+class Maintenance:
+    """One maintenance pass over the database and the data / log files
+
+    `write_lock` is the lock the ingest writer holds per batch; it is taken
+    per chunk, so readings keep flowing between chunks. `csv_lock` is the one
+    the CSV appends hold (shared by all shards), the CSV is moved aside under
+    it; without one, `write_lock` is used.
+
+    The log file is rotated by renaming it: the log handlers must reopen the
+    file once it is moved (logging.handlers.WatchedFileHandler), so no line
+    is lost between the rename and the reopen.
+    """
+
+    def __init__(self, db, write_lock, retention_days, db_file, csv_file, log_file,
+                 chunk_size=2000, vacuum_pages=2000, csv_rotate_bytes=16 * 1024 * 1024,
+                 log_rotate_bytes=8 * 1024 * 1024, rotated_keep=30, compress_after=60, csv_lock=None):
+        self.db = db
+        self.write_lock = write_lock
+        self.csv_lock = csv_lock or write_lock
+        self.retention_days = retention_days
+        self.db_file = db_file
+        self.csv_file = csv_file
+        self.log_file = log_file
+        self.chunk_size = chunk_size
+        self.vacuum_pages = vacuum_pages
+        self.csv_rotate_bytes = csv_rotate_bytes
+        self.log_rotate_bytes = log_rotate_bytes
+        self.rotated_keep = rotated_keep
+        self.compress_after = compress_after  # seconds a rotated file rests before it is compressed
+        self.last_report = None
+
+    # Retention
+
+    def _devices(self, conn, table):
+        if table == 'weather_data':
+            return [row[0] for row in conn.execute('SELECT device_id FROM latest_reading')]
+        return [row[0] for row in conn.execute(f'SELECT DISTINCT device_id FROM {table}')]
+
+    def _delete_chunk(self, conn, table, device_id, cutoff):
+        if table == 'weather_data':
+            # A device's latest reading stays even when it is past retention
+            sql = '''
+                DELETE FROM weather_data WHERE id IN (
+                    SELECT id FROM weather_data
+                    WHERE device_id = ? AND datetime < ?
+                      AND id NOT IN (SELECT reading_id FROM latest_reading)
+                    LIMIT ?
+                )
+            '''
+        elif table == 'quarantine':
+            sql = '''
+                DELETE FROM quarantine WHERE id IN (
+                    SELECT id FROM quarantine WHERE device_id = ? AND datetime < ? LIMIT ?
+                )
+            '''
+        else:
+            sql = f'''
+                DELETE FROM {table} WHERE (device_id, bucket) IN (
+                    SELECT device_id, bucket FROM {table} WHERE device_id = ? AND bucket < ? LIMIT ?
+                )
+            '''
+        with self.write_lock:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                return conn.execute(sql, (device_id, cutoff, self.chunk_size)).rowcount
+
+    def apply_retention(self, conn, now=None):
+        """Delete rows past their resolution's retention, returns deleted rows per resolution"""
+        now = now or datetime.now()
+        deleted = {}
+        for name, days in self.retention_days.items():
+            table = RETENTION_TABLES.get(name)
+            if table is None or days is None:
+                continue
+            cutoff = (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+            count = 0
+            for device_id in self._devices(conn, table):
+                while True:
+                    removed = self._delete_chunk(conn, table, device_id, cutoff)
+                    count += removed
+                    if removed < self.chunk_size:
+                        break
+                    time.sleep(0)  # let the ingest writer take the lock between chunks
+            deleted[name] = count
+        return deleted
+
+    # Vacuum
+
+    def vacuum(self, conn, convert=False):
+        """Return free pages to the file system, then refresh planner statistics
+
+        With auto_vacuum=INCREMENTAL the free pages are released a chunk at a
+        time. A database created without it (auto_vacuum=NONE) is only
+        converted, by one full VACUUM, when `convert` is set. Returns the
+        vacuum mode used.
+        """
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        mode = 'none'
+        if auto_vacuum == 2:
+            mode = 'incremental'
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            while free:
+                with self.write_lock:
+                    # executescript steps the pragma to completion, execute() frees a single page
+                    conn.executescript(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})')
+                remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if remaining >= free:
+                    break
+                free = remaining
+        elif convert and conn.execute('PRAGMA freelist_count').fetchone()[0]:
+            mode = 'full'
+            with self.write_lock:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+        with self.write_lock:
+            conn.execute('PRAGMA analysis_limit = 1000')  # approximate statistics, bounded work
+            conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return mode
+
+    # Files
+
+    def rotate_csv(self, now=None):
+        """Move a full CSV aside and compress rotated ones that rested long enough, returns bytes saved"""
+        if _file_size(self.csv_file) >= self.csv_rotate_bytes:
+            with self.csv_lock:
+                # Appends open the file per batch, the next one starts a new file
+                self._move_aside(self.csv_file, now)
+        return self._compress_rotated(self.csv_file)
+
+    def rotate_log(self, now=None):
+        """Move a full log file aside (the handlers reopen it) and compress rested ones, returns bytes saved"""
+        if _file_size(self.log_file) >= self.log_rotate_bytes:
+            self._move_aside(self.log_file, now)
+        return self._compress_rotated(self.log_file)
+
+    def _move_aside(self, path, now=None):
+        base, ext = os.path.splitext(path)
+        stamp = (now or datetime.now()).strftime('%Y%m%d-%H%M%S')
+        target, number = f"{base}-{stamp}{ext}", 1
+        while os.path.exists(target) or os.path.exists(target + '.gz'):  # rotated twice within a second
+            target, number = f"{base}-{stamp}.{number}{ext}", number + 1
+        os.replace(path, target)
+
+    def _compress_rotated(self, path):
+        """Compress the rotated copies of path that rested long enough (a late write may still land), prune"""
+        base, ext = os.path.splitext(path)
+        saved = 0
+        for rotated in sorted(glob.glob(f"{glob.escape(base)}-*{ext}")):
+            if time.time() - os.path.getmtime(rotated) >= self.compress_after:
+                saved += _gzip_file(rotated, rotated + '.gz')
+                os.remove(rotated)
+        self._prune(f"{glob.escape(base)}-*{ext}.gz")
+        return saved
+
+    def _prune(self, pattern):
+        for path in sorted(glob.glob(pattern))[:-self.rotated_keep or None]:
+            os.remove(path)
+
+    # Pass
+
+    def database_bytes(self):
+        return _file_size(self.db_file) + _file_size(self.db_file + '-wal')
+
+    def run(self, vacuum=True, convert=False, now=None, files=True):
+        """Retention and file rotation (unless `files` is false), plus vacuum / ANALYZE when asked; returns a report"""
+        started = time.monotonic()
+        conn = self.db.connection()
+        size_before = self.database_bytes()
+        report = {'started': (now or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')}
+
+        report['deleted'] = self.apply_retention(conn, now)
+        report['vacuum'] = self.vacuum(conn, convert) if vacuum else 'skipped'
+        report['free_pages'] = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        reclaimed = {
+            'database': max(0, size_before - self.database_bytes()),
+            'csv': self.rotate_csv(now) if files else 0,
+            'log': self.rotate_log(now) if files else 0,
+        }
+        reclaimed['total'] = sum(reclaimed.values())
+        report['reclaimed_bytes'] = reclaimed
+        report['duration_s'] = round(time.monotonic() - started, 3)
+        self.last_report = report
+        return report
+
+
+def combine_reports(reports):
+    """One report for the passes over several database files (shards): counts and bytes summed"""
+    if len(reports) == 1:
+        return reports[0]
+    deleted, reclaimed = {}, {}
+    for report in reports:
+        for name, count in report['deleted'].items():
+            deleted[name] = deleted.get(name, 0) + count
+        for name, count in report['reclaimed_bytes'].items():
+            reclaimed[name] = reclaimed.get(name, 0) + count
+    return {
+        'started': reports[0]['started'],
+        'shards': len(reports),
+        'deleted': deleted,
+        'vacuum': ', '.join(sorted({report['vacuum'] for report in reports})),
+        'free_pages': sum(report['free_pages'] for report in reports),
+        'reclaimed_bytes': reclaimed,
+        'duration_s': round(sum(report['duration_s'] for report in reports), 3),
+    }
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+In-process metrics for the Weather Station
+Counters, gauges and fixed-bucket latency histograms, cheap enough for the
+ingest hot path (a lock and a bisect per observation), exported in the
+Prometheus text format and as JSON
+"""
+
+import bisect
+import math
+import threading
+import time
+
+# Latency buckets in seconds, 100 us .. 10 s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and math.isnan(value):
+        return 'NaN'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'func')
+
+    def __init__(self):
+        self.value = 0
+        self.func = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, func):
+        """Read the value from func() at export time"""
+        self.func = func
+
+    def get(self):
+        if self.func is None:
+            return self.value
+        try:
+            return self.func()
+        except Exception:
+            return math.nan
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    def cumulative(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        running, buckets = 0, []
+        for bound, bucket_count in zip(self.bounds + (math.inf,), counts):
+            running += bucket_count
+            buckets.append((bound, running))
+        return buckets, total, count
+
+    def quantile(self, fraction):
+        """Upper bucket bound containing the given quantile (None without observations)"""
+        buckets, _, count = self.cumulative()
+        if not count:
+            return None
+        rank = fraction * count
+        for bound, running in buckets:
+            if running >= rank:
+                return bound
+        return math.inf
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Metric:
+    """A metric family; with label names, `labels(...)` returns the child for those values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), **options):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.options = options
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def children(self):
+        return list(self._children.items())
+
+
+class Counter(Metric):
+    """Monotonic count; by convention the name ends in _total"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, func):
+        self._default.set_function(func)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def _new_child(self):
+        return _HistogramChild(tuple(self.options.get('buckets') or DEFAULT_BUCKETS))
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class Registry:
+    """Named metric families of this process"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._metrics = {}
+
+    def _register(self, cls, name, documentation, labelnames, **options):
+        metric = cls(self.prefix + name, documentation, labelnames, **options)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_prometheus(self):
+        """Exposition in the Prometheus text format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for values, child in sorted(metric.children(), key=lambda item: item[0]):
+                if metric.kind == 'counter':
+                    lines.append(f"{metric.name}{_format_labels(metric.labelnames, values)} "
+                                 f"{_format_value(child.value)}")
+                elif metric.kind == 'gauge':
+                    lines.append(f"{metric.name}{_format_labels(metric.labelnames, values)} "
+                                 f"{_format_value(child.get())}")
+                else:
+                    buckets, total, count = child.cumulative()
+                    for bound, running in buckets:
+                        le = f'le="{_format_value(float(bound))}"'
+                        lines.append(f"{metric.name}_bucket{_format_labels(metric.labelnames, values, le)} {running}")
+                    labels = _format_labels(metric.labelnames, values)
+                    lines.append(f"{metric.name}_sum{labels} {_format_value(total)}")
+                    lines.append(f"{metric.name}_count{labels} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def as_dict(self):
+        """JSON-friendly snapshot; histograms report count, sum, mean and p50/p95/p99 bucket bounds"""
+        snapshot = {}
+        for metric in self._metrics.values():
+            series = []
+            for values, child in sorted(metric.children(), key=lambda item: item[0]):
+                entry = {'labels': dict(zip(metric.labelnames, values))}
+                if metric.kind == 'counter':
+                    entry['value'] = child.value
+                elif metric.kind == 'gauge':
+                    value = child.get()
+                    entry['value'] = None if isinstance(value, float) and math.isnan(value) else value
+                else:
+                    _, total, count = child.cumulative()
+                    entry.update(count=count, sum=total, mean=total / count if count else None)
+                    for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                        bound = child.quantile(fraction)
+                        entry[label] = None if bound is None or bound == math.inf else bound
+                series.append(entry)
+            snapshot[metric.name] = {'type': metric.kind, 'help': metric.documentation, 'series': series}
+        return snapshot
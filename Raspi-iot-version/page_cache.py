@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Caches for the dashboard page
+The data directory listing and the rendered page are kept between requests
+and rebuilt only when what they show has changed
+"""
+
+import hashlib
+import os
+import time
+from collections import namedtuple
+
+FileEntry = namedtuple('FileEntry', 'name size mtime')
+CachedPage = namedtuple('CachedPage', 'key body etag last_modified')
+
+# Files SQLite keeps next to a database; deleting the -wal loses committed transactions
+SQLITE_SIDECAR_SUFFIXES = ('-wal', '-shm', '-journal')
+
+
+class DirectoryListing:
+    """Files of a directory with size and mtime, cached until something changes
+
+    The listing is rebuilt after `invalidate()` (the app calls it when it
+    writes or deletes files there) or when the directory's own mtime moved,
+    which catches files created or removed by other processes. Dotfiles
+    (lock and coordination files), the `protected` files (databases in
+    use) and SQLite's sidecar files are left out. `generation` increases
+    with every rebuild so it can key caches built from the listing.
+    """
+
+    def __init__(self, path, protected=()):
+        self.path = path
+        self.protected = frozenset(protected)
+        self.generation = 0
+        self._entries = []
+        self._dir_mtime = None
+        self._stale = True
+
+    def invalidate(self):
+        self._stale = True
+
+    def is_protected(self, name):
+        """Whether a file name must not be listed or deleted (also any name outside the directory)"""
+        return (os.path.basename(name) != name or name.startswith('.') or name in self.protected
+                or name.endswith(SQLITE_SIDECAR_SUFFIXES))
+
+    def entries(self):
+        try:
+            dir_mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime = None
+        if self._stale or dir_mtime != self._dir_mtime:
+            self._stale = False
+            self._dir_mtime = dir_mtime
+            self._entries = self._scan() if dir_mtime is not None else []
+            self.generation += 1
+        return self._entries
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.path) as scan:
+            for entry in scan:
+                if self.is_protected(entry.name) or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append(FileEntry(entry.name, stat.st_size, stat.st_mtime))
+        entries.sort()
+        return entries
+
+
+class RenderCache:
+    """The last rendered page with an ETag over its body
+
+    `get(key, render)` returns the cached page while the key is unchanged
+    and calls `render()` otherwise. The ETag hashes the body rather than the
+    key, so it stays valid across worker processes.
+    """
+
+    def __init__(self):
+        self._page = None
+
+    def get(self, key, render):
+        page = self._page
+        if page is not None and page.key == key:
+            return page
+        body = render()
+        etag = hashlib.blake2b(body.encode('utf-8'), digest_size=16).hexdigest()
+        if page is not None and page.etag == etag:
+            # Same content under a new key: keep the original modification time
+            page = page._replace(key=key)
+        else:
+            page = CachedPage(key, body, etag, time.time())
+        self._page = page
+        return page
+
+    def clear(self):
+        self._page = None
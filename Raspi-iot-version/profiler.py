@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Sampling profiler for the Weather Station
+A background thread snapshots the stacks of all other threads at a fixed
+interval and counts them in the folded format of flamegraph.pl / speedscope
+("thread;outer;...;inner count" per line), so it can run in production and
+be switched on and off at runtime. It samples wall-clock time: threads
+waiting on a lock, a socket or sleep() show up as well
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    # The function's first line, not the current one, so samples of a function merge
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Collects folded stacks while running; `stop()` returns them"""
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.started_at = None
+        self._stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling with fresh counts (no-op when already running)"""
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks = collections.Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stop sampling, returns the folded stacks text"""
+        with self._lock:
+            thread = self._thread
+            self._stop.set()
+        if thread is not None:
+            thread.join()
+        return self.folded()
+
+    def folded(self):
+        stacks = self._stacks.copy()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def dump(self, path):
+        """Write the folded stacks collected so far to path"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(self.folded())
+        return path
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                self._stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Quality control of incoming readings for the Weather Station
+Each measurement of a reading is checked against its physical range, the
+largest plausible change since the device's previous good value and a
+robust z-score over the device's recent values (rolling median and MAD).
+Failing values are listed for the quarantine table and, in quarantine
+mode, removed from the reading before it is stored. The work per reading
+is bounded by the fixed window size, whatever the amount of history.
+"""
+
+import bisect
+from collections import deque
+
+# Physically possible values per column (units as stored)
+RANGES = {
+    'temp_out_c': (-60.0, 65.0),
+    'temp_in_c': (-40.0, 70.0),
+    'humidity_out': (0, 100),
+    'humidity_in': (0, 100),
+    'windspeed_kmh': (0.0, 300.0),
+    'wind_gust_kmh': (0.0, 400.0),
+    'max_daily_gust': (0.0, 400.0),
+    'wind_direction': (0, 360),
+    'barometric_pressure_rel_in': (25.0, 32.5),
+    'barometric_pressure_abs_in': (16.0, 32.5),  # stations up to ~5500 m
+    'solar_radiation_wm2': (0.0, 2000.0),
+    'uv_index': (0.0, 20.0),
+    'rain_rate_in': (0.0, 40.0),
+    'daily_rain_in': (0.0, 100.0),
+    'rain_today_in': (0.0, 100.0),
+    'total_rain_in': (0.0, 100000.0),
+    'weekly_rain_in': (0.0, 200.0),
+    'monthly_rain_in': (0.0, 400.0),
+    'yearly_rain_in': (0.0, 2000.0),
+    'wh65_batt': (0.0, 6.0),
+}
+
+# Largest plausible change per minute; wind, sun and rain change too abruptly to be checked this way
+RATE_LIMITS = {
+    'temp_out_c': 3.0,
+    'temp_in_c': 2.0,
+    'humidity_out': 20,
+    'humidity_in': 15,
+    'barometric_pressure_rel_in': 0.06,  # ~2 hPa
+    'barometric_pressure_abs_in': 0.06,
+}
+RATE_MAX_GAP = 900  # seconds; after a longer gap the previous value says nothing
+
+# Columns checked by robust z-score, with the smallest MAD assumed (about the
+# sensor resolution, so a perfectly steady signal does not flag every step)
+ZSCORE_FLOORS = {
+    'temp_out_c': 0.2,
+    'temp_in_c': 0.2,
+    'humidity_out': 2,
+    'humidity_in': 2,
+    'barometric_pressure_rel_in': 0.005,
+    'barometric_pressure_abs_in': 0.005,
+}
+MAD_SCALE = 0.6745  # z = 0.6745 * (x - median) / MAD is comparable to a normal z-score
+
+CHECKS = ('range', 'rate', 'zscore')
+MODES = ('quarantine', 'flag')
+
+# (column, low, high, rate limit per minute, MAD floor) in one tuple per checked column
+_COLUMN_CHECKS = tuple(
+    (column, low, high, RATE_LIMITS.get(column), ZSCORE_FLOORS.get(column))
+    for column, (low, high) in RANGES.items()
+)
+
+
+def _kth_of_two(first, first_len, second, second_len, k):
+    """k-th smallest (0-based) of two ascending sequences given as index functions, in O(log n)"""
+    lo, hi = max(0, k + 1 - second_len), min(k + 1, first_len)
+    while lo < hi:
+        i = (lo + hi) // 2
+        if first(i) < second(k - i):
+            lo = i + 1
+        else:
+            hi = i
+    j = k + 1 - lo
+    if lo == 0:
+        return second(j - 1)
+    if j == 0:
+        return first(lo - 1)
+    return max(first(lo - 1), second(j - 1))
+
+
+class RollingMedian:
+    """Median and median absolute deviation of the last `size` values
+
+    The values are kept both in arrival order and sorted; adding one is a
+    bisect plus a list insert and delete of at most `size` items. The
+    absolute deviations below and above the median are each ascending in
+    the sorted list, so the MAD is a k-th smallest of two sorted runs.
+    """
+
+    __slots__ = ('size', 'values', 'sorted')
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.sorted = []
+
+    def add(self, value):
+        self.values.append(value)
+        bisect.insort(self.sorted, value)
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, old)]
+
+    @property
+    def count(self):
+        return len(self.sorted)
+
+    def median(self):
+        values, n = self.sorted, len(self.sorted)
+        if n % 2:
+            return values[n // 2]
+        return (values[n // 2 - 1] + values[n // 2]) / 2
+
+    def mad(self):
+        values, n = self.sorted, len(self.sorted)
+        median = self.median()
+        split = bisect.bisect_left(values, median)
+        below = lambda i: median - values[split - 1 - i]  # ascending deviations of the values below
+        above = lambda i: values[split + i] - median  # ascending deviations of the rest
+        k = n // 2
+        upper = _kth_of_two(below, split, above, n - split, k)
+        if n % 2:
+            return upper
+        return (_kth_of_two(below, split, above, n - split, k - 1) + upper) / 2
+
+
+class _DeviceState:
+    __slots__ = ('last_ts', 'good', 'medians')
+
+    def __init__(self):
+        self.last_ts = None
+        self.good = {}  # column -> (ts, value) of the last value that passed
+        self.medians = {}  # column -> RollingMedian
+
+
+class QualityControl:
+    """Per-device quality checks; not thread-safe, the ingest writer runs it under its lock
+
+    Rate and z-score checks need readings in timestamp order: a reading
+    older than the newest one checked for its device (a replayed backlog)
+    only gets the range check. Values outside their range never enter the
+    state; values failing the other checks do enter the rolling window, so
+    a lasting change (a new sensor, a front) stops being flagged once it
+    makes up half of the window.
+    """
+
+    def __init__(self, window=60, min_samples=20, z_threshold=6.0, mode='quarantine'):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        self.window = window
+        self.min_samples = min_samples  # values in the window before the z-score is used
+        self.z_threshold = z_threshold
+        self.mode = mode
+        self._devices = {}
+
+    def warm(self, conn, rows_per_device=None):
+        """Rebuild the state from each device's newest stored readings"""
+        self._devices = {}
+        device_ids = [device_id for (device_id,) in conn.execute('SELECT device_id FROM latest_reading').fetchall()]
+        self.reload(conn, device_ids, rows_per_device)
+        return len(self._devices)
+
+    def reload(self, conn, device_ids, rows_per_device=None):
+        """Replace the state of some devices by their newest stored readings
+
+        With several worker processes each one stores only part of a
+        device's readings; calling this inside the write transaction
+        before check() makes the rate and z-score checks see all of them.
+        Values quarantined by those two checks are stored as NULL; they
+        are taken from the quarantine table, as they were part of the
+        rolling window when they were checked.
+        """
+        columns = tuple(RANGES)
+        limit = rows_per_device or self.window
+        for device_id in device_ids:
+            self._devices.pop(device_id, None)
+            rows = conn.execute(f'''
+                SELECT datetime, ts, {', '.join(columns)} FROM weather_data
+                WHERE device_id = ? ORDER BY datetime DESC LIMIT ?
+            ''', (device_id, limit)).fetchall()
+            if not rows:
+                continue
+            readings = {}
+            for row in reversed(rows):
+                data = dict(zip(columns, row[2:]))
+                data.update(device_id=device_id, datetime=row[0], ts=row[1])
+                readings[row[0]] = data
+            quarantined = conn.execute('''
+                SELECT datetime, field, value FROM quarantine
+                WHERE device_id = ? AND datetime >= ? AND check_name != 'range' AND action = 'quarantined'
+            ''', (device_id, rows[-1][0])).fetchall()
+            for stamp, column, value in quarantined:
+                data = readings.get(stamp)
+                if data is not None and column in RANGES and data[column] is None:
+                    data[column] = value
+            self.check(list(readings.values()), apply=False)
+
+    def check(self, readings, apply=True):
+        """Check readings in order; returns the failures as quarantine rows
+
+        A row is (device_id, datetime, ts, field, value, check, detail,
+        action). In quarantine mode failing values are set to None in the
+        readings themselves (unless `apply` is false).
+        """
+        flagged = []
+        quarantine = apply and self.mode == 'quarantine'
+        action = 'quarantined' if quarantine else 'flagged'
+        for data in readings:
+            device_id = data.get('device_id', 1)
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = _DeviceState()
+            ts = data.get('ts')
+            in_order = ts is not None and (state.last_ts is None or ts > state.last_ts)
+            if in_order:
+                state.last_ts = ts
+
+            for column, low, high, rate_limit, mad_floor in _COLUMN_CHECKS:
+                value = data.get(column)
+                if value is None:
+                    continue
+                failure = None
+                if not low <= value <= high:
+                    failure = ('range', f"outside {low}..{high}")
+                elif in_order:
+                    if rate_limit is not None:
+                        previous = state.good.get(column)
+                        if previous is not None and ts - previous[0] <= RATE_MAX_GAP:
+                            elapsed = ts - previous[0]
+                            change = value - previous[1]
+                            if abs(change) > rate_limit * max(elapsed, 60) / 60:
+                                failure = ('rate', f"changed {change:+.3g} in {elapsed} s "
+                                                   f"(limit {rate_limit:g}/min)")
+                    if mad_floor is not None:
+                        medians = state.medians.get(column)
+                        if medians is None:
+                            medians = state.medians[column] = RollingMedian(self.window)
+                        if failure is None and medians.count >= self.min_samples:
+                            median = medians.median()
+                            # The MAD is never below the floor: values this close pass without computing it
+                            if abs(value - median) * MAD_SCALE > self.z_threshold * mad_floor:
+                                mad = max(medians.mad(), mad_floor)
+                                z = MAD_SCALE * (value - median) / mad
+                                if abs(z) > self.z_threshold:
+                                    failure = ('zscore', f"z={z:+.1f} (median {median:.4g}, MAD {mad:.3g})")
+                        medians.add(value)
+                    if failure is None:
+                        state.good[column] = (ts, value)
+
+                if failure is not None and apply:
+                    flagged.append((device_id, data.get('datetime', ''), ts, column, value,
+                                    failure[0], failure[1], action))
+                    if quarantine:
+                        data[column] = None
+        return flagged
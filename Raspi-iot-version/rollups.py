@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Downsampled rollups for the Weather Station
+Minute, hourly and daily aggregates per device are updated incrementally
+as readings are ingested, so history charts never scan raw rows
+"""
+
+import math
+
+# name -> (table, length of the datetime prefix that identifies the bucket, bucket suffix, seconds)
+RESOLUTIONS = {
+    '1m': ('weather_rollup_1m', 16, ':00', 60),
+    '1h': ('weather_rollup_1h', 13, ':00:00', 3600),
+    '1d': ('weather_rollup_1d', 10, ' 00:00:00', 86400),
+}
+
+# Measurements aggregated with min / max / sum / count
+ROLLUP_FIELDS = (
+    'temp_out_c', 'temp_in_c', 'humidity_out', 'humidity_in',
+    'barometric_pressure_rel_in', 'barometric_pressure_abs_in',
+    'windspeed_kmh', 'wind_gust_kmh', 'solar_radiation_wm2', 'uv_index',
+)
+
+STAT_COLUMNS = tuple(f'{field}_{stat}' for field in ROLLUP_FIELDS for stat in ('min', 'max', 'sum', 'n'))
+EXTRA_COLUMNS = ('wind_u_sum', 'wind_v_sum', 'wind_dir_n', 'rain_in')
+VALUE_COLUMNS = STAT_COLUMNS + EXTRA_COLUMNS
+
+
+def rollup_table_sql(table):
+    """CREATE TABLE statement for one rollup resolution"""
+    columns = ',\n'.join(f'        {column} REAL' for column in VALUE_COLUMNS)
+    return f'''
+    CREATE TABLE IF NOT EXISTS {table} (
+        device_id INTEGER NOT NULL,
+        bucket TEXT NOT NULL,
+        samples INTEGER NOT NULL,
+{columns},
+        PRIMARY KEY (device_id, bucket)
+    ) WITHOUT ROWID
+    '''
+
+
+def _merge_expression(column):
+    if column.endswith('_min'):
+        return f'{column} = COALESCE(MIN({column}, excluded.{column}), {column}, excluded.{column})'
+    if column.endswith('_max'):
+        return f'{column} = COALESCE(MAX({column}, excluded.{column}), {column}, excluded.{column})'
+    return f'{column} = COALESCE({column}, 0) + COALESCE(excluded.{column}, 0)'
+
+
+def _upsert_sql(table):
+    columns = ('device_id', 'bucket', 'samples') + VALUE_COLUMNS
+    updates = ',\n            '.join(['samples = samples + excluded.samples'] + [_merge_expression(c) for c in VALUE_COLUMNS])
+    return f'''
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES ({', '.join('?' * len(columns))})
+        ON CONFLICT (device_id, bucket) DO UPDATE SET
+            {updates}
+    '''
+
+
+UPSERT_SQL = {name: _upsert_sql(table) for name, (table, _, _, _) in RESOLUTIONS.items()}
+
+
+def to_number(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def rain_delta(previous, current):
+    """Rain since the previous reading from a cumulative counter (handles resets)"""
+    if current is None or previous is None:
+        return 0.0
+    if current < previous:
+        # Counter was reset (midnight / battery swap)
+        return current
+    return current - previous
+
+
+class RollupAggregator:
+    """Folds batches of readings into the rollup tables
+
+    Only the previous rain counters per device (with the timestamp they
+    were read at) are kept in memory; they are advanced by `commit()` once
+    the transaction that used them succeeded. Readings older than that
+    timestamp (a replayed backlog) add no rain: the counter delta of the
+    reading stored after them already covers it.
+    """
+
+    def __init__(self):
+        self.rain_counters = {}
+
+    def warm(self, conn):
+        """Load the last rain counters per device from the latest stored readings"""
+        rows = conn.execute('''
+            SELECT w.device_id, w.total_rain_in, w.daily_rain_in, w.datetime
+            FROM latest_reading l JOIN weather_data w ON w.id = l.reading_id
+        ''').fetchall()
+        for device_id, total_rain, daily_rain, stamp in rows:
+            self.rain_counters[device_id] = (to_number(total_rain), to_number(daily_rain), str(stamp or ''))
+
+    def prepare(self, readings):
+        """Aggregate a batch in memory, returns (rows per resolution, new rain counters)"""
+        counters = dict(self.rain_counters)
+        buckets = {name: {} for name in RESOLUTIONS}
+
+        for data in readings:
+            stamp = str(data.get('datetime') or '')
+            if len(stamp) < 19:
+                continue
+            device_id = data.get('device_id', 1)
+
+            total_rain = to_number(data.get('total_rain_in'))
+            daily_rain = to_number(data.get('daily_rain_in'))
+            previous_total, previous_daily, previous_stamp = counters.get(device_id, (None, None, ''))
+            if stamp < previous_stamp:
+                rain = 0.0
+            else:
+                if total_rain:
+                    rain = rain_delta(previous_total, total_rain)
+                else:
+                    rain = rain_delta(previous_daily, daily_rain)
+                counters[device_id] = (total_rain, daily_rain, stamp)
+
+            values = {field: to_number(data.get(field)) for field in ROLLUP_FIELDS}
+            direction = to_number(data.get('wind_direction'))
+
+            for name, (_, prefix, suffix, _) in RESOLUTIONS.items():
+                key = (device_id, stamp[:prefix] + suffix)
+                agg = buckets[name].get(key)
+                if agg is None:
+                    agg = buckets[name][key] = dict.fromkeys(VALUE_COLUMNS)
+                    agg['samples'] = 0
+                agg['samples'] += 1
+                for field, value in values.items():
+                    if value is None:
+                        continue
+                    low, high = f'{field}_min', f'{field}_max'
+                    agg[low] = value if agg[low] is None else min(agg[low], value)
+                    agg[high] = value if agg[high] is None else max(agg[high], value)
+                    agg[f'{field}_sum'] = (agg[f'{field}_sum'] or 0) + value
+                    agg[f'{field}_n'] = (agg[f'{field}_n'] or 0) + 1
+                if direction is not None:
+                    radians = math.radians(direction)
+                    agg['wind_u_sum'] = (agg['wind_u_sum'] or 0) + math.sin(radians)
+                    agg['wind_v_sum'] = (agg['wind_v_sum'] or 0) + math.cos(radians)
+                    agg['wind_dir_n'] = (agg['wind_dir_n'] or 0) + 1
+                agg['rain_in'] = (agg['rain_in'] or 0) + rain
+
+        rows = {
+            name: [(device_id, bucket, agg['samples']) + tuple(agg[c] for c in VALUE_COLUMNS)
+                   for (device_id, bucket), agg in items.items()]
+            for name, items in buckets.items()
+        }
+        return rows, counters
+
+    def apply(self, conn, rows):
+        """Upsert prepared rollup rows (call inside the ingest transaction)"""
+        for name, values in rows.items():
+            if values:
+                conn.executemany(UPSERT_SQL[name], values)
+
+    def commit(self, counters):
+        """Remember rain counters once the ingest transaction has committed"""
+        self.rain_counters = counters
+
+
+def rollup_point(row):
+    """Turn a rollup row (sqlite3.Row or dict) into a chart point with means and wind direction"""
+    point = {'device_id': row['device_id'], 'datetime': row['bucket'], 'samples': row['samples']}
+    for field in ROLLUP_FIELDS:
+        count = row[f'{field}_n']
+        point[field] = row[f'{field}_sum'] / count if count else None
+        point[f'{field}_min'] = row[f'{field}_min']
+        point[f'{field}_max'] = row[f'{field}_max']
+    if row['wind_dir_n']:
+        point['wind_direction'] = round(math.degrees(math.atan2(row['wind_u_sum'], row['wind_v_sum'])), 1) % 360
+    else:
+        point['wind_direction'] = None
+    point['rain_in'] = row['rain_in']
+    return point
+
+
+def pick_resolution(span_seconds, max_points, raw_interval):
+    """Finest resolution whose point count over the span fits in max_points"""
+    if span_seconds / max(raw_interval, 1) <= max_points:
+        return 'raw'
+    for name, (_, _, _, seconds) in RESOLUTIONS.items():
+        if span_seconds / seconds <= max_points:
+            return name
+    return '1d'
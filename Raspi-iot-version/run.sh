@@ -1,6 +1,9 @@
 #!/bin/bash
 
 # Weather Station Raspberry Pi - Manual Run Script
+# Usage: ./run.sh [--server dev|waitress|gunicorn|async] [--workers N] [--threads N] [--port 5000]
+# Run one server per directory: the async server (no dashboard) replaces the
+# Flask servers, it cannot run next to them (a second server exits)
 
 echo "Starting Weather Station manually..."
 
@@ -40,4 +43,4 @@ echo "Press Ctrl+C to stop"
 echo "=========================================="
 echo ""
 
-python3 weather_station.py
+python3 weather_station.py "$@"
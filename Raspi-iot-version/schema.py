@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Database schema and migrations for the Weather Station
+The schema version is kept in PRAGMA user_version; each migration brings
+the database one version forward and runs in its own transaction
+"""
+
+from rollups import RESOLUTIONS, RollupAggregator, rollup_table_sql
+
+WEATHER_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS weather_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id INTEGER NOT NULL,
+        datetime TEXT NOT NULL,
+        windspeed_kmh REAL,
+        wind_direction INTEGER,
+        rain_rate_in REAL,
+        temp_in_c REAL,
+        temp_out_c REAL,
+        humidity_in INTEGER,
+        humidity_out INTEGER,
+        uv_index REAL,
+        wind_gust_kmh REAL,
+        barometric_pressure_rel_in REAL,
+        barometric_pressure_abs_in REAL,
+        solar_radiation_wm2 REAL,
+        daily_rain_in REAL,
+        rain_today_in REAL,
+        total_rain_in REAL,
+        weekly_rain_in REAL,
+        monthly_rain_in REAL,
+        yearly_rain_in REAL,
+        max_daily_gust REAL,
+        wh65_batt REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Columns written by the ingest path, in INSERT order
+WEATHER_COLUMNS = (
+    'device_id', 'datetime', 'windspeed_kmh', 'wind_direction', 'rain_rate_in',
+    'temp_in_c', 'temp_out_c', 'humidity_in', 'humidity_out',
+    'uv_index', 'wind_gust_kmh', 'barometric_pressure_rel_in',
+    'barometric_pressure_abs_in', 'solar_radiation_wm2',
+    'daily_rain_in', 'rain_today_in', 'total_rain_in',
+    'weekly_rain_in', 'monthly_rain_in', 'yearly_rain_in',
+    'max_daily_gust', 'wh65_batt'
+)
+
+
+def table_columns(conn, table):
+    """Return the column names of a table (empty list if it does not exist)"""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _create_weather_table(conn, utc_offset_hours):
+    """v1: weather_data table; databases made by start_demo.py lack device_id"""
+    conn.execute(WEATHER_TABLE_SQL)
+    if 'device_id' not in table_columns(conn, 'weather_data'):
+        conn.execute('ALTER TABLE weather_data ADD COLUMN device_id INTEGER NOT NULL DEFAULT 1')
+
+
+def _add_time_series_indexes(conn, utc_offset_hours):
+    """v2: time-series indexes and a trigger-maintained latest reading per device"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_weather_device_datetime ON weather_data (device_id, datetime)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_weather_created_at ON weather_data (created_at)')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS latest_reading (
+            device_id INTEGER PRIMARY KEY,
+            reading_id INTEGER NOT NULL,
+            datetime TEXT NOT NULL,
+            created_at TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_weather_latest AFTER INSERT ON weather_data
+        BEGIN
+            INSERT INTO latest_reading (device_id, reading_id, datetime, created_at)
+            VALUES (NEW.device_id, NEW.id, NEW.datetime, NEW.created_at)
+            ON CONFLICT (device_id) DO UPDATE SET
+                reading_id = excluded.reading_id,
+                datetime = excluded.datetime,
+                created_at = excluded.created_at
+            WHERE excluded.reading_id > latest_reading.reading_id;
+        END
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO latest_reading (device_id, reading_id, datetime, created_at)
+        SELECT w.device_id, w.id, w.datetime, w.created_at
+        FROM weather_data w
+        JOIN (SELECT device_id, MAX(id) AS id FROM weather_data GROUP BY device_id) m ON m.id = w.id
+    ''')
+
+
+def _create_rollup_tables(conn, utc_offset_hours):
+    """v3: minute / hourly / daily rollups, backfilled from existing rows"""
+    for table, _, _, _ in RESOLUTIONS.values():
+        conn.execute(rollup_table_sql(table))
+
+    aggregator = RollupAggregator()
+    cursor = conn.execute('SELECT * FROM weather_data ORDER BY id')
+    columns = [d[0] for d in cursor.description]
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows:
+            break
+        prepared, counters = aggregator.prepare([dict(zip(columns, row)) for row in rows])
+        aggregator.apply(conn, prepared)
+        aggregator.commit(counters)
+
+
+def _create_outbox(conn, utc_offset_hours):
+    """v4: durable outbox of readings waiting to be forwarded upstream"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _add_epoch_timestamp(conn, utc_offset_hours):
+    """v5: integer UTC epoch seconds per reading for cheap range indexing
+
+    Readings stored so far carry station-local datetimes, shifted by the
+    station's UTC offset, so the backfill undoes that.
+    """
+    if 'ts' not in table_columns(conn, 'weather_data'):
+        conn.execute('ALTER TABLE weather_data ADD COLUMN ts INTEGER')
+    conn.execute('''
+        UPDATE weather_data SET ts = CAST(strftime('%s', datetime) AS INTEGER) - ?
+        WHERE ts IS NULL AND strftime('%s', datetime) IS NOT NULL
+    ''', (round(utc_offset_hours * 3600),))
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_weather_device_ts ON weather_data (device_id, ts)')
+
+
+def _unique_device_datetime(conn, utc_offset_hours):
+    """v6: at most one reading per device and timestamp, so replayed backlogs are idempotent
+
+    Readings stored without a timestamp get their arrival time (created_at
+    is UTC, shifted by the station's UTC offset); of duplicate readings the
+    newest copy is kept. Rollups already counted the duplicates and are left as they are.
+    latest_reading now follows the newest timestamp rather than the newest
+    row, so a replayed backlog does not replace the current reading.
+    """
+    conn.execute('''
+        UPDATE weather_data SET
+            datetime = datetime(created_at, ?),
+            ts = CAST(strftime('%s', created_at) AS INTEGER)
+        WHERE datetime = '' AND created_at IS NOT NULL
+    ''', (f'{round(utc_offset_hours * 3600):+d} seconds',))
+    conn.execute('''
+        DELETE FROM weather_data WHERE id NOT IN (
+            SELECT MAX(id) FROM weather_data GROUP BY device_id, datetime
+        )
+    ''')
+    conn.execute('DROP TRIGGER IF EXISTS trg_weather_latest')
+    conn.execute('''
+        CREATE TRIGGER trg_weather_latest AFTER INSERT ON weather_data
+        BEGIN
+            INSERT INTO latest_reading (device_id, reading_id, datetime, created_at)
+            VALUES (NEW.device_id, NEW.id, NEW.datetime, NEW.created_at)
+            ON CONFLICT (device_id) DO UPDATE SET
+                reading_id = excluded.reading_id,
+                datetime = excluded.datetime,
+                created_at = excluded.created_at
+            WHERE excluded.datetime >= latest_reading.datetime;
+        END
+    ''')
+    # Bare columns of a MAX() aggregate come from the row holding the maximum
+    conn.execute('''
+        INSERT OR REPLACE INTO latest_reading (device_id, reading_id, datetime, created_at)
+        SELECT device_id, id, MAX(datetime), created_at FROM weather_data GROUP BY device_id
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_weather_device_datetime')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_device_datetime ON weather_data (device_id, datetime)')
+
+
+def _create_quarantine(conn, utc_offset_hours):
+    """v7: values that failed quality control, with the check and what was done with them"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quarantine (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id INTEGER NOT NULL,
+            datetime TEXT NOT NULL,
+            ts INTEGER,
+            field TEXT NOT NULL,
+            value REAL,
+            check_name TEXT NOT NULL,
+            detail TEXT,
+            action TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_quarantine_device_datetime ON quarantine (device_id, datetime)')
+
+
+# Each step gets the connection and the station's UTC offset in hours
+# (settings 'timezoneOffset'), for backfills from station-local datetimes
+MIGRATIONS = [
+    _create_weather_table,
+    _add_time_series_indexes,
+    _create_rollup_tables,
+    _create_outbox,
+    _add_epoch_timestamp,
+    _unique_device_datetime,
+    _create_quarantine,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn, utc_offset_hours=7):
+    """Apply pending migrations, returns (old_version, new_version)
+
+    A database at the current version costs one PRAGMA read, no
+    transaction, so every (re)start and every worker can call this.
+    """
+    old_version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if old_version >= SCHEMA_VERSION:
+        return old_version, old_version
+    for version in range(old_version, SCHEMA_VERSION):
+        # sqlite3 does not open a transaction for DDL on its own
+        conn.execute('BEGIN')
+        try:
+            MIGRATIONS[version](conn, utc_offset_hours)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return old_version, max(old_version, SCHEMA_VERSION)
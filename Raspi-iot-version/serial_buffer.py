@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Serial monitor ring buffer for the Weather Station
+Fixed-capacity, sequence-numbered log lines that clients can follow with a
+cursor (the last sequence number they have seen) instead of re-reading
+the whole buffer. Numbering starts again at 1 when the server restarts, so
+a cursor beyond the newest line is one from before the restart and reads
+the whole buffer.
+"""
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class SerialRingBuffer:
+    """Ring buffer of (seq, line) entries
+
+    Readers never lock: they take a snapshot of the deque (copied in one C
+    call under the GIL) and slice it by sequence number. Writers hold a
+    short lock so sequence numbers enter the deque in order, and use the
+    same lock to wake streaming readers waiting in `wait()`.
+    """
+
+    __slots__ = ('capacity', '_entries', '_counter', '_cond')
+
+    def __init__(self, capacity=20):
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)
+        self._counter = itertools.count(1)
+        self._cond = threading.Condition(threading.Lock())
+
+    def add(self, line):
+        """Append a line, returns its sequence number"""
+        with self._cond:
+            seq = next(self._counter)
+            self._entries.append((seq, line))
+            self._cond.notify_all()
+        return seq
+
+    @property
+    def last_seq(self):
+        """Sequence number of the newest line (0 when empty)"""
+        entries = self._entries
+        return entries[-1][0] if entries else 0
+
+    def since(self, seq=0):
+        """Entries newer than seq, oldest first (all of them for a cursor from before a restart)"""
+        entries = list(self._entries)
+        if not entries:
+            return []
+        if seq > entries[-1][0]:
+            seq = 0
+        # Sequence numbers are contiguous, so the cursor maps to an index
+        start = max(seq - entries[0][0] + 1, 0)
+        return entries[start:]
+
+    def lines(self):
+        """All buffered lines, oldest first"""
+        return [line for _, line in list(self._entries)]
+
+    def flush(self, timeout=None):
+        """Lines are in the buffer as soon as add() returns (SharedSerialBuffer's interface)"""
+        return True
+
+    def wait(self, seq, timeout=None):
+        """Block until a line newer than seq exists (or timeout), then return the new entries"""
+        if seq > self.last_seq:
+            seq = 0  # a cursor from before a restart
+        if self.last_seq <= seq:
+            with self._cond:
+                self._cond.wait_for(lambda: self.last_seq > seq, timeout)
+        return self.since(seq)
+
+
+class SharedSerialBuffer:
+    """SerialRingBuffer with the same interface, shared by worker processes
+
+    Lines live in a small SQLite file next to the database (not in the
+    database itself, so logging never waits on the ingest writer); seq is
+    the AUTOINCREMENT rowid and lines beyond the capacity are trimmed on
+    every write. `add` only hands the line to a writer thread, which stores
+    what has piled up in one transaction, so logging never waits on (or
+    fails with) the file's lock; while the file stays locked, the newest
+    `max_pending` lines wait in memory and are written on the next attempt.
+    Streaming readers poll since other processes cannot notify them.
+    """
+
+    def __init__(self, path, capacity=20, poll_interval=0.5, busy_timeout=5.0, retry_interval=1.0, max_pending=1000):
+        self.path = path
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.busy_timeout = busy_timeout
+        self.retry_interval = retry_interval
+        self._local = threading.local()
+        self._pending = deque(maxlen=max_pending)
+        self._cond = threading.Condition()
+        self._writing = False
+        self._writer = None  # (pid, thread): a forked worker starts its own
+        conn = self._connection()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS serial_log (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    line TEXT NOT NULL
+                )
+            ''')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')  # log lines are not worth an fsync
+            self._local.conn = conn
+        return conn
+
+    def add(self, line):
+        """Queue a line for the writer thread; its sequence number is assigned when it is stored"""
+        with self._cond:
+            self._pending.append(line)
+            if self._writer is None or self._writer[0] != os.getpid():
+                thread = threading.Thread(target=self._run, name='serial-writer', daemon=True)
+                self._writer = (os.getpid(), thread)
+                thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until the queued lines are stored, returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                lines = list(self._pending)
+                self._pending.clear()
+                self._writing = True
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.executemany('INSERT INTO serial_log (line) VALUES (?)', [(line,) for line in lines])
+                    seq = conn.execute('SELECT MAX(seq) FROM serial_log').fetchone()[0]
+                    conn.execute('DELETE FROM serial_log WHERE seq <= ?', (seq - self.capacity,))
+                stored = True
+            except sqlite3.Error:
+                stored = False
+            with self._cond:
+                if not stored:
+                    # Older than what arrived meanwhile, so they go first
+                    self._pending = deque(lines + list(self._pending), maxlen=self._pending.maxlen)
+                self._writing = False
+                self._cond.notify_all()
+            if not stored:
+                time.sleep(self.retry_interval)
+
+    @property
+    def last_seq(self):
+        """Sequence number of the newest line (0 when empty)"""
+        return self._connection().execute('SELECT COALESCE(MAX(seq), 0) FROM serial_log').fetchone()[0]
+
+    def since(self, seq=0):
+        """Entries newer than seq, oldest first (all of them for a cursor from before a restart)"""
+        entries = self._connection().execute(
+            'SELECT seq, line FROM serial_log WHERE seq > ? ORDER BY seq', (seq,)
+        ).fetchall()
+        if not entries and seq > self.last_seq:
+            return self.since(0)  # serial.db was recreated
+        return entries
+
+    def lines(self):
+        """All buffered lines, oldest first"""
+        return [line for _, line in self.since(0)]
+
+    def wait(self, seq, timeout=None):
+        """Poll until a line newer than seq exists (or timeout), then return the new entries"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            entries = self.since(seq)
+            if entries:
+                return entries
+            if deadline is not None and time.monotonic() >= deadline:
+                return []
+            time.sleep(self.poll_interval)
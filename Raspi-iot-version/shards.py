@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Storage sharded by device id for the Weather Station
+With shard_count > 0 every station's readings, rollups, quarantined values
+and outbox rows live in one of N database files (data/shards/weather-<n>.db
+holds the devices with device_id % N == n). Each file has its own
+connection pool, write lock and ingest writer, so stations in different
+shards never wait for each other's transactions. Queries that need every
+device fan out to the shards on a small thread pool and are merged here.
+Changing the layout moves the stations' rows on the next start.
+"""
+
+import glob
+import heapq
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from rollups import RESOLUTIONS
+from schema import WEATHER_COLUMNS, migrate
+
+# Tables whose rows belong to a device and move with it
+ROLLUP_TABLES = tuple(table for table, _, _, _ in RESOLUTIONS.values())
+DEVICE_TABLES = ('weather_data', 'quarantine') + ROLLUP_TABLES
+MOVED_WEATHER_COLUMNS = ', '.join(WEATHER_COLUMNS + ('ts', 'created_at'))
+MOVED_QUARANTINE_COLUMNS = 'device_id, datetime, ts, field, value, check_name, detail, action, created_at'
+
+
+def shard_paths(db_file, shard_dir, count):
+    """Database files of a layout: db_file alone when count is 0, else one file per shard"""
+    if count <= 0:
+        return [db_file]
+    return [os.path.join(shard_dir, f'weather-{index}.db') for index in range(count)]
+
+
+class Shard:
+    """One database file and the writer state kept for it
+
+    The application sets the rest (ingest queue, rollup state, quality
+    control, forwarder, maintenance); `write_lock` serializes the shard's
+    writers and `warmed` is set once its caches are loaded.
+    """
+
+    def __init__(self, index, path, db):
+        self.index = index
+        self.path = path
+        self.db = db
+        self.write_lock = threading.Lock()
+        self.warmed = threading.Event()
+
+
+class ShardRouter:
+    """Routes device ids to shards and fans queries out over all of them
+
+    With a single shard (no sharding) `map` runs in the calling thread,
+    so the unsharded server pays nothing for the routing.
+    """
+
+    def __init__(self, query_threads=4):
+        self.query_threads = query_threads
+        self.shards = []
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def open(self, shards):
+        self.shards = list(shards)
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def __len__(self):
+        return len(self.shards)
+
+    def route(self, device_id):
+        """The shard storing a device"""
+        return self.shards[int(device_id) % len(self.shards)]
+
+    def database(self, device_id):
+        return self.route(device_id).db
+
+    def split(self, readings):
+        """[(shard, readings of its devices)], readings kept in their order"""
+        if len(self.shards) == 1:
+            return [(self.shards[0], readings)]
+        groups = {}
+        for data in readings:
+            groups.setdefault(self.route(data.get('device_id', 1)), []).append(data)
+        return list(groups.items())
+
+    def map(self, fn):
+        """fn(db) for every shard's database, results in shard order
+
+        Runs on the query pool when sharded; fn must fetch what it needs
+        (fetchall()) because the pool thread hands its connection back
+        to the shard's pool when fn returns.
+        """
+        if len(self.shards) == 1:
+            return [fn(self.shards[0].db)]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=min(self.query_threads, len(self.shards)),
+                                                thread_name_prefix='shard-query')
+        return list(self._pool.map(lambda shard: _call(fn, shard.db), self.shards))
+
+    def release(self):
+        """Hand the calling thread's connections back to the shards' pools"""
+        for shard in self.shards:
+            shard.db.release()
+
+    def close_all(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+        for shard in self.shards:
+            shard.db.close_all()
+
+
+def _call(fn, db):
+    try:
+        return fn(db)
+    finally:
+        db.release()
+
+
+def merge_rows(row_lists, key, reverse=False, limit=None):
+    """Merge lists of rows, each sorted by key, into one sorted list of at most `limit` rows"""
+    return list(islice(heapq.merge(*row_lists, key=key, reverse=reverse), limit))
+
+
+class MergedCursor:
+    """Rows of cursors over the same columns, merged in `key` order (each cursor sorted by it)
+
+    Provides the part of the DB-API cursor export.iter_export uses.
+    """
+
+    def __init__(self, cursors, key):
+        self.description = cursors[0].description
+        self._rows = heapq.merge(*cursors, key=key)
+
+    def fetchmany(self, size):
+        return list(islice(self._rows, size))
+
+
+# Layout changes
+
+def _open(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')  # as Database does for a new file
+    conn.execute('PRAGMA journal_mode = WAL')
+    return conn
+
+
+def _devices(conn):
+    """Device ids with rows in a database, one index seek per device and table (checked on every start)"""
+    devices = set()
+    for table in DEVICE_TABLES:
+        device_id = conn.execute(f'SELECT MIN(device_id) FROM {table}').fetchone()[0]
+        while device_id is not None:
+            devices.add(device_id)
+            device_id = conn.execute(f'SELECT MIN(device_id) FROM {table} WHERE device_id > ?',
+                                     (device_id,)).fetchone()[0]
+    return sorted(devices)
+
+
+def _move_device(conn, device_id):
+    """Copy a device's rows into the attached database `target`, then delete them here"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'''
+            INSERT OR IGNORE INTO target.weather_data ({MOVED_WEATHER_COLUMNS})
+            SELECT {MOVED_WEATHER_COLUMNS} FROM main.weather_data WHERE device_id = ? ORDER BY id
+        ''', (device_id,))
+        for table in ROLLUP_TABLES:
+            conn.execute(f'INSERT OR IGNORE INTO target.{table} SELECT * FROM main.{table} WHERE device_id = ?',
+                         (device_id,))
+        conn.execute(f'''
+            INSERT INTO target.quarantine ({MOVED_QUARANTINE_COLUMNS})
+            SELECT {MOVED_QUARANTINE_COLUMNS} FROM main.quarantine WHERE device_id = ? ORDER BY id
+        ''', (device_id,))
+        for table in DEVICE_TABLES + ('latest_reading',):
+            conn.execute(f'DELETE FROM main.{table} WHERE device_id = ?', (device_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _move_outbox(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        moved = conn.execute('''
+            INSERT INTO target.outbox (payload, created_at)
+            SELECT payload, created_at FROM main.outbox ORDER BY id
+        ''').rowcount
+        conn.execute('DELETE FROM main.outbox')
+        conn.commit()
+        return moved
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def prepare_storage(db_file, shard_dir, count, log=None, utc_offset_hours=7):
+    """Create and migrate the database files of a layout, then move rows stored outside their shard
+
+    Every other database file of a previous layout (db_file, shard files)
+    is a source too; its devices move to their shard and its outbox to
+    the first one. Run before the ingest writers start. Each device moves
+    in its own transaction per file, so an interrupted move is completed
+    on the next start. `utc_offset_hours` is the station's offset the
+    migrations backfill from (settings 'timezoneOffset'). Returns the
+    number of devices moved.
+    """
+    log = log or (lambda message: None)
+    paths = shard_paths(db_file, shard_dir, count)
+    for path in paths:
+        conn = _open(path)
+        try:
+            old_version, new_version = migrate(conn, utc_offset_hours)
+        finally:
+            conn.close()
+        if old_version != new_version:
+            where = f" ({path})" if count > 0 else ''
+            log(f"Database schema migrated from v{old_version} to v{new_version}{where}")
+
+    sources = [db_file] + sorted(glob.glob(os.path.join(glob.escape(shard_dir), 'weather-*.db')))
+    layout = {os.path.abspath(path) for path in paths}
+    moved = 0
+    for source in dict.fromkeys(sources):
+        if not os.path.exists(source):
+            continue
+        conn = sqlite3.connect(source, timeout=30, isolation_level=None)
+        try:
+            migrate(conn, utc_offset_hours)
+            targets = {}
+            for device_id in _devices(conn):
+                target = paths[device_id % len(paths)]
+                if os.path.abspath(target) != os.path.abspath(source):
+                    targets.setdefault(target, []).append(device_id)
+            outbox = os.path.abspath(source) not in layout and conn.execute(
+                'SELECT 1 FROM outbox LIMIT 1').fetchone() is not None
+            if outbox:
+                targets.setdefault(paths[0], [])
+            for target, devices in targets.items():
+                conn.execute('ATTACH DATABASE ? AS target', (target,))
+                try:
+                    for device_id in devices:
+                        _move_device(conn, device_id)
+                    if outbox and target == paths[0]:
+                        _move_outbox(conn)
+                finally:
+                    conn.execute('DETACH DATABASE target')
+                if devices:
+                    log(f"Moved {len(devices)} devices from {source} to {target}")
+                moved += len(devices)
+        finally:
+            conn.close()
+    return moved
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Station simulator for the Weather Station
+Emulates ESP32 / Ambient-Weather stations posting readings to a running
+server: form bodies to /post (imperial, dateutc in UTC) and JSON to
+/api/weather (the keys the ESP32 firmware uploads, station-local time),
+with diurnal temperature, humidity, solar, pressure and wind curves and
+occasional rain showers feeding the cumulative rain counters
+
+Usage: python simulator.py [--url http://localhost:5000] [--stations 5]
+                           [--interval 3] [--duration 60] [--json-share 0.2]
+"""
+
+import argparse
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+KMH_PER_MPH = 1.60934
+HPA_PER_INHG = 33.8639
+
+
+def c_to_f(value):
+    return value * 9.0 / 5.0 + 32.0
+
+
+class Station:
+    """One simulated station with its own climate offsets and random state
+
+    Every call to `step()` advances the simulated clock by `step_seconds`
+    (the ESP32 posts every 3 s), so each reading has a unique timestamp no
+    matter how fast readings are actually sent.
+    """
+
+    def __init__(self, device_id, start, step_seconds=3, utc_offset_hours=7, seed=None):
+        self.device_id = device_id
+        self.clock = start
+        self.step_seconds = step_seconds
+        self.utc_offset = timedelta(hours=utc_offset_hours)
+        self.rng = random.Random(seed if seed is not None else device_id)
+
+        self.base_temp = 26 + self.rng.uniform(-3, 3)
+        self.temp_noise = 0.0
+        self.pressure_drift = 0.0
+        self.wind_dir = self.rng.uniform(0, 360)
+        self.shower_left = 0  # seconds of rain remaining
+        self.shower_rate = 0.0  # in/h
+        self.max_gust = 0.0
+        self.rain = {'daily': 0.0, 'weekly': 0.0, 'monthly': 0.0, 'yearly': 0.0, 'total': self.rng.uniform(0, 20)}
+        self.day = None
+
+    def step(self):
+        """Advance the clock and return the reading as a dict in metric units"""
+        self.clock += timedelta(seconds=self.step_seconds)
+        local = self.clock + self.utc_offset
+        hour = local.hour + local.minute / 60 + local.second / 3600
+        rng = self.rng
+
+        if local.date() != self.day:
+            if self.day is not None:
+                self.rain['daily'] = 0.0
+                if local.weekday() == 0:
+                    self.rain['weekly'] = 0.0
+                if local.day == 1:
+                    self.rain['monthly'] = 0.0
+                    if local.month == 1:
+                        self.rain['yearly'] = 0.0
+            self.max_gust = 0.0
+            self.day = local.date()
+
+        # Temperature: daily sine peaking mid-afternoon plus AR(1) noise
+        self.temp_noise = 0.98 * self.temp_noise + rng.gauss(0, 0.05)
+        temp = self.base_temp + 5 * math.sin((hour - 9) / 24 * 2 * math.pi) + self.temp_noise
+        humidity = min(100, max(15, 80 - 3 * (temp - self.base_temp) + rng.gauss(0, 1)))
+
+        # Sun between 06:00 and 18:00, dimmed by passing clouds
+        sun = max(0.0, math.sin((hour - 6) / 12 * math.pi))
+        solar = 1000 * sun * (0.6 + 0.4 * rng.random())
+        uv = round(solar / 100)
+
+        # Semidiurnal pressure tide plus a slow random walk
+        self.pressure_drift = max(-1.5, min(1.5, self.pressure_drift + rng.gauss(0, 0.01)))
+        pressure_hpa = 1010 + 1.2 * math.cos((hour - 10) / 12 * 2 * math.pi) + self.pressure_drift
+
+        # Wind picks up in the afternoon, direction wanders
+        wind = max(0.0, 4 + 8 * max(0.0, math.sin((hour - 10) / 12 * math.pi)) + rng.gauss(0, 1.5))
+        gust = wind * (1.2 + 0.4 * rng.random())
+        self.max_gust = max(self.max_gust, gust)
+        self.wind_dir = (self.wind_dir + rng.gauss(0, 8)) % 360
+
+        # Showers, more likely in the afternoon
+        if self.shower_left <= 0 and rng.random() < 0.0004 * (1 + 2 * sun):
+            self.shower_left = rng.randint(300, 3600)
+            self.shower_rate = rng.uniform(0.05, 1.5)
+        rain_rate = 0.0
+        if self.shower_left > 0:
+            self.shower_left -= self.step_seconds
+            rain_rate = self.shower_rate
+            fallen = rain_rate * self.step_seconds / 3600
+            for key in self.rain:
+                self.rain[key] += fallen
+
+        return {
+            'device_id': self.device_id,
+            'utc': self.clock,
+            'local': local,
+            'temp_out_c': temp,
+            'temp_in_c': temp - 2 + rng.gauss(0, 0.1),
+            'humidity_out': round(humidity),
+            'humidity_in': round(min(100, humidity - 10)),
+            'solar_radiation_wm2': solar,
+            'uv_index': uv,
+            'pressure_rel_hpa': pressure_hpa,
+            'pressure_abs_hpa': pressure_hpa - 1.5,
+            'windspeed_kmh': wind,
+            'wind_gust_kmh': gust,
+            'max_daily_gust_kmh': self.max_gust,
+            'wind_direction': round(self.wind_dir),
+            'rain_rate_in': rain_rate,
+            'rain': dict(self.rain),
+        }
+
+
+def form_body(reading):
+    """Ambient-Weather style form fields as posted to /post"""
+    rain = reading['rain']
+    return {
+        'id': str(reading['device_id']),
+        'dateutc': reading['utc'].strftime('%Y-%m-%d %H:%M:%S'),
+        'tempf': f"{c_to_f(reading['temp_out_c']):.1f}",
+        'tempinf': f"{c_to_f(reading['temp_in_c']):.1f}",
+        'humidity': str(reading['humidity_out']),
+        'humidityin': str(reading['humidity_in']),
+        'windspeedmph': f"{reading['windspeed_kmh'] / KMH_PER_MPH:.1f}",
+        'windgustmph': f"{reading['wind_gust_kmh'] / KMH_PER_MPH:.1f}",
+        'maxdailygust': f"{reading['max_daily_gust_kmh'] / KMH_PER_MPH:.1f}",
+        'winddir': str(reading['wind_direction']),
+        'rainratein': f"{reading['rain_rate_in']:.3f}",
+        'dailyrainin': f"{rain['daily']:.3f}",
+        'raintodayin': f"{rain['daily']:.3f}",
+        'weeklyrainin': f"{rain['weekly']:.3f}",
+        'monthlyrainin': f"{rain['monthly']:.3f}",
+        'yearlyrainin': f"{rain['yearly']:.3f}",
+        'totalrainin': f"{rain['total']:.3f}",
+        'solarradiation': f"{reading['solar_radiation_wm2']:.1f}",
+        'uv': str(reading['uv_index']),
+        'baromrelin': f"{reading['pressure_rel_hpa'] / HPA_PER_INHG:.2f}",
+        'baromabsin': f"{reading['pressure_abs_hpa'] / HPA_PER_INHG:.2f}",
+        'wh65batt': '0',
+    }
+
+
+def json_body(reading):
+    """The JSON the ESP32 firmware uploads (constructJsonData), as accepted by /api/weather"""
+    rain = reading['rain']
+    return {
+        'idws': reading['device_id'],
+        'date': reading['local'].strftime('%Y-%m-%d %H:%M:%S'),
+        'windspeedkmh': round(reading['windspeed_kmh'], 2),
+        'winddir': reading['wind_direction'],
+        'rain_rate': round(reading['rain_rate_in'], 3),
+        'temp_in': round(reading['temp_in_c'], 2),
+        'temp_out': round(reading['temp_out_c'], 2),
+        'hum_in': reading['humidity_in'],
+        'hum_out': reading['humidity_out'],
+        'uv': reading['uv_index'],
+        'wind_gust': round(reading['wind_gust_kmh'], 2),
+        'air_press_rel': round(reading['pressure_rel_hpa'] / HPA_PER_INHG, 2),
+        'air_press_abs': round(reading['pressure_abs_hpa'] / HPA_PER_INHG, 2),
+        'solar_radiation': round(reading['solar_radiation_wm2'], 1),
+        'dailyrainin': round(rain['daily'], 3),
+        'raintodayin': round(rain['daily'], 3),
+        'totalrainin': round(rain['total'], 3),
+        'weeklyrainin': round(rain['weekly'], 3),
+        'monthlyrainin': round(rain['monthly'], 3),
+        'yearlyrainin': round(rain['yearly'], 3),
+        'maxdailygust': round(reading['max_daily_gust_kmh'], 2),
+        'wh65batt': 0,
+    }
+
+
+class LoadResult:
+    """Per-request outcomes collected from all station threads"""
+
+    def __init__(self):
+        self.latencies = []  # seconds, successful requests only
+        self.statuses = {}
+        self.request_bytes = 0
+        self.errors = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, status, latency, body_bytes):
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.request_bytes += body_bytes
+            if status == 200:
+                self.latencies.append(latency)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    @property
+    def accepted(self):
+        return self.statuses.get(200, 0)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+
+def run_station(url, station, interval, deadline, json_share, result, max_readings=None):
+    """Post readings from one station until the deadline (interval 0: as fast as the server answers)"""
+    session = requests.Session()
+    rng = random.Random(station.device_id * 7919)
+    next_send = time.perf_counter()
+    sent = 0
+    try:
+        while time.perf_counter() < deadline and (max_readings is None or sent < max_readings):
+            reading = station.step()
+            if rng.random() < json_share:
+                request = requests.Request('POST', f"{url}/api/weather", json=json_body(reading))
+            else:
+                request = requests.Request('POST', f"{url}/post", data=form_body(reading))
+            prepared = session.prepare_request(request)
+
+            started = time.perf_counter()
+            try:
+                response = session.send(prepared, timeout=10)
+                result.record(response.status_code, time.perf_counter() - started, len(prepared.body or b''))
+            except requests.RequestException:
+                result.record_error()
+            sent += 1
+
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+    finally:
+        session.close()
+
+
+def run_load(url, stations=5, interval=3.0, duration=60.0, json_share=0.2, step_seconds=3,
+             start=None, first_device=1, max_readings=None):
+    """Run `stations` simulated stations against a server, returns a LoadResult"""
+    url = url.rstrip('/')
+    start = start or datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    result = LoadResult()
+    result.started = time.perf_counter()
+    deadline = result.started + duration
+
+    def station_thread(station, delay):
+        time.sleep(delay)
+        run_station(url, station, interval, deadline, json_share, result, max_readings)
+
+    threads = []
+    for index in range(stations):
+        station = Station(first_device + index, start, step_seconds)
+        # Spread the stations' send times over one interval like real, unsynchronized stations
+        delay = interval * index / stations if interval else 0
+        thread = threading.Thread(target=station_thread, args=(station, delay), daemon=True)
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.finished = time.perf_counter()
+    return result
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--stations', type=int, default=5)
+    parser.add_argument('--first-device', type=int, default=1, help="device id of the first station")
+    parser.add_argument('--interval', type=float, default=3.0, help="seconds between posts per station (0 = flat out)")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds to run")
+    parser.add_argument('--json-share', type=float, default=0.2, help="fraction of readings sent as JSON")
+    parser.add_argument('--step', type=int, default=3, help="simulated seconds between readings")
+    parser.add_argument('--start', help="simulated UTC start 'YYYY-MM-DD HH:MM:SS' (default: now)")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d %H:%M:%S') if args.start else None
+    print(f"Simulating {args.stations} stations against {args.url} for {args.duration:.0f}s ...")
+    result = run_load(args.url, args.stations, args.interval, args.duration, args.json_share,
+                      args.step, start, args.first_device)
+
+    print(f"requests: {sum(result.statuses.values())}  statuses: {result.statuses}  errors: {result.errors}")
+    print(f"throughput: {result.accepted / result.elapsed:.1f} readings/s")
+    for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        value = percentile(result.latencies, fraction)
+        if value is not None:
+            print(f"{label}: {value * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 """
 Demo script to start the weather station with sample data
-This creates a complete demo environment for testing
+This creates a complete demo environment for testing; sample data and
+settings are only created on the first run (--reset starts over)
 """
 
+import argparse
+import glob
 import os
+import shutil
+import sys
 import json
 import sqlite3
 import time
@@ -128,7 +133,7 @@ def create_settings():
     
     print("✅ Settings file created!")
 
-def start_demo():
+def start_demo(reset=False):
     """Start the weather station demo"""
     
     print("🌤️ Weather Station Demo - Raspberry Pi Version")
@@ -137,17 +142,25 @@ def start_demo():
     # Create necessary directories
     os.makedirs('data', exist_ok=True)
     os.makedirs('logs', exist_ok=True)
-    os.makedirs('templates', exist_ok=True)
-    os.makedirs('static/css', exist_ok=True)
-    os.makedirs('static/js', exist_ok=True)
     
-    # Create sample data
-    print("Creating sample weather data...")
-    create_sample_data()
+    if reset:
+        # Shard files and the archive would otherwise bring the old readings back
+        spilled = glob.glob('data/ingest-spill*.ndjson')
+        for path in ['data/weather.db', 'data/weather.db-wal', 'data/weather.db-shm', 'data/settings.json'] + spilled:
+            if os.path.exists(path):
+                os.remove(path)
+        for directory in ('data/shards', 'data/archive'):
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    # Create sample data (a restart keeps the database and what it collected)
+    if not os.path.exists('data/weather.db'):
+        print("Creating sample weather data...")
+        create_sample_data()
     
     # Create settings
-    print("Creating settings file...")
-    create_settings()
+    if not os.path.exists('data/settings.json'):
+        print("Creating settings file...")
+        create_settings()
     
     print("\n🚀 Starting Weather Station...")
     print("Web interface: http://localhost:5000")
@@ -168,4 +181,8 @@ def start_demo():
         print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
-    start_demo()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Weather Station demo with sample data")
+    parser.add_argument('--reset', action='store_true', help="recreate the sample database and settings (removes shards, archive and spilled readings)")
+    args, server_args = parser.parse_known_args()
+    sys.argv[1:] = server_args  # the rest (--server, --port, ...) is for weather_station.main()
+    start_demo(args.reset)
\ No newline at end of file
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Vectorized range statistics for the Weather Station
+A device/time slice is read as columnar NumPy arrays, a chunk of rows at
+a time, and every statistic is computed on whole arrays. StatsAccumulator
+folds the chunks in, so statistics over years of raw readings need memory
+for the distinct values only, not for the rows.
+"""
+
+import numpy as np
+
+from rollups import RESOLUTIONS
+
+STAT_FIELDS = (
+    'temp_out_c', 'temp_in_c', 'humidity_out', 'humidity_in',
+    'barometric_pressure_rel_in', 'windspeed_kmh', 'wind_gust_kmh',
+    'solar_radiation_wm2', 'uv_index',
+)
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+WIND_ROSE_SECTORS = 16
+WIND_ROSE_SPEED_BINS = (0, 5, 10, 20, 30, 50, np.inf)  # km/h
+
+FETCH_CHUNK = 50000
+
+# Column layout of load_raw / iter_raw / load_rollup
+RAW_COLUMNS = ('epoch', 'wind_direction') + STAT_FIELDS
+
+
+def _fetch_columns(cursor, names):
+    """Drain a cursor into one float64 array per column (NULL becomes NaN)"""
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(FETCH_CHUNK)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64))
+    if chunks:
+        matrix = np.concatenate(chunks)
+    else:
+        matrix = np.empty((0, len(names)))
+    return {name: matrix[:, i] for i, name in enumerate(names)}
+
+
+def iter_raw(conn, device_id, start, end, archived=()):
+    """Raw readings as columns, FETCH_CHUNK rows at a time; 'epoch' is seconds of the station's local datetime
+
+    `archived` are batches of archived readings (Archive.iter_batches), yielded first.
+    """
+    for batch in archived:
+        yield {name: batch[name].astype(np.float64) for name in RAW_COLUMNS}
+    cursor = conn.execute(f'''
+        SELECT CAST(strftime('%s', datetime) AS INTEGER), wind_direction, {', '.join(STAT_FIELDS)}
+        FROM weather_data
+        WHERE device_id = ? AND datetime >= ? AND datetime <= ?
+    ''', (device_id, start, end))
+    while True:
+        rows = cursor.fetchmany(FETCH_CHUNK)
+        if not rows:
+            return
+        matrix = np.array(rows, dtype=np.float64)
+        yield {name: matrix[:, i] for i, name in enumerate(RAW_COLUMNS)}
+
+
+def load_raw(conn, device_id, start, end):
+    """Load raw readings as columns in one piece (see iter_raw)"""
+    return _fetch_columns(conn.execute(f'''
+        SELECT CAST(strftime('%s', datetime) AS INTEGER), wind_direction, {', '.join(STAT_FIELDS)}
+        FROM weather_data
+        WHERE device_id = ? AND datetime >= ? AND datetime <= ?
+    ''', (device_id, start, end)), RAW_COLUMNS)
+
+
+def load_rollup(conn, resolution, device_id, start, end):
+    """Load bucket means from a rollup table in the same column layout as load_raw"""
+    table, prefix, suffix, _ = RESOLUTIONS[resolution]
+    means = ', '.join(f'{field}_sum / NULLIF({field}_n, 0)' for field in STAT_FIELDS)
+    names = ('epoch', 'wind_u_sum', 'wind_v_sum', 'wind_dir_n') + STAT_FIELDS
+    cursor = conn.execute(f'''
+        SELECT CAST(strftime('%s', bucket) AS INTEGER), wind_u_sum, wind_v_sum, wind_dir_n, {means}
+        FROM {table}
+        WHERE device_id = ? AND bucket >= ? AND bucket <= ?
+    ''', (device_id, start[:prefix] + suffix, end))
+    columns = _fetch_columns(cursor, names)
+
+    u, v, n = columns.pop('wind_u_sum'), columns.pop('wind_v_sum'), columns.pop('wind_dir_n')
+    direction = np.degrees(np.arctan2(u, v)) % 360
+    direction[~(n > 0)] = np.nan
+    columns['wind_direction'] = direction
+    return columns
+
+
+def dew_point(temp_c, humidity):
+    """Dew point in °C (Magnus formula)"""
+    a, b = 17.62, 243.12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = np.log(np.clip(humidity, 1, 100) / 100.0) + a * temp_c / (b + temp_c)
+        return b * gamma / (a - gamma)
+
+
+def heat_index(temp_c, humidity):
+    """Heat index in °C (NOAA Rothfusz regression, simple formula below 80 °F)"""
+    t = temp_c * 9.0 / 5.0 + 32.0
+    hi = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + humidity * 0.094)
+    # The full regression only applies to hot readings, evaluate it on those alone
+    hot = (hi + t) / 2.0 >= 80.0
+    t, rh = t[hot], humidity[hot]
+    hi[hot] = (-42.379 + t * (2.04901523 - 6.83783e-3 * t)
+               + rh * (10.14333127 - 0.22475541 * t + 1.22874e-3 * t * t)
+               + rh * rh * (-5.481717e-2 + 8.5282e-4 * t - 1.99e-6 * t * t))
+    return (hi - 32.0) * (5.0 / 9.0)
+
+
+def _distinct(values):
+    """Sorted distinct values of an array and how often each occurs, NaN left out"""
+    values = values[~np.isnan(values)]
+    return np.unique(values, return_counts=True)
+
+
+def _merge_distinct(first, second):
+    values = np.concatenate([first[0], second[0]])
+    if not first[0].size or not second[0].size:
+        return values, np.concatenate([first[1], second[1]])
+    merged, inverse = np.unique(values, return_inverse=True)
+    return merged, np.bincount(inverse, weights=np.concatenate([first[1], second[1]])).astype(np.int64)
+
+
+def summarize_distinct(values, counts):
+    """summarize() of the array holding each of the sorted `values` counts[i] times"""
+    n = int(counts.sum())
+    if n == 0:
+        return {'count': 0}
+    mean = float(np.dot(values, counts) / n)
+    result = {
+        'count': n,
+        'mean': mean,
+        'std': float(np.sqrt(np.dot((values - mean) ** 2, counts) / n)),
+        'min': float(values[0]),
+        'max': float(values[-1]),
+    }
+    # np.percentile's linear interpolation between the ranks around p * (n - 1)
+    ends = np.cumsum(counts)
+    ranks = np.asarray(PERCENTILES, dtype=np.float64) / 100.0 * (n - 1)
+    below = np.floor(ranks)
+    low = values[np.searchsorted(ends, below, side='right')]
+    high = values[np.searchsorted(ends, np.minimum(below + 1, n - 1), side='right')]
+    for p, value in zip(PERCENTILES, low + (high - low) * (ranks - below)):
+        result[f'p{p}'] = float(value)
+    return result
+
+
+def summarize(values):
+    """count / mean / std / min / max / percentiles of an array, ignoring NaN"""
+    return summarize_distinct(*_distinct(values))
+
+
+def _wind_rose_counts(direction, speed):
+    valid = ~(np.isnan(direction) | np.isnan(speed))
+    direction, speed = direction[valid], speed[valid]
+    width = 360.0 / WIND_ROSE_SECTORS
+    speed_bins = len(WIND_ROSE_SPEED_BINS) - 1
+    sector = ((direction + width / 2) * (1.0 / width)).astype(np.int32) % WIND_ROSE_SECTORS
+    cell = np.searchsorted(np.asarray(WIND_ROSE_SPEED_BINS[1:-1]), speed, side='right').astype(np.int32)
+    cell += sector * speed_bins
+    return np.bincount(cell, minlength=WIND_ROSE_SECTORS * speed_bins).reshape(WIND_ROSE_SECTORS, speed_bins)
+
+
+def _wind_rose_result(counts):
+    width = 360.0 / WIND_ROSE_SECTORS
+    samples = int(counts.sum())
+    return {
+        'sectors': [float(i * width) for i in range(WIND_ROSE_SECTORS)],
+        'speed_bins_kmh': [float(edge) for edge in WIND_ROSE_SPEED_BINS[:-1]],
+        'frequency_pct': (counts * 100.0 / max(samples, 1)).round(3).tolist(),
+        'samples': samples,
+    }
+
+
+def wind_rose(direction, speed):
+    """Frequency (%) of readings per direction sector and speed bin"""
+    return _wind_rose_result(_wind_rose_counts(direction, speed))
+
+
+def _daily_sums(epoch, temp_c):
+    """Days (epoch // 86400) with temperatures, and the sum and count of each day's"""
+    valid = ~(np.isnan(epoch) | np.isnan(temp_c))
+    days, inverse = np.unique(epoch[valid].astype(np.int64) // 86400, return_inverse=True)
+    return days, np.bincount(inverse, weights=temp_c[valid], minlength=days.size), np.bincount(inverse, minlength=days.size)
+
+
+def _degree_days_result(daily_mean, base_c):
+    return {
+        'base_c': base_c,
+        'days': int(daily_mean.size),
+        'heating': float(np.clip(base_c - daily_mean, 0, None).sum()),
+        'cooling': float(np.clip(daily_mean - base_c, 0, None).sum()),
+    }
+
+
+def degree_days(epoch, temp_c, base_c):
+    """Heating / cooling degree-days from daily mean temperatures"""
+    _, sums, counts = _daily_sums(epoch, temp_c)
+    return _degree_days_result(sums / counts, base_c)
+
+
+class StatsAccumulator:
+    """compute_stats over column sets added one at a time (chunks of a long raw slice)
+
+    Per field it keeps the distinct values with their counts: readings
+    repeat (a temperature in tenths of a degree takes a few hundred
+    values), so memory follows the distinct values rather than the rows,
+    while mean, std and percentiles come out as over all rows at once.
+    The wind rose and the daily temperature sums are plain counters.
+    """
+
+    SUMMARIES = STAT_FIELDS + ('dew_point_c', 'heat_index_c')
+
+    def __init__(self):
+        empty = (np.empty(0), np.empty(0, dtype=np.int64))
+        self.distinct = {name: empty for name in self.SUMMARIES}
+        self.rose = np.zeros((WIND_ROSE_SECTORS, len(WIND_ROSE_SPEED_BINS) - 1), dtype=np.int64)
+        self.days = {}  # day -> [temperature sum, readings]
+        self.rows = 0
+
+    def add(self, columns):
+        """Fold in a column set in the layout of RAW_COLUMNS"""
+        self.rows += int(columns['epoch'].size)
+        derived = {
+            'dew_point_c': dew_point(columns['temp_out_c'], columns['humidity_out']),
+            'heat_index_c': heat_index(columns['temp_out_c'], columns['humidity_out']),
+        }
+        for name in self.SUMMARIES:
+            values = derived[name] if name in derived else columns[name]
+            self.distinct[name] = _merge_distinct(self.distinct[name], _distinct(values))
+        self.rose += _wind_rose_counts(columns['wind_direction'], columns['windspeed_kmh'])
+        for day, total, count in zip(*(part.tolist() for part in _daily_sums(columns['epoch'], columns['temp_out_c']))):
+            sums = self.days.setdefault(day, [0.0, 0])
+            sums[0] += total
+            sums[1] += count
+
+    def result(self, base_c=18.0):
+        summaries = {name: summarize_distinct(*self.distinct[name]) for name in self.SUMMARIES}
+        daily_mean = np.array([total / count for total, count in self.days.values()])
+        return {
+            'fields': {field: summaries[field] for field in STAT_FIELDS},
+            'dew_point_c': summaries['dew_point_c'],
+            'heat_index_c': summaries['heat_index_c'],
+            'wind_rose': _wind_rose_result(self.rose),
+            'degree_days': _degree_days_result(daily_mean, base_c),
+        }
+
+
+def compute_stats(columns, base_c=18.0):
+    """All statistics for a column set produced by load_raw / load_rollup"""
+    accumulator = StatsAccumulator()
+    accumulator.add(columns)
+    return accumulator.result(base_c)
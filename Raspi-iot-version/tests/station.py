@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+The Flask app for tests that go through its routes
+weather_station keeps its state in the module, so the test files share one
+app, started once per test run in a temporary directory (data/ and logs/
+are relative to the working directory); each test uses its own device ids.
+"""
+
+import atexit
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import weather_station  # noqa: E402
+
+_tmpdir = None
+
+
+def start():
+    """The weather_station module with its app created, the database migrated and the ingest writers running"""
+    global _tmpdir
+    if _tmpdir is None:
+        _tmpdir = tempfile.mkdtemp()
+        os.chdir(_tmpdir)
+        weather_station.create_app()
+        logging.getLogger().setLevel(logging.WARNING)  # serial lines are not echoed to the console
+        weather_station.load_settings()
+        weather_station.init_database()
+        for shard in weather_station.shards:
+            shard.ingest_queue.start()
+            shard.warmed.wait()
+        atexit.register(_stop)
+    return weather_station
+
+
+def _stop():
+    weather_station.shutdown_ingest()
+    os.chdir(os.path.dirname(_tmpdir))
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+
+def wait_for(condition, timeout=5.0):
+    """Poll until condition() is true, e.g. until the ingest writer stored a reading"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def stored(device_id):
+    """Readings of a device in weather_data, oldest first"""
+    db = weather_station.shards.database(device_id)
+    return [dict(row) for row in db.query('SELECT * FROM weather_data WHERE device_id = ? ORDER BY datetime',
+                                          (device_id,))]
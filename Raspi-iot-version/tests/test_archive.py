@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Columnar archive: moving old readings out, and keeping them out of a replayed backlog"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive as archive_module  # noqa: E402
+from archive import Archive  # noqa: E402
+from fields import parse_timestamp  # noqa: E402
+from schema import migrate  # noqa: E402
+import weather_station  # noqa: E402
+
+NOW = datetime(2026, 6, 1)
+OLD = ['2026-01-10 07:00:00', '2026-01-10 07:01:00', '2026-02-02 12:00:00']
+
+
+class CountingLock:
+    def __init__(self):
+        self.acquired = 0
+
+    def __enter__(self):
+        self.acquired += 1
+
+    def __exit__(self, *exc):
+        return False
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'archive')
+        self.conn = sqlite3.connect(':memory:')
+        migrate(self.conn)
+        self.conn.executemany('INSERT INTO weather_data (device_id, datetime, temp_out_c) VALUES (1, ?, 20.0)',
+                              [(stamp,) for stamp in OLD + ['2026-05-31 07:00:00']])
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_moves_old_readings(self):
+        archive = Archive(self.root, archive_after_days=90)
+        self.assertEqual(archive.run(self.conn, now=NOW), 3)
+        self.assertEqual(self.conn.execute('SELECT datetime FROM weather_data').fetchall(), [('2026-05-31 07:00:00',)])
+        self.assertEqual(archive.archived_epochs(1, 0, 2 ** 40), {parse_timestamp(stamp) for stamp in OLD})
+        self.assertEqual(archive.archived_epochs(2, 0, 2 ** 40), set())
+
+    def test_partitions_written_and_deleted_in_chunks(self):
+        january = [f'2026-01-11 07:{minute:02d}:00' for minute in range(7)]
+        for fmt in ('npz', 'parquet') if archive_module.pq is not None else ('npz',):
+            with self.subTest(fmt=fmt):
+                conn = sqlite3.connect(':memory:')
+                migrate(conn)
+                conn.executemany('INSERT INTO weather_data (device_id, datetime, temp_out_c) VALUES (1, ?, ?)',
+                                 [(stamp, float(n)) for n, stamp in enumerate(OLD + january + ['2026-05-31 07:00:00'])])
+                conn.commit()
+                lock = CountingLock()
+                archive = Archive(os.path.join(self.tmpdir, fmt), archive_after_days=90, batch_rows=3, delete_chunk=4)
+                archive.format = fmt
+                self.assertEqual(archive.run(conn, now=NOW, write_lock=lock), 10)
+                entry = archive.manifest()['partitions']['1/2026-01']
+                self.assertEqual((entry['rows'], entry['format']), (9, fmt))
+                temperatures = archive.load_columns(1, 0, 2 ** 40, ('temp_out_c',))['temp_out_c']
+                self.assertEqual(sorted(temperatures.tolist()), list(range(10)))
+                self.assertEqual(conn.execute('SELECT COUNT(*) FROM weather_data').fetchone()[0], 1)
+                self.assertEqual(lock.acquired, 4)  # January's 9 rows 4 at a time, February's 1
+                conn.close()
+
+    def test_rerun_after_crash_does_not_duplicate(self):
+        archive = Archive(self.root, archive_after_days=90, batch_rows=2)
+        archive.run(self.conn, now=NOW)
+        # A crash between the manifest and the delete leaves archived rows in weather_data
+        self.conn.executemany('INSERT INTO weather_data (id, device_id, datetime, temp_out_c) VALUES (?, 1, ?, 20.0)',
+                              [(1, OLD[0]), (2, OLD[1])])
+        self.conn.execute("INSERT INTO weather_data (device_id, datetime, temp_out_c) VALUES (1, '2026-01-12 07:00:00', 21.0)")
+        self.conn.commit()
+        self.assertEqual(archive.run(self.conn, now=NOW), 3)
+        entry = archive.manifest()['partitions']['1/2026-01']
+        self.assertEqual(entry['rows'], 3)
+        self.assertEqual(len(archive.archived_epochs(1, 0, 2 ** 40)), 4)
+
+    def test_partition_written_in_one_piece_is_extended(self):
+        archive = Archive(self.root, archive_after_days=90)
+        archive.format = 'npz'
+        path = os.path.join(self.root, 'device=1', '2026-01.npz')
+        os.makedirs(os.path.dirname(path))
+        old = {name: np.zeros(1, dtype=np.int64 if name in archive_module.INT_COLUMNS else np.float64)
+               for name in archive_module.ARCHIVE_COLUMNS}
+        old['id'][0], old['device_id'][0], old['epoch'][0], old['temp_out_c'][0] = 100, 1, 1767225600, 5.0
+        np.savez_compressed(path, **old)
+        archive._save_manifest({'partitions': {'1/2026-01': {
+            'device_id': 1, 'month': '2026-01', 'path': 'device=1/2026-01.npz', 'format': 'npz',
+            'rows': 1, 'min_epoch': 1767225600, 'max_epoch': 1767225600, 'bytes': os.path.getsize(path)}}})
+        archive.run(self.conn, now=NOW)
+        temperatures = archive.load_columns(1, 0, 2 ** 40, ('temp_out_c',))['temp_out_c']
+        self.assertEqual(sorted(temperatures.tolist()), [5.0, 20.0, 20.0, 20.0])
+
+    def test_manifest_written_by_another_process_is_reread(self):
+        reader = Archive(self.root)
+        self.assertEqual(reader.manifest()['partitions'], {})
+        Archive(self.root, archive_after_days=90).run(self.conn, now=NOW)
+        self.assertEqual(sorted(reader.manifest()['partitions']), ['1/2026-01', '1/2026-02'])
+
+    def test_replayed_backlog_skips_archived_readings(self):
+        Archive(self.root, archive_after_days=90).run(self.conn, now=NOW)
+        config = weather_station.config
+        saved = config.archive_dir, weather_station._archive
+        config.archive_dir, weather_station._archive = self.root, None
+        try:
+            fresh = weather_station.drop_duplicate_readings(self.conn, [
+                {'device_id': 1, 'datetime': OLD[0]},  # archived
+                {'device_id': 1, 'datetime': '2026-01-10 07:02:00'},  # never stored
+                {'device_id': 1, 'datetime': '2026-05-31 07:00:00'},  # still in weather_data
+                {'device_id': 2, 'datetime': OLD[1]},  # another device
+            ])
+        finally:
+            config.archive_dir, weather_station._archive = saved
+        self.assertEqual([(data['device_id'], data['datetime']) for data in fresh],
+                         [(1, '2026-01-10 07:02:00'), (2, OLD[1])])
+
+
+if __name__ == '__main__':
+    unittest.main()
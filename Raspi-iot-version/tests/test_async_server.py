@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""The asyncio server (async_server.py, needs aiohttp) over the shared test app's state"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_server  # noqa: E402
+import station  # noqa: E402
+
+
+class AsyncServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.station = station.start()
+        self.client = TestClient(TestServer(async_server.create_app(self.station)))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def test_json_reading_is_queued_and_stored(self):
+        response = await self.client.post('/api/weather', json={'device_id': 8001, 'datetime': '2026-10-01 07:00:00',
+                                                                'temp_out_c': 18.5, 'humidity_out': 'x'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(list((await response.json())['errors']), ['humidity_out'])
+        await asyncio.to_thread(station.wait_for, lambda: station.stored(8001))
+        self.assertEqual(station.stored(8001)[0]['temp_out_c'], 18.5)
+
+        latest = await self.client.get('/api/weather/latest', params={'device': '8001'})
+        self.assertEqual((await latest.json())['datetime'], '2026-10-01 07:00:00')
+        self.assertEqual((await self.client.get('/api/weather/latest', params={'device': 'x'})).status, 404)
+        self.assertEqual((await self.client.post('/api/weather', data=b'[1]')).status, 400)
+
+    async def test_form_reading(self):
+        response = await self.client.post('/post', data={'id': '8002', 'dateutc': '2026-10-01 00:00:00', 'tempf': '50'})
+        self.assertEqual((response.status, await response.text()), (200, "Data queued for database."))
+        await asyncio.to_thread(station.wait_for, lambda: station.stored(8002))
+        self.assertEqual(station.stored(8002)[0]['datetime'], '2026-10-01 07:00:00')
+        self.assertEqual((await self.client.post('/post', data={'id': 'x'})).status, 400)
+
+    async def test_serial_cursor_and_stream(self):
+        self.station.add_to_serial_buffer("async serial test")
+        last = self.station.serial_buffer.last_seq
+        result = await (await self.client.get('/serial', params={'since': str(last - 1)})).json()
+        self.assertEqual(result['seq'], last)
+        self.assertTrue(result['lines'][0].endswith("async serial test"))
+
+        response = await self.client.get('/serial/stream', headers={'Last-Event-ID': str(last - 1)})
+        self.assertEqual(response.headers['Content-Type'], 'text/event-stream')
+        self.assertEqual(await response.content.readline(), f"id: {last}\n".encode())
+        self.assertTrue((await response.content.readline()).rstrip().endswith(b"async serial test"))
+        response.close()
+
+    async def test_metrics(self):
+        await self.client.get('/api/weather/latest', params={'device': '8003'})
+        text = await (await self.client.get('/metrics')).text()
+        self.assertIn('route="/api/weather/latest"', text)
+        metrics = (await (await self.client.get('/metrics', params={'format': 'json'})).json())['metrics']
+        self.assertIn('weather_readings_received_total', metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Compact binary reading format (binary.py) and its UDP listener"""
+
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from binary import (ACK, ACK_OK, HEADER, MAX_DATAGRAM_RECORDS, RECORD, BinaryFormatError,  # noqa: E402
+                    UDPListener, decode, encode, encode_datagrams)
+
+
+class BinaryTest(unittest.TestCase):
+    def test_round_trip(self):
+        readings = [
+            {'device_id': 7, 'ts': 1767225600, 'temp_out_c': -12.3, 'humidity_out': 68,
+             'barometric_pressure_rel_in': 29.921, 'total_rain_in': 1234.567, 'wh65_batt': 2.95},
+            {'device_id': 0, 'ts': None, 'windspeed_kmh': 0.0},
+        ]
+        message = encode(readings)
+        self.assertEqual(len(message), HEADER.size + 2 * RECORD.size)
+        first, second = decode(message, 1, 7)
+
+        self.assertEqual(first['device_id'], 7)
+        self.assertEqual((first['temp_out_c'], first['humidity_out']), (-12.3, 68))
+        self.assertEqual((first['barometric_pressure_rel_in'], first['total_rain_in']), (29.921, 1234.567))
+        self.assertEqual(first['wh65_batt'], 2.95)
+        self.assertIsNone(first['temp_in_c'])  # absent, not zero
+        self.assertEqual((first['ts'], first['datetime']), (1767225600, '2026-01-01 07:00:00'))
+
+        self.assertEqual(second['device_id'], 1)  # 0 stands for the settings id
+        self.assertEqual(second['windspeed_kmh'], 0.0)  # a measured zero stays a zero
+        self.assertEqual((second['ts'], second['datetime']), (None, ''))
+
+    def test_malformed_messages(self):
+        message = encode([{'device_id': 1, 'ts': 1}])
+        for bad in (b'', b'WS', b'XX' + message[2:], message[:2] + b'\x09' + message[3:], message[:-1]):
+            with self.assertRaises(BinaryFormatError):
+                decode(bad, 1, 0)
+
+    def test_one_record_without_ts_per_device(self):
+        # They would share the arrival second and be stored as one reading
+        self.assertEqual(len(decode(encode([{'device_id': 2}, {'device_id': 3}, {'device_id': 2, 'ts': 1}]), 1, 0)), 3)
+        for readings in ([{'device_id': 2}, {'device_id': 2}], [{'device_id': 0}, {'device_id': 1}]):
+            with self.assertRaises(BinaryFormatError):
+                decode(encode(readings), 1, 0)
+
+    def test_value_out_of_range(self):
+        with self.assertRaises(ValueError):
+            encode([{'device_id': 1, 'humidity_out': 300}])
+
+    def test_datagrams_fit_mtu(self):
+        readings = [{'device_id': 1, 'ts': 1700000000 + i} for i in range(MAX_DATAGRAM_RECORDS * 2 + 1)]
+        messages = encode_datagrams(readings)
+        self.assertEqual(len(messages), 3)
+        self.assertTrue(all(len(message) <= 1472 for message in messages))
+        self.assertEqual(sum(len(decode(message, 1, 0)) for message in messages), len(readings))
+
+
+class UDPListenerTest(unittest.TestCase):
+    def test_only_well_formed_datagrams_are_answered(self):
+        handled = []
+        listener = UDPListener('127.0.0.1', 0, lambda buffer: handled.append(bytes(buffer)) or (ACK_OK, 1))
+        listener.start()
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.settimeout(2)
+        try:
+            message = encode([{'device_id': 1, 'ts': 1}])
+            for bad in (b'x', b'XX' + message[2:], message[:-1], message + b'\0'):
+                client.sendto(bad, ('127.0.0.1', listener.port))
+            client.sendto(message, ('127.0.0.1', listener.port))
+            self.assertEqual(ACK.unpack(client.recv(64)), (b'WS', 1, ACK_OK, 1))
+            client.settimeout(0.2)
+            with self.assertRaises(socket.timeout):
+                client.recv(64)
+        finally:
+            client.close()
+            listener.stop()
+        self.assertEqual(handled, [message])
+        self.assertEqual(listener.dropped, 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Bulk ingest: the streaming body parser (bulk.py) and /api/weather/bulk"""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk import BulkFormatError, iter_records  # noqa: E402
+import station  # noqa: E402
+
+
+def records(body, fmt=None, chunk_size=7):
+    """Records of a bulk body, read in small chunks so values straddle chunk boundaries"""
+    return list(iter_records(io.BytesIO(body.encode('utf-8')), fmt, chunk_size=chunk_size))
+
+
+class BulkTest(unittest.TestCase):
+    def test_json_array(self):
+        body = json.dumps([{'device_id': 1, 'temp_out_c': 20.5}, {'device_id': 2, 'temp_out_c': 12345}])
+        self.assertEqual(records(body), [(1, {'device_id': 1, 'temp_out_c': 20.5}, None),
+                                         (2, {'device_id': 2, 'temp_out_c': 12345}, None)])
+        self.assertEqual(records('[]'), [])
+
+    def test_malformed_json_array_raises(self):
+        with self.assertRaises(BulkFormatError):
+            records('[{"a": 1} {"b": 2}]')
+        with self.assertRaises(BulkFormatError):
+            records('[{"a": 1},')
+
+    def test_ndjson_reports_bad_lines_and_continues(self):
+        result = records('{"device_id": 1}\n\nnot json\r\n{"device_id": 2}\n')
+        self.assertEqual([(number, record) for number, record, _ in result],
+                         [(1, {'device_id': 1}), (3, None), (4, {'device_id': 2})])
+        self.assertTrue(result[1][2].startswith('invalid JSON'))
+
+    def test_csv_default_columns_and_header(self):
+        (_, record, error), = records('2026-01-01 07:00:00,5.5,180\n')
+        self.assertIsNone(error)
+        self.assertEqual(record, {'datetime': '2026-01-01 07:00:00', 'windspeed_kmh': '5.5', 'wind_direction': '180'})
+
+        result = records('device_id,datetime,temp_out_c\n4,2026-01-01 07:00:00,19.0\n')
+        self.assertEqual(result, [(2, {'device_id': '4', 'datetime': '2026-01-01 07:00:00', 'temp_out_c': '19.0'},
+                                   None)])
+
+    def test_csv_row_with_too_many_values(self):
+        (_, record, error), = records('device_id,datetime\n1,2,3\n')
+        self.assertIsNone(record)
+        self.assertIn('at most 2 values', error)
+
+    def test_format_is_sniffed(self):
+        self.assertEqual(records('  [{"x": 1}]')[0][1], {'x': 1})
+        self.assertEqual(records('{"x": 1}\n{"x": 2}')[1][1], {'x': 2})
+        self.assertEqual(records('2026-01-01 07:00:00')[0][1], {'datetime': '2026-01-01 07:00:00'})
+
+
+class BulkEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = station.start().app.test_client()
+
+    def post(self, body, **query):
+        return self.client.post('/api/weather/bulk', query_string=query, data=body)
+
+    def test_ndjson_backlog_is_stored_once(self):
+        body = '\n'.join(json.dumps({'idws': 7101, 'date': f'2026-01-01 07:0{minute}:00', 'temp_out': 20 + minute})
+                         for minute in range(3)) + '\nnot json\n'
+        response = self.post(body, format='ndjson')
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()
+        self.assertEqual((result['received'], result['stored'], result['rejected']), (4, 3, 1))
+        self.assertEqual(result['errors'][0]['record'], 4)
+        self.assertEqual([row['temp_out_c'] for row in station.stored(7101)], [20, 21, 22])
+
+        # Replaying the same backlog stores nothing twice
+        result = self.post(body, format='ndjson').get_json()
+        self.assertEqual((result['stored'], result['duplicates']), (0, 3))
+        self.assertEqual(len(station.stored(7101)), 3)
+
+    def test_csv_lines_take_device_from_query(self):
+        result = self.post('2026-01-02 07:00:00,5.5,180\n2026-01-02 07:00:03,6.0,190\n',
+                           format='csv', device=7102).get_json()
+        self.assertEqual(result['stored'], 2)
+        self.assertEqual([(row['windspeed_kmh'], row['wind_direction']) for row in station.stored(7102)],
+                         [(5.5, 180), (6.0, 190)])
+
+    def test_reading_without_timestamp_is_rejected(self):
+        result = self.post(json.dumps([{'idws': 7103, 'temp_out': 20}])).get_json()
+        self.assertEqual((result['stored'], result['rejected']), (0, 1))
+        self.assertIn('datetime', result['errors'][0]['error'])
+
+    def test_malformed_array_keeps_records_before_the_error(self):
+        response = self.post('[{"idws": 7104, "date": "2026-01-03 07:00:00"} {"idws": 7104}]')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(station.stored(7104)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
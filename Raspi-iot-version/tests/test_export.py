@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Streaming CSV / NDJSON export (export.py) and /api/weather/export"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export import iter_export  # noqa: E402
+import station  # noqa: E402
+
+
+class IterExportTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('CREATE TABLE t (id INTEGER, name TEXT, value REAL)')
+        self.conn.executemany('INSERT INTO t VALUES (?, ?, ?)', [(i, f'row, "{i}"', i / 2) for i in range(25)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def cursor(self):
+        return self.conn.execute('SELECT * FROM t ORDER BY id')
+
+    def test_csv_in_pages(self):
+        chunks = list(iter_export(self.cursor(), 'csv', page_size=10))
+        self.assertEqual(len(chunks), 3)  # header with the first page, then a chunk per page
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual(rows[0], ['id', 'name', 'value'])
+        self.assertEqual(rows[4], ['3', 'row, "3"', '1.5'])
+        self.assertEqual(len(rows), 26)
+
+    def test_ndjson(self):
+        lines = b''.join(iter_export(self.cursor(), 'ndjson', page_size=7)).decode().splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[24]), {'id': 24, 'name': 'row, "24"', 'value': 12.0})
+
+    def test_gzip_matches_plain(self):
+        plain = b''.join(iter_export(self.cursor(), 'csv', page_size=4))
+        self.assertEqual(gzip.decompress(b''.join(iter_export(self.cursor(), 'csv', compress=True, page_size=4))),
+                         plain)
+
+    def test_empty_csv_has_header(self):
+        cursor = self.conn.execute('SELECT * FROM t WHERE id < 0')
+        self.assertEqual(b''.join(iter_export(cursor, 'csv')), b'id,name,value\n')
+
+
+class ExportEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+        cls.station.save_weather_batch([
+            {'device_id': 7401, 'datetime': f'2026-04-0{day} 07:00:00', 'temp_out_c': float(day)} for day in range(1, 6)
+        ], publish=False)
+
+    def export(self, **query):
+        response = self.client.get('/api/weather/export', query_string=dict(query, device=7401))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        return response
+
+    def test_device_and_range_filter(self):
+        response = self.export(**{'from': '2026-04-02', 'to': '2026-04-04 23:59:59'})
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([(row['device_id'], row['temp_out_c']) for row in rows],
+                         [('7401', '2.0'), ('7401', '3.0'), ('7401', '4.0')])
+        self.assertIn('weather_data.csv', response.headers['Content-Disposition'])
+
+    def test_ndjson_gzip(self):
+        response = self.export(format='ndjson', compress='gzip')
+        self.assertEqual(response.mimetype, 'application/gzip')
+        lines = gzip.decompress(response.get_data()).decode().splitlines()
+        self.assertEqual([json.loads(line)['datetime'] for line in lines],
+                         [f'2026-04-0{day} 07:00:00' for day in range(1, 6)])
+
+    def test_archived_readings_come_first(self):
+        self.station.save_weather_batch([
+            {'device_id': 7402, 'datetime': f'2026-01-0{day} 07:00:00', 'ts': 1767225600 + (day - 1) * 86400,
+             'temp_out_c': float(day), 'humidity_out': 50 + day} for day in range(1, 4)
+        ] + [{'device_id': 7402, 'datetime': '2026-04-01 07:00:00', 'temp_out_c': 9.5}], publish=False)
+        archive = self.station.get_archive()
+        conn = self.station.shards.database(7402).connection()
+        self.assertEqual(archive.archive_partition(conn, 7402, '2026-01', '2026-02-01 00:00:00'), 3)
+
+        response = self.client.get('/api/weather/export', query_string={'device': 7402, 'from': '2026-01-02'})
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([(row['datetime'], row['temp_out_c'], row['humidity_out']) for row in rows],
+                         [('2026-01-02 07:00:00', '2.0', '52'), ('2026-01-03 07:00:00', '3.0', '53'),
+                          ('2026-04-01 07:00:00', '9.5', '')])
+        self.assertEqual((rows[0]['ts'], rows[0]['created_at']), ('1767312000', ''))
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/weather/export?format=xlsx').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
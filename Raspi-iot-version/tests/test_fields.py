@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Form and JSON reading parser (fields.py): units, datetimes and per-field errors"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fields import parse_form, parse_json, parse_timestamp  # noqa: E402
+
+
+class FieldsTest(unittest.TestCase):
+    def test_form_converts_units_and_shifts_datetime(self):
+        data, errors = parse_form({'id': '3', 'tempf': '212', 'windspeedmph': '10', 'humidity': '68.0',
+                                   'dateutc': '2026-01-01 00:00:00'}, 1, 7)
+        self.assertEqual(errors, {})
+        self.assertEqual(data['device_id'], 3)
+        self.assertAlmostEqual(data['temp_out_c'], 100.0)
+        self.assertAlmostEqual(data['windspeed_kmh'], 16.0934)
+        self.assertEqual(data['humidity_out'], 68)
+        self.assertEqual(data['ts'], parse_timestamp('2026-01-01 00:00:00'))
+        self.assertEqual(data['datetime'], '2026-01-01 07:00:00')
+
+    def test_missing_fields_are_none_not_zero(self):
+        data, errors = parse_form({'tempf': '50'}, 5, 7)
+        self.assertEqual(errors, {})
+        self.assertEqual(data['device_id'], 5)
+        self.assertIsNone(data['temp_in_c'])
+        self.assertIsNone(data['wind_direction'])
+        self.assertEqual((data['datetime'], data['ts']), ('', None))
+
+    def test_malformed_values_are_reported(self):
+        data, errors = parse_form({'id': 'x', 'tempf': 'warm', 'dateutc': '2026-01-01'}, 1, 7)
+        self.assertEqual(set(errors), {'id', 'tempf', 'dateutc'})
+        self.assertEqual(data['device_id'], 1)
+        self.assertIsNone(data['temp_out_c'])
+
+    def test_json_accepts_firmware_keys(self):
+        data, errors = parse_json({'idws': 2, 'temp_out': 21.5, 'winddir': '90', 'date': '2026-01-01 07:00:00'}, 1, 7)
+        self.assertEqual(errors, {})
+        self.assertEqual((data['device_id'], data['temp_out_c'], data['wind_direction']), (2, 21.5, 90))
+        self.assertEqual(data['datetime'], '2026-01-01 07:00:00')
+        self.assertEqual(data['ts'], parse_timestamp('2026-01-01 00:00:00'))
+
+    def test_json_datetime_is_stored_canonical(self):
+        data, errors = parse_json({'datetime': '2026-01-01T07:00:00'}, 1, 7)
+        self.assertEqual((errors, data['datetime']), ({}, '2026-01-01 07:00:00'))
+
+    def test_timestamp_fields_are_range_checked(self):
+        self.assertEqual(parse_timestamp('2028-02-29 23:59:59'), 1835481599)
+        for value in ('2026-13-01 00:00:00', '2026-02-29 00:00:00', '2026-01-00 00:00:00', '2026-01-01 24:00:00',
+                      '2026-01-01 99:00:00', '2026-01-01 00:60:00', '2026-01-01 00:00:60', '2026-01-01 +1:00:00',
+                      '2026-01-01x00:00:00'):
+            with self.assertRaises(ValueError, msg=value):
+                parse_timestamp(value)
+        data, errors = parse_json({'datetime': '2026-01-01 99:00:00'}, 1, 7)
+        self.assertEqual((list(errors), data['datetime'], data['ts']), (['datetime'], '', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
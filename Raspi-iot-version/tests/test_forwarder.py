@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Forwarder tests against a local stand-in for the upstream server
+Run from Raspi-iot-version/: python3 -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from forwarder import INSERT_OUTBOX_SQL, Forwarder  # noqa: E402
+from schema import migrate  # noqa: E402
+
+
+class Upstream:
+    """HTTP server recording the bodies POSTed to it, answering with queued status codes (200 when none)"""
+
+    def __init__(self):
+        self.bodies = []
+        self.statuses = []
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                status = upstream.statuses.pop(0) if upstream.statuses else 200
+                upstream.bodies.append((status, json.loads(body)))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/weather"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def delivered(self):
+        """Readings acknowledged with 2xx, in the order they arrived"""
+        readings = []
+        for status, body in self.bodies:
+            if status < 300:
+                readings.extend(body if isinstance(body, list) else [body])
+        return readings
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ForwarderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmpdir, 'weather.db')
+        self.db = self.open_db()
+        self.upstream = Upstream()
+        self.forwarders = []
+
+    def tearDown(self):
+        for forwarder in self.forwarders:
+            forwarder.stop()
+        self.upstream.close()
+        self.db.close_all()
+        shutil.rmtree(self.tmpdir)
+
+    def open_db(self):
+        db = Database(self.db_file)
+        migrate(db.connection())
+        return db
+
+    def forwarder(self, db=None, url=None, **kwargs):
+        kwargs.setdefault('batch_size', 2)
+        kwargs.setdefault('timeout', 2)
+        forwarder = Forwarder(db or self.db, lambda: url or self.upstream.url, **kwargs)
+        self.forwarders.append(forwarder)
+        return forwarder
+
+    def queue(self, count, first=1):
+        conn = self.db.connection()
+        with conn:
+            conn.executemany(INSERT_OUTBOX_SQL, [(json.dumps({'idws': 1, 'seq': seq}),)
+                                                 for seq in range(first, first + count)])
+
+    def outbox(self):
+        return self.db.connection().execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.01)
+
+    def test_batches_in_order_and_single_reading_as_object(self):
+        self.queue(5)
+        forwarder = self.forwarder()
+        self.assertEqual([forwarder.send_pending() for _ in range(4)], [2, 2, 1, 0])
+        bodies = [body for _, body in self.upstream.bodies]
+        self.assertEqual([len(body) for body in bodies[:2]], [2, 2])
+        self.assertIsInstance(bodies[2], dict)  # one reading: a bare object, as the ESP32 posts
+        self.assertEqual([reading['seq'] for reading in self.upstream.delivered()], [1, 2, 3, 4, 5])
+        self.assertEqual(self.outbox(), 0)
+        self.assertEqual(forwarder.sent, 5)
+
+    def test_server_error_keeps_batch(self):
+        self.queue(2)
+        self.upstream.statuses = [503]
+        forwarder = self.forwarder()
+        with self.assertRaises(Exception):
+            forwarder.send_pending()
+        self.assertEqual(self.outbox(), 2)
+        self.assertEqual(forwarder.send_pending(), 2)
+        self.assertEqual([reading['seq'] for reading in self.upstream.delivered()], [1, 2])
+
+    def test_retries_with_backoff_until_delivered(self):
+        self.queue(3)
+        self.upstream.statuses = [500, 502, 503]
+        logged = []
+        forwarder = self.forwarder(backoff_base=0.01, backoff_max=0.05, log=logged.append)
+        forwarder.start()
+        self.wait_for(lambda: self.outbox() == 0)
+        self.assertEqual([status for status, _ in self.upstream.bodies][:3], [500, 502, 503])
+        self.assertEqual([reading['seq'] for reading in self.upstream.delivered()], [1, 2, 3])
+        self.wait_for(lambda: forwarder.failures == 0)
+        self.assertTrue(any('recovered after 3' in message for message in logged))
+
+    def test_connection_error_counts_as_failure(self):
+        self.queue(1)
+        closed = Upstream()
+        url = closed.url
+        closed.close()
+        forwarder = self.forwarder(url=url, backoff_base=0.01, backoff_max=1.0)
+        forwarder.start()
+        self.wait_for(lambda: forwarder.failures >= 2)
+        self.assertEqual(self.outbox(), 1)
+
+    def test_backoff_grows_and_is_capped(self):
+        forwarder = self.forwarder(backoff_base=1.0, backoff_max=10.0)
+        forwarder.failures = 3
+        self.assertTrue(4.0 <= forwarder.backoff_delay() <= 8.0)
+        forwarder.failures = 20
+        self.assertTrue(5.0 <= forwarder.backoff_delay() <= 10.0)
+
+    def test_resumes_from_outbox_after_restart(self):
+        self.queue(5)
+        first = self.forwarder()
+        self.assertEqual(first.send_pending(), 2)
+        first.stop()
+        self.db.close_all()
+
+        # A new process: fresh connections and forwarder on the same file
+        db = self.open_db()
+        try:
+            second = self.forwarder(db=db)
+            second.start()
+            self.wait_for(lambda: db.connection().execute('SELECT COUNT(*) FROM outbox').fetchone()[0] == 0)
+            second.stop()
+        finally:
+            db.close_all()
+        self.assertEqual([reading['seq'] for reading in self.upstream.delivered()], [1, 2, 3, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
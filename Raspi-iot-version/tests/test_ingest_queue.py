@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Write-behind ingest queue: batching, timed flush, flush on stop, backpressure, retries and the spill file"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest_queue import IngestQueue, IngestQueueFull  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def __call__(self, batch):
+        self.batches.append(list(batch))
+        self.written.set()
+
+    @property
+    def readings(self):
+        return [reading for batch in self.batches for reading in batch]
+
+
+class IngestQueueTest(unittest.TestCase):
+    def test_full_batches_then_timed_flush(self):
+        recorder = Recorder()
+        ingest = IngestQueue(recorder, batch_size=3, flush_interval=0.2)
+        for i in range(7):
+            ingest.put(i)
+        ingest.start()
+        deadline = time.monotonic() + 5
+        while len(recorder.readings) < 7 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(recorder.batches, [[0, 1, 2], [3, 4, 5], [6]])
+        ingest.stop()
+
+    def test_partial_batch_waits_for_flush_interval(self):
+        recorder = Recorder()
+        ingest = IngestQueue(recorder, batch_size=100, flush_interval=0.3)
+        ingest.start()
+        started = time.monotonic()
+        ingest.put('a')
+        self.assertTrue(recorder.written.wait(5))
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+        self.assertEqual(recorder.batches, [['a']])
+        ingest.stop()
+
+    def test_stop_flushes_pending_readings(self):
+        recorder = Recorder()
+        ingest = IngestQueue(recorder, batch_size=100, flush_interval=60)
+        ingest.start()
+        for i in range(5):
+            ingest.put(i)
+        ingest.stop(timeout=5)
+        self.assertEqual(recorder.readings, [0, 1, 2, 3, 4])
+        with self.assertRaises(IngestQueueFull):
+            ingest.put(5)
+
+    def test_stop_without_writer_drains_synchronously(self):
+        recorder = Recorder()
+        started = []
+        ingest = IngestQueue(recorder, on_start=lambda: started.append(True))
+        ingest.put('a')
+        ingest.put('b')
+        ingest.stop()
+        self.assertEqual(started, [True])  # state the writes depend on is loaded first
+        self.assertEqual(recorder.batches, [['a', 'b']])
+
+    def test_backpressure_when_full(self):
+        ingest = IngestQueue(Recorder(), max_depth=2)
+        ingest.put(1)
+        ingest.put(2)
+        with self.assertRaises(IngestQueueFull):
+            ingest.put(3)
+        self.assertEqual(ingest.depth, 2)
+
+    def test_failed_batch_is_retried(self):
+        recorder, failures = Recorder(), []
+
+        def write_batch(batch):
+            if not failures:
+                failures.append(batch)
+                raise RuntimeError("database is locked")
+            recorder(batch)
+
+        failed = []
+        ingest = IngestQueue(write_batch, retry_backoff=0, on_error=lambda e, batch: failed.append(batch))
+        ingest.put({'device_id': 1})
+        ingest.stop()
+        self.assertEqual((recorder.batches, failed), ([[{'device_id': 1}]], []))
+
+    def test_failed_batch_goes_to_on_error_and_the_spill_file(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        spill_file = os.path.join(tmpdir, 'spill.ndjson')
+        failed, broken = [], [True]
+        recorder = Recorder()
+
+        def write_batch(batch):
+            if broken:
+                raise RuntimeError("disk full")
+            recorder(batch)
+
+        ingest = IngestQueue(write_batch, batch_size=2, retries=2, retry_backoff=0, spill_file=spill_file,
+                             on_error=lambda e, batch: failed.append((str(e), batch)))
+        ingest.put({'device_id': 1, 'n': 1})
+        ingest.stop()
+        self.assertEqual(failed, [("disk full", [{'device_id': 1, 'n': 1}])])
+        with open(spill_file) as f:
+            self.assertEqual([json.loads(line) for line in f], [{'device_id': 1, 'n': 1}])
+
+        # Spilled readings are stored before the first batch of the next writer
+        broken.clear()
+        ingest = IngestQueue(write_batch, batch_size=2, spill_file=spill_file)
+        ingest.put({'device_id': 1, 'n': 2})
+        ingest.stop()
+        self.assertEqual(recorder.batches, [[{'device_id': 1, 'n': 1}], [{'device_id': 1, 'n': 2}]])
+        self.assertEqual(os.path.getsize(spill_file), 0)
+
+    def test_spilled_readings_are_stored_after_the_next_batch(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        spill_file = os.path.join(tmpdir, 'spill.ndjson')
+        with open(spill_file, 'w') as f:
+            f.write('{"n": 1}\n{"n": 2}\n{"n": 3}\n{"n"')  # the last line was cut short
+        recorder, calls = Recorder(), []
+
+        def write_batch(batch):
+            calls.append(batch)
+            if len(calls) in (1, 4):  # down when the writer starts, and again for the last spilled batch
+                raise RuntimeError("database is locked")
+            recorder(batch)
+
+        ingest = IngestQueue(write_batch, batch_size=2, retries=0, spill_file=spill_file)
+        ingest.put({'n': 4})
+        ingest.stop()
+        # n=4 stored, then n=1, n=2 from the file; n=3 fails again and stays
+        self.assertEqual(recorder.readings, [{'n': 4}, {'n': 1}, {'n': 2}])
+        with open(spill_file) as f:
+            self.assertEqual(f.read(), '{"n": 3}\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Per-device latest reading cache (latest_cache.py), /api/weather/latest and /api/devices"""
+
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from latest_cache import LatestReadings  # noqa: E402
+from schema import migrate  # noqa: E402
+import station  # noqa: E402
+
+T0 = 1767225600  # 2026-01-01 00:00:00 UTC
+
+
+def reading(device_id, seconds, **values):
+    return dict(values, device_id=device_id, ts=T0 + seconds,
+                datetime=f'2026-01-01 07:{seconds // 60:02d}:{seconds % 60:02d}')
+
+
+class LatestReadingsTest(unittest.TestCase):
+    def test_newest_reading_per_device(self):
+        cache = LatestReadings()
+        cache.update([reading(1, 0, temp_out_c=20.0), reading(2, 30, temp_out_c=10.0), reading(1, 60, temp_out_c=21.0)])
+        self.assertEqual(cache.get(1)['temp_out_c'], 21.0)
+        self.assertEqual(cache.latest()['device_id'], 1)
+        self.assertIsNone(cache.get(3))
+
+        # A replayed older reading does not replace the cached one; the cached dict is never changed
+        kept = cache.get(1)
+        cache.update([reading(1, 30, temp_out_c=99.0)])
+        self.assertIs(cache.get(1), kept)
+
+    def test_device_summary(self):
+        cache = LatestReadings(rate_window=5)
+        cache.update([reading(1, seconds, wh65_batt=2.4) for seconds in range(0, 120, 30)])
+        cache.update([reading(2, 0, wh65_batt=1), reading(3, 0)])
+        one, two, three = cache.devices(now=T0 + 100)
+        self.assertEqual((one['last_seen'], one['seconds_since'], one['readings_per_min']), ('2026-01-01 07:01:30', 10.0, 2.0))
+        self.assertTrue(one['battery_low'])  # volts below 2.5
+        self.assertTrue(two['battery_low'])  # the gateway's flag
+        self.assertEqual((three['battery_low'], three['readings_per_min']), (None, None))
+
+    def test_warm_from_database(self):
+        conn = sqlite3.connect(':memory:')
+        migrate(conn)
+        conn.executemany('INSERT INTO weather_data (device_id, datetime, ts, temp_out_c) VALUES (?, ?, ?, ?)',
+                         [(data['device_id'], data['datetime'], data['ts'], data['temp_out_c'])
+                          for data in (reading(1, 0, temp_out_c=1.0), reading(1, 60, temp_out_c=2.0),
+                                       reading(4, 30, temp_out_c=3.0))])
+        cache = LatestReadings()
+        self.assertEqual(cache.warm(conn), 2)
+        self.assertEqual((cache.get(1)['temp_out_c'], cache.get(4)['temp_out_c']), (2.0, 3.0))
+        self.assertEqual(cache.devices(now=T0 + 60)[0]['readings_per_min'], 1.0)
+        conn.close()
+
+
+class LatestEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+
+    def test_latest_and_devices(self):
+        self.assertEqual(self.client.get('/api/weather/latest?device=7801').status_code, 404)
+        self.station.save_weather_batch([{'device_id': 7801, 'datetime': '2026-08-01 07:00:00', 'temp_out_c': 25.0},
+                                         {'device_id': 7801, 'datetime': '2026-08-01 07:00:03', 'temp_out_c': 25.5}],
+                                        publish=False)
+        latest = self.client.get('/api/weather/latest?device=7801').get_json()
+        self.assertEqual((latest['datetime'], latest['temp_out_c']), ('2026-08-01 07:00:03', 25.5))
+        devices = {device['device_id']: device for device in self.client.get('/api/devices').get_json()['devices']}
+        self.assertEqual(devices[7801]['last_seen'], '2026-08-01 07:00:03')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Live reading feed: fan-out, device filters, dropping slow subscribers, stream slots; the SSE routes"""
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from live_feed import LiveFeed, StreamSlots  # noqa: E402
+import station  # noqa: E402
+
+
+class LiveFeedTest(unittest.TestCase):
+    def test_device_filter(self):
+        feed = LiveFeed()
+        everything, only_two = feed.subscribe(), feed.subscribe({2})
+        feed.publish(1, 'a')
+        feed.publish(2, 'b')
+        self.assertEqual([everything.get(0), everything.get(0), everything.get(0)], ['a', 'b', None])
+        self.assertEqual([only_two.get(0), only_two.get(0)], ['b', None])
+        feed.unsubscribe(everything)
+        self.assertEqual(feed.subscriber_count, 1)
+
+    def test_slow_subscriber_is_dropped_not_waited_on(self):
+        feed = LiveFeed(queue_size=2)
+        slow, fast = feed.subscribe(), feed.subscribe()
+        for i in range(2):
+            feed.publish(1, i)
+            fast.get(0)
+        self.assertEqual(feed.publish(1, 'third'), 1)
+        self.assertTrue(slow.dropped)
+        self.assertFalse(fast.dropped)
+        self.assertEqual(feed.subscriber_count, 1)
+        self.assertEqual(fast.get(0), 'third')
+
+    def test_async_subscriber(self):
+        async def receive():
+            feed = LiveFeed()
+            subscriber = feed.subscribe(loop=asyncio.get_running_loop())
+            await asyncio.get_running_loop().run_in_executor(None, feed.publish, 1, 'from a thread')
+            return await subscriber.get(timeout=5), await subscriber.get(timeout=0.01)
+
+        self.assertEqual(asyncio.run(receive()), ('from a thread', None))
+
+    def test_stream_slots(self):
+        slots = StreamSlots(2)
+        self.assertEqual([slots.acquire(), slots.acquire(), slots.acquire()], [True, True, False])
+        slots.release()
+        self.assertTrue(slots.acquire())
+        self.assertEqual(slots.open, 2)
+
+
+class StreamEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+
+    def test_reading_event_and_slot_released_on_close(self):
+        slots = self.station.stream_slots
+        open_before = slots.open
+        response = self.client.get('/api/weather/stream?device=7501', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+        self.station.save_weather_batch([{'device_id': 7502, 'datetime': '2026-05-01 07:00:00'},
+                                         {'device_id': 7501, 'datetime': '2026-05-01 07:00:00', 'temp_out_c': 21.5}])
+        event = next(chunks).decode()
+        self.assertTrue(event.startswith('event: reading\ndata: '))
+        reading = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual((reading['device_id'], reading['temp_out_c']), (7501, 21.5))
+        self.assertEqual(slots.open, open_before + 1)
+        response.close()
+        self.assertEqual(slots.open, open_before)
+
+    def test_full_slots_answer_503(self):
+        slots = self.station.stream_slots
+        limit = slots.limit
+        slots.limit = slots.open
+        try:
+            response = self.client.get('/api/dashboard/stream')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('Retry-After', response.headers)
+        finally:
+            slots.limit = limit
+
+    def test_dashboard_stream_resumes_serial_lines(self):
+        self.station.add_to_serial_buffer('dashboard stream test')
+        seq = self.station.serial_buffer.last_seq
+        response = self.client.get('/api/dashboard/stream', headers={'Last-Event-ID': str(seq - 1)}, buffered=False)
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+        event = next(chunks).decode()
+        self.assertTrue(event.startswith(f'event: serial\nid: {seq}\ndata: '))
+        self.assertTrue(event.rstrip().endswith('dashboard stream test'))
+        response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""File rotation of the maintenance pass: the CSV and the log file are moved aside, then compressed"""
+
+import glob
+import gzip
+import logging
+import logging.handlers
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from maintenance import Maintenance  # noqa: E402
+
+
+class RecordingLock:
+    def __init__(self):
+        self.taken = 0
+
+    def __enter__(self):
+        self.taken += 1
+
+    def __exit__(self, *exc):
+        return False
+
+
+class RotationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.tmpdir, 'weather_data.csv')
+        self.log_file = os.path.join(self.tmpdir, 'weather_station.log')
+        self.write_lock, self.csv_lock = RecordingLock(), RecordingLock()
+        self.maintenance = Maintenance(None, self.write_lock, {}, None, self.csv_file, self.log_file,
+                                       csv_rotate_bytes=10, log_rotate_bytes=10, compress_after=0,
+                                       csv_lock=self.csv_lock)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_csv_moved_aside_under_csv_lock(self):
+        with open(self.csv_file, 'w') as file:
+            file.write('2026-01-01 07:00:00,1.0,90\n')
+        self.maintenance.rotate_csv()
+        self.assertEqual((self.csv_lock.taken, self.write_lock.taken), (1, 0))
+        self.assertFalse(os.path.exists(self.csv_file))
+        (rotated,) = glob.glob(os.path.join(self.tmpdir, 'weather_data-*.csv.gz'))
+        with gzip.open(rotated, 'rt') as file:
+            self.assertEqual(file.read(), '2026-01-01 07:00:00,1.0,90\n')
+
+    def test_log_rotation_loses_no_lines(self):
+        logger = logging.getLogger('test_maintenance')
+        logger.propagate = False
+        handler = logging.handlers.WatchedFileHandler(self.log_file)
+        logger.addHandler(handler)
+        self.maintenance.compress_after = 60  # a line may still land in a file just moved aside
+        stop = threading.Event()
+
+        def write():
+            count = 0
+            while not stop.is_set() or count < 200:
+                logger.warning('line %d', count)
+                count += 1
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(20):
+                self.maintenance.rotate_log()
+                stop.wait(0.005)
+        finally:
+            stop.set()
+            writer.join()
+            logger.removeHandler(handler)
+            handler.close()
+        self.maintenance.compress_after = 0
+        self.maintenance.rotate_log()
+        rotated = glob.glob(os.path.join(self.tmpdir, 'weather_station-*.log.gz'))
+        self.assertGreater(len(rotated), 1)
+        lines = []
+        for path in rotated:
+            with gzip.open(path, 'rt') as file:
+                lines.extend(file.read().splitlines())
+        numbers = sorted(int(line.split()[1]) for line in lines)
+        self.assertEqual(numbers, list(range(len(numbers))))
+        self.assertGreaterEqual(len(numbers), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
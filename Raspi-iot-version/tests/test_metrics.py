@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Metrics registry (metrics.py), the sampling profiler and the /metrics and /profile routes"""
+
+import math
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Registry  # noqa: E402
+from profiler import SamplingProfiler  # noqa: E402
+import station  # noqa: E402
+
+
+class RegistryTest(unittest.TestCase):
+    def test_prometheus_text(self):
+        registry = Registry('test_')
+        requests = registry.counter('requests_total', "Requests", ('route', 'status'))
+        requests.labels('/post', '200').inc()
+        requests.labels('/post', '200').inc(2)
+        requests.labels('/a"b', '500').inc()
+        registry.gauge('depth', "Queue depth").set_function(lambda: 7)
+        registry.gauge('broken', "Failing gauge").set_function(lambda: 1 / 0)
+        latency = registry.histogram('latency_seconds', "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            latency.observe(value)
+
+        lines = registry.render_prometheus().splitlines()
+        self.assertIn('# TYPE test_requests_total counter', lines)
+        self.assertIn('test_requests_total{route="/post",status="200"} 3', lines)
+        self.assertIn('test_requests_total{route="/a\\"b",status="500"} 1', lines)
+        self.assertIn('test_depth 7', lines)
+        self.assertIn('test_broken NaN', lines)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('test_latency_seconds_count 4', lines)
+        self.assertIn('test_latency_seconds_sum 6.05', lines)
+
+    def test_json_snapshot(self):
+        registry = Registry()
+        latency = registry.histogram('latency_seconds', "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.06, 0.5, 0.07):
+            latency.observe(value)
+        registry.gauge('broken', "Failing gauge").set_function(lambda: 1 / 0)
+        snapshot = registry.as_dict()
+        self.assertEqual(snapshot['broken']['series'][0]['value'], None)
+        (series,) = snapshot['latency_seconds']['series']
+        self.assertEqual((series['count'], series['p50'], series['p99']), (4, 0.1, 1.0))
+        self.assertTrue(math.isclose(series['mean'], 0.17))
+
+    def test_counter_is_thread_safe(self):
+        counter = Registry().counter('hits_total', "Hits")
+        threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(10000)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.labels().value, 40000)
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def test_folded_stacks_of_a_busy_thread(self):
+        done = threading.Event()
+
+        def busy_loop():
+            while not done.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=busy_loop, name='busy')
+        worker.start()
+        profiler = SamplingProfiler(interval=0.002)
+        profiler.start()
+        time.sleep(0.2)
+        folded = profiler.stop()
+        done.set()
+        worker.join()
+        self.assertGreater(profiler.samples, 5)
+        busy = [line for line in folded.splitlines() if line.startswith('busy;')]
+        self.assertTrue(busy)
+        self.assertIn('busy_loop (test_metrics.py:', busy[0])
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in folded.splitlines()))
+
+
+class MetricsEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+
+    def test_requests_are_counted_by_route(self):
+        self.client.post('/api/weather', json={'idws': 7701, 'date': '2026-07-01 07:00:00', 'temp_out': 20})
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('weather_http_requests_total{route="/api/weather",method="POST",status="200"}', text)
+        self.assertIn('# TYPE weather_ingest_batch_seconds histogram', text)
+        snapshot = self.client.get('/metrics?format=json').get_json()
+        self.assertEqual(snapshot['pid'], os.getpid())
+        self.assertIn('weather_readings_received_total', snapshot['metrics'])
+        self.assertEqual(self.client.get('/metrics?format=xml').status_code, 400)
+
+    def test_profile_routes(self):
+        self.assertEqual(self.client.get('/profile/start').status_code, 405)
+        self.assertEqual(self.client.post('/profile/start?interval=0.0001').status_code, 400)
+        self.assertEqual(self.client.post('/profile/stop').status_code, 409)
+        self.assertEqual(self.client.post('/profile/start?interval=0.002').status_code, 200)
+        self.assertEqual(self.client.post('/profile/start').status_code, 409)
+        time.sleep(0.05)
+        response = self.client.post('/profile/stop')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Dashboard caches: the data file listing (database files in use are neither listed nor deletable) and the rendered page"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from page_cache import DirectoryListing, RenderCache  # noqa: E402
+import station  # noqa: E402
+
+
+class DirectoryListingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ('weather.db', 'weather.db-wal', 'weather.db-shm', 'serial.db', 'serial.db-wal',
+                     'old.db-journal', '.owner.lock', 'weather_data.csv', 'settings.json'):
+            with open(os.path.join(self.tmpdir, name), 'w'):
+                pass
+        os.mkdir(os.path.join(self.tmpdir, 'shards'))
+        self.listing = DirectoryListing(self.tmpdir, protected=('weather.db', 'serial.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lists_only_user_files(self):
+        self.assertEqual([entry.name for entry in self.listing.entries()], ['settings.json', 'weather_data.csv'])
+
+    def test_protected_names(self):
+        for name in ('weather.db', 'weather.db-wal', 'serial.db-shm', 'x.db-journal', '.owner.lock',
+                     '../weather.db', 'shards/weather-0.db'):
+            self.assertTrue(self.listing.is_protected(name), name)
+        self.assertFalse(self.listing.is_protected('weather_data.csv'))
+
+    def test_rescanned_only_after_a_change(self):
+        self.listing.entries()
+        generation = self.listing.generation
+        self.listing.entries()
+        self.assertEqual(self.listing.generation, generation)
+
+        with open(os.path.join(self.tmpdir, 'weather_data.csv'), 'a') as file:
+            file.write('appended\n')  # the directory's mtime does not move
+        self.listing.invalidate()
+        self.listing.entries()
+        self.assertEqual(self.listing.generation, generation + 1)
+
+
+class RenderCacheTest(unittest.TestCase):
+    def test_renders_once_per_key(self):
+        cache, calls = RenderCache(), []
+
+        def render():
+            calls.append(True)
+            return f'<p>{len(calls) // 3}</p>'
+
+        first = cache.get('a', render)
+        self.assertIs(cache.get('a', render), first)
+        self.assertEqual(len(calls), 1)
+
+        # New key, same body: the ETag and modification time stay
+        second = cache.get('b', render)
+        self.assertEqual((second.etag, second.last_modified), (first.etag, first.last_modified))
+        third = cache.get('c', render)
+        self.assertNotEqual(third.etag, first.etag)
+        self.assertEqual(len(calls), 3)
+
+
+class DashboardTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+
+    def test_conditional_requests(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get('/', headers={'If-None-Match': etag}).status_code, 304)
+
+        self.station.save_weather_batch([{'device_id': 7601, 'datetime': '2026-06-01 07:00:00', 'temp_out_c': 23.4}],
+                                        publish=False)
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertIn('23.4', response.get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
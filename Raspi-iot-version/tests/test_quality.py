@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Quality control: range, rate-of-change and robust z-score checks"""
+
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quality import QualityControl, RollingMedian  # noqa: E402
+from schema import migrate  # noqa: E402
+
+T0 = 1767225600
+
+
+def reading(minute, device_id=1, **values):
+    return dict(values, device_id=device_id, ts=T0 + minute * 60, datetime=f'minute {minute}')
+
+
+class QualityControlTest(unittest.TestCase):
+    def test_range_failure_is_quarantined(self):
+        qc = QualityControl()
+        data = reading(0, temp_out_c=80.0, humidity_out=50)
+        (row,) = qc.check([data])
+        self.assertEqual(row[:6], (1, 'minute 0', T0, 'temp_out_c', 80.0, 'range'))
+        self.assertEqual(row[7], 'quarantined')
+        self.assertIsNone(data['temp_out_c'])
+        self.assertEqual(data['humidity_out'], 50)
+
+    def test_flag_mode_keeps_values(self):
+        qc = QualityControl(mode='flag')
+        data = reading(0, temp_out_c=80.0)
+        (row,) = qc.check([data])
+        self.assertEqual(row[7], 'flagged')
+        self.assertEqual(data['temp_out_c'], 80.0)
+
+    def test_rate_of_change(self):
+        qc = QualityControl()
+        self.assertEqual(qc.check([reading(0, temp_out_c=20.0), reading(1, temp_out_c=22.0)]), [])
+        (row,) = qc.check([reading(2, temp_out_c=30.0)])
+        self.assertEqual((row[3], row[5]), ('temp_out_c', 'rate'))
+        # Compared with the last good value, so the next plausible one passes
+        self.assertEqual(qc.check([reading(3, temp_out_c=23.0)]), [])
+        # After a long gap the previous value no longer applies
+        self.assertEqual(qc.check([reading(60, temp_out_c=35.0)]), [])
+
+    def test_zscore_after_enough_samples(self):
+        qc = QualityControl(window=30, min_samples=20, z_threshold=6.0)
+        steady = [reading(i * 20, humidity_out=60 + i % 3) for i in range(20)]  # 20-minute gaps: no rate check
+        self.assertEqual(qc.check(steady), [])
+        (row,) = qc.check([reading(20 * 20, humidity_out=95)])
+        self.assertEqual((row[3], row[5]), ('humidity_out', 'zscore'))
+
+    def test_zscore_needs_min_samples(self):
+        qc = QualityControl(min_samples=20)
+        self.assertEqual(qc.check([reading(i * 20, humidity_out=60) for i in range(5)]
+                                  + [reading(100, humidity_out=95)]), [])
+
+    def test_out_of_order_reading_gets_range_check_only(self):
+        qc = QualityControl()
+        qc.check([reading(10, temp_out_c=20.0)])
+        self.assertEqual(qc.check([reading(9, temp_out_c=40.0)]), [])
+        (row,) = qc.check([reading(8, temp_out_c=70.0)])
+        self.assertEqual(row[5], 'range')
+
+    def test_devices_are_independent(self):
+        qc = QualityControl()
+        qc.check([reading(0, device_id=1, temp_out_c=20.0)])
+        self.assertEqual(qc.check([reading(1, device_id=2, temp_out_c=30.0)]), [])
+
+    def test_warm_from_stored_readings(self):
+        conn = sqlite3.connect(':memory:')
+        migrate(conn)
+        conn.executemany('INSERT INTO weather_data (device_id, datetime, ts, temp_out_c) VALUES (?, ?, ?, ?)',
+                         [(1, f'2026-01-01 07:{minute:02d}:00', T0 + minute * 60, 20.0) for minute in range(3)])
+        qc = QualityControl()
+        self.assertEqual(qc.warm(conn), 1)
+        (row,) = qc.check([dict(device_id=1, ts=T0 + 180, datetime='2026-01-01 07:03:00', temp_out_c=30.0)])
+        self.assertEqual(row[5], 'rate')
+        conn.close()
+
+    def store(self, conn, qc, readings):
+        """What the ingest writer does with several workers: reload, check, insert"""
+        qc.reload(conn, {data['device_id'] for data in readings})
+        flagged = qc.check(readings)
+        conn.executemany('''
+            INSERT INTO quarantine (device_id, datetime, ts, field, value, check_name, detail, action)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', flagged)
+        conn.executemany('INSERT INTO weather_data (device_id, datetime, ts, humidity_out) VALUES (?, ?, ?, ?)',
+                         [(data['device_id'], data['datetime'], data['ts'], data.get('humidity_out'))
+                          for data in readings])
+        return flagged
+
+    def test_reload_sees_readings_of_other_workers(self):
+        conn = sqlite3.connect(':memory:')
+        migrate(conn)
+        workers = [QualityControl(), QualityControl()]
+        for minute in range(4):
+            self.assertEqual(self.store(conn, workers[minute % 2], [
+                dict(device_id=1, ts=T0 + minute * 60, datetime=f'2026-01-01 07:{minute:02d}:00', humidity_out=60)]), [])
+        # Worker 1 last saw minute 3 itself, worker 0 only minute 2; both compare with minute 3
+        (row,) = self.store(conn, workers[0], [
+            dict(device_id=1, ts=T0 + 240, datetime='2026-01-01 07:04:00', humidity_out=90)])
+        self.assertEqual(row[5], 'rate')
+        conn.close()
+
+    def test_reload_keeps_quarantined_values_in_window(self):
+        conn = sqlite3.connect(':memory:')
+        migrate(conn)
+        workers = [QualityControl(window=30, min_samples=5), QualityControl(window=30, min_samples=5)]
+        failures = []
+        for i in range(60):
+            # A lasting step from 40 % to 80 %, readings 20 minutes apart (no rate check)
+            stamp = T0 + i * 1200
+            failures.append(len(self.store(conn, workers[i % 2], [dict(
+                device_id=1, ts=stamp, datetime=f'reading {i:03d}', humidity_out=40 + i % 3 if i < 30 else 80)])))
+        self.assertTrue(any(failures[30:]))
+        self.assertFalse(any(failures[50:]))  # the new level filled half of the window
+        conn.close()
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            QualityControl(mode='drop')
+
+
+class RollingMedianTest(unittest.TestCase):
+    def test_matches_statistics(self):
+        rng = random.Random(1)
+        window = RollingMedian(15)
+        values = []
+        for _ in range(200):
+            value = round(rng.gauss(20, 5), 1)
+            window.add(value)
+            values = (values + [value])[-15:]
+            median = statistics.median(values)
+            self.assertAlmostEqual(window.median(), median)
+            self.assertAlmostEqual(window.mad(), statistics.median(abs(v - median) for v in values))
+
+
+if __name__ == '__main__':
+    unittest.main()
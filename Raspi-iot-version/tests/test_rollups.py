@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Minute / hourly / daily rollups updated on ingest, and /api/weather/history reading them"""
+
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rollups import RollupAggregator, pick_resolution, rollup_point  # noqa: E402
+from schema import migrate  # noqa: E402
+import station  # noqa: E402
+
+
+def reading(stamp, **values):
+    return dict(values, device_id=values.pop('device_id', 1), datetime=stamp)
+
+
+class RollupAggregatorTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.row_factory = sqlite3.Row
+        migrate(self.conn)
+        self.aggregator = RollupAggregator()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def ingest(self, readings):
+        rows, counters = self.aggregator.prepare(readings)
+        self.aggregator.apply(self.conn, rows)
+        self.aggregator.commit(counters)
+
+    def bucket(self, table, bucket):
+        return rollup_point(self.conn.execute(f'SELECT * FROM {table} WHERE device_id = 1 AND bucket = ?',
+                                              (bucket,)).fetchone())
+
+    def test_batches_merge_into_the_same_buckets(self):
+        self.ingest([reading('2026-01-01 07:00:10', temp_out_c=20.0, wind_direction=350, total_rain_in=1.0),
+                     reading('2026-01-01 07:00:40', temp_out_c=22.0, wind_direction=10, total_rain_in=1.25)])
+        self.ingest([reading('2026-01-01 07:30:00', temp_out_c=18.0, total_rain_in=0.5),  # counter reset
+                     reading('2026-01-01 08:00:00', temp_out_c=30.0, total_rain_in=0.5)])
+
+        minute = self.bucket('weather_rollup_1m', '2026-01-01 07:00:00')
+        self.assertEqual(minute['samples'], 2)
+        self.assertEqual(minute['temp_out_c'], 21.0)
+        self.assertEqual(minute['wind_direction'], 0.0)  # vector mean of 350 and 10 degrees
+
+        hour = self.bucket('weather_rollup_1h', '2026-01-01 07:00:00')
+        self.assertEqual(hour['samples'], 3)
+        self.assertEqual((hour['temp_out_c_min'], hour['temp_out_c_max'], hour['temp_out_c']), (18.0, 22.0, 20.0))
+        self.assertAlmostEqual(hour['rain_in'], 0.25 + 0.5)  # first counter gives no delta, the reset counts whole
+
+        day = self.bucket('weather_rollup_1d', '2026-01-01 00:00:00')
+        self.assertEqual((day['samples'], day['temp_out_c_max']), (4, 30.0))
+
+    def test_replayed_older_reading_adds_no_rain(self):
+        self.ingest([reading('2026-01-01 07:00:00', total_rain_in=1.0),
+                     reading('2026-01-01 07:10:00', total_rain_in=1.5)])
+        self.ingest([reading('2026-01-01 07:05:00', total_rain_in=1.25)])
+        hour = self.bucket('weather_rollup_1h', '2026-01-01 07:00:00')
+        self.assertEqual(hour['samples'], 3)
+        self.assertAlmostEqual(hour['rain_in'], 0.5)
+
+    def test_warm_continues_rain_counters(self):
+        self.conn.execute("INSERT INTO weather_data (device_id, datetime, total_rain_in) VALUES (1, '2026-01-01 06:59:00', 2.0)")
+        self.aggregator.warm(self.conn)
+        self.ingest([reading('2026-01-01 07:00:00', total_rain_in=2.5)])
+        self.assertAlmostEqual(self.bucket('weather_rollup_1h', '2026-01-01 07:00:00')['rain_in'], 0.5)
+
+    def test_pick_resolution(self):
+        self.assertEqual(pick_resolution(3600, 2000, 3), 'raw')
+        self.assertEqual(pick_resolution(86400, 2000, 3), '1m')
+        self.assertEqual(pick_resolution(30 * 86400, 1000, 3), '1h')
+        self.assertEqual(pick_resolution(10 * 365 * 86400, 500, 3), '1d')
+
+
+class HistoryEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+        cls.station.save_weather_batch([
+            {'device_id': 7201, 'datetime': f'2026-02-0{day} {hour:02d}:00:00', 'temp_out_c': float(hour)}
+            for day in (1, 2) for hour in range(24)
+        ], publish=False)
+
+    def history(self, **query):
+        response = self.client.get('/api/weather/history', query_string=dict(query, device=7201))
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_auto_resolution_reads_rollups(self):
+        result = self.history(**{'from': '2026-02-01', 'to': '2026-02-02 23:59:59', 'points': 100})
+        self.assertEqual(result['resolution'], '1h')
+        self.assertEqual(len(result['points']), 48)
+        self.assertEqual(result['points'][13]['temp_out_c'], 13.0)
+
+        daily = self.history(**{'from': '2026-02-01', 'to': '2026-02-02 23:59:59', 'resolution': '1d'})['points']
+        self.assertEqual([(point['samples'], point['temp_out_c']) for point in daily], [(24, 11.5), (24, 11.5)])
+
+    def test_raw_rows_for_a_short_span(self):
+        result = self.history(**{'from': '2026-02-01 10:00:00', 'to': '2026-02-01 12:00:00', 'points': 5000})
+        self.assertEqual(result['resolution'], 'raw')
+        self.assertEqual([point['temp_out_c'] for point in result['points']], [10.0, 11.0, 12.0])
+
+    def test_unknown_resolution(self):
+        response = self.client.get('/api/weather/history', query_string={'device': 7201, 'resolution': '5m'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Schema migrations from an unversioned (v0) database to the current version"""
+
+import calendar
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import SCHEMA_VERSION, migrate, table_columns  # noqa: E402
+
+# weather_data as the original weather_station.py created it
+V0_TABLE_SQL = '''
+    CREATE TABLE weather_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id INTEGER NOT NULL,
+        datetime TEXT NOT NULL,
+        windspeed_kmh REAL, wind_direction INTEGER, rain_rate_in REAL,
+        temp_in_c REAL, temp_out_c REAL, humidity_in INTEGER, humidity_out INTEGER,
+        uv_index REAL, wind_gust_kmh REAL, barometric_pressure_rel_in REAL,
+        barometric_pressure_abs_in REAL, solar_radiation_wm2 REAL,
+        daily_rain_in REAL, rain_today_in REAL, total_rain_in REAL,
+        weekly_rain_in REAL, monthly_rain_in REAL, yearly_rain_in REAL,
+        max_daily_gust REAL, wh65_batt REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def epoch(stamp):
+    return calendar.timegm(tuple(map(int, stamp.replace('-', ' ').replace(':', ' ').split())) + (0, 0, 0))
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute(V0_TABLE_SQL)
+        self.conn.executemany(
+            'INSERT INTO weather_data (device_id, datetime, temp_out_c, created_at) VALUES (?, ?, ?, ?)', [
+                (1, '2026-01-01 07:00:00', 20.0, '2026-01-01 00:00:05'),
+                (1, '2026-01-01 07:00:00', 21.0, '2026-01-01 00:00:09'),  # duplicate, the newest copy stays
+                (1, '2026-01-01 07:30:00', 22.0, '2026-01-01 00:30:05'),
+                (2, '', 15.0, '2026-01-01 01:00:00'),  # posted without a timestamp
+            ])
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_migrates_to_current_version(self):
+        self.assertEqual(migrate(self.conn), (0, SCHEMA_VERSION))
+        self.assertEqual(SCHEMA_VERSION, 7)
+        self.assertEqual(self.conn.execute('PRAGMA user_version').fetchone()[0], 7)
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({'latest_reading', 'weather_rollup_1m', 'weather_rollup_1h', 'weather_rollup_1d',
+                         'outbox', 'quarantine'} <= tables)
+        self.assertIn('ts', table_columns(self.conn, 'weather_data'))
+
+        # A second run (every restart and worker) changes nothing
+        self.assertEqual(migrate(self.conn), (7, 7))
+
+    def test_backfills_and_deduplicates(self):
+        migrate(self.conn)
+        rows = self.conn.execute(
+            'SELECT device_id, datetime, ts, temp_out_c FROM weather_data ORDER BY device_id, datetime').fetchall()
+        self.assertEqual(rows, [
+            # ts is UTC: the stored station-local time less the default offset (GMT+7)
+            (1, '2026-01-01 07:00:00', epoch('2026-01-01 00:00:00'), 21.0),
+            (1, '2026-01-01 07:30:00', epoch('2026-01-01 00:30:00'), 22.0),
+            (2, '2026-01-01 08:00:00', epoch('2026-01-01 01:00:00'), 15.0),
+        ])
+        latest = dict(self.conn.execute('SELECT device_id, datetime FROM latest_reading'))
+        self.assertEqual(latest, {1: '2026-01-01 07:30:00', 2: '2026-01-01 08:00:00'})
+
+        # Rollups were backfilled (v3) before duplicates were removed (v6)
+        samples = self.conn.execute('''
+            SELECT samples FROM weather_rollup_1h WHERE device_id = 1 AND bucket = '2026-01-01 07:00:00'
+        ''').fetchone()[0]
+        self.assertEqual(samples, 3)
+
+    def test_backfills_with_configured_offset(self):
+        migrate(self.conn, utc_offset_hours=-5)
+        rows = self.conn.execute(
+            'SELECT device_id, datetime, ts FROM weather_data ORDER BY device_id, datetime').fetchall()
+        self.assertEqual(rows, [
+            (1, '2026-01-01 07:00:00', epoch('2026-01-01 12:00:00')),
+            (1, '2026-01-01 07:30:00', epoch('2026-01-01 12:30:00')),
+            (2, '2025-12-31 20:00:00', epoch('2026-01-01 01:00:00')),
+        ])
+
+    def test_unique_readings_and_latest_trigger(self):
+        migrate(self.conn)
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute("INSERT INTO weather_data (device_id, datetime) VALUES (1, '2026-01-01 07:30:00')")
+        # A replayed older reading does not replace the latest one
+        self.conn.execute("INSERT INTO weather_data (device_id, datetime) VALUES (1, '2026-01-01 06:00:00')")
+        self.assertEqual(self.conn.execute('SELECT datetime FROM latest_reading WHERE device_id = 1').fetchone()[0],
+                         '2026-01-01 07:30:00')
+        self.conn.execute("INSERT INTO weather_data (device_id, datetime) VALUES (1, '2026-01-01 08:00:00')")
+        self.assertEqual(self.conn.execute('SELECT datetime FROM latest_reading WHERE device_id = 1').fetchone()[0],
+                         '2026-01-01 08:00:00')
+
+    def test_demo_database_without_device_id(self):
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE weather_data (id INTEGER PRIMARY KEY AUTOINCREMENT, datetime TEXT NOT NULL, '
+                     'temp_out_c REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+        conn.execute("INSERT INTO weather_data (datetime, temp_out_c) VALUES ('2026-01-01 07:00:00', 20.0)")
+        conn.commit()
+        migrate(conn)
+        self.assertEqual(conn.execute('SELECT device_id FROM weather_data').fetchall(), [(1,)])
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
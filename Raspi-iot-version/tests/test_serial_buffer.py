@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Serial monitor ring buffer: sequence numbers, cursors and waiting readers; /serial"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serial_buffer import SerialRingBuffer, SharedSerialBuffer  # noqa: E402
+import station  # noqa: E402
+
+
+class SerialRingBufferTest(unittest.TestCase):
+    def test_keeps_newest_lines_with_sequence_numbers(self):
+        buffer = SerialRingBuffer(3)
+        self.assertEqual((buffer.last_seq, buffer.since(0)), (0, []))
+        for i in range(5):
+            self.assertEqual(buffer.add(f'line {i}'), i + 1)
+        self.assertEqual(buffer.lines(), ['line 2', 'line 3', 'line 4'])
+        self.assertEqual(buffer.since(0), [(3, 'line 2'), (4, 'line 3'), (5, 'line 4')])
+        self.assertEqual(buffer.since(4), [(5, 'line 4')])
+        self.assertEqual(buffer.since(5), [])
+
+    def test_cursor_from_before_a_restart_reads_everything(self):
+        buffer = SerialRingBuffer(3)
+        buffer.add('first line after the restart')
+        buffer.add('second')
+        self.assertEqual(buffer.since(120), [(1, 'first line after the restart'), (2, 'second')])
+        self.assertEqual(buffer.wait(120, timeout=5), [(1, 'first line after the restart'), (2, 'second')])
+
+    def test_wait_wakes_on_new_line(self):
+        buffer = SerialRingBuffer()
+        buffer.add('old')
+        timer = threading.Timer(0.05, buffer.add, ('new',))
+        timer.start()
+        self.assertEqual(buffer.wait(1, timeout=5), [(2, 'new')])
+        timer.join()
+        self.assertEqual(buffer.wait(2, timeout=0.05), [])
+
+    def test_concurrent_writers_get_distinct_sequence_numbers(self):
+        buffer = SerialRingBuffer(1000)
+        threads = [threading.Thread(target=lambda: [buffer.add('x') for _ in range(100)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([seq for seq, _ in buffer.since(0)], list(range(1, 401)))
+
+
+class SharedSerialBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'serial.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lines_are_shared_and_trimmed(self):
+        writer, reader = SharedSerialBuffer(self.path, 3), SharedSerialBuffer(self.path, 3)
+        for i in range(5):
+            writer.add(f'line {i}')
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(reader.lines(), ['line 2', 'line 3', 'line 4'])
+        self.assertEqual(reader.since(4), [(5, 'line 4')])
+        self.assertEqual(reader.last_seq, 5)
+
+    def test_cursor_from_before_the_file_was_recreated(self):
+        writer = SharedSerialBuffer(self.path)
+        writer.add('line')
+        writer.flush(timeout=5)
+        self.assertEqual(SharedSerialBuffer(self.path).since(99), [(1, 'line')])
+
+    def test_add_does_not_wait_for_a_locked_file(self):
+        writer = SharedSerialBuffer(self.path, 3, busy_timeout=0.01, retry_interval=0.01)
+        holder = sqlite3.connect(self.path, isolation_level=None)
+        holder.execute('BEGIN EXCLUSIVE')
+        started = time.monotonic()
+        for i in range(5):
+            writer.add(f'line {i}')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertFalse(writer.flush(timeout=0.2))  # still locked, the lines wait in memory
+        holder.execute('COMMIT')
+        holder.close()
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(writer.lines(), ['line 2', 'line 3', 'line 4'])
+
+
+class SerialEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+
+    def test_cursor(self):
+        self.station.add_to_serial_buffer('serial endpoint test')
+        last = self.client.get('/serial?since=0').get_json()
+        self.assertTrue(last['lines'][-1].endswith('serial endpoint test'))
+        self.assertEqual(last['seq'], self.station.serial_buffer.last_seq)
+
+        self.assertEqual(self.client.get(f"/serial?since={last['seq']}").get_json(), {'seq': last['seq'], 'lines': []})
+        self.station.add_to_serial_buffer('one more line')
+        newer = self.client.get(f"/serial?since={last['seq']}").get_json()
+        self.assertEqual((newer['seq'], len(newer['lines'])), (last['seq'] + 1, 1))
+
+        # A cursor kept by a page open across a server restart gets the whole buffer and the current seq
+        restarted = self.client.get(f"/serial?since={newer['seq'] + 1000}").get_json()
+        self.assertEqual(restarted['seq'], self.station.serial_buffer.last_seq)
+        self.assertEqual(restarted['lines'], self.station.serial_buffer.lines())
+
+        self.assertIn('one more line', self.client.get('/serial').get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Storage sharded by device id (shards.py): routing, merging and moving stations between layouts"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shards import MergedCursor, ShardRouter, Shard, merge_rows, prepare_storage, shard_paths  # noqa: E402
+
+
+def count(path, table, device_id):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE device_id = ?', (device_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+class RouterTest(unittest.TestCase):
+    def test_paths_and_routing(self):
+        self.assertEqual(shard_paths('data/weather.db', 'data/shards', 0), ['data/weather.db'])
+        self.assertEqual(shard_paths('data/weather.db', 'data/shards', 2),
+                         [os.path.join('data/shards', 'weather-0.db'), os.path.join('data/shards', 'weather-1.db')])
+
+        router = ShardRouter()
+        router.open(Shard(index, None, None) for index in range(3))
+        self.assertEqual(router.route(7).index, 1)
+        readings = [{'device_id': 1, 'n': 0}, {'device_id': 2, 'n': 1}, {'device_id': 4, 'n': 2}, {'n': 3}]
+        groups = {shard.index: [data['n'] for data in group] for shard, group in router.split(readings)}
+        self.assertEqual(groups, {1: [0, 2, 3], 2: [1]})  # in order; no device_id is device 1
+
+    def test_merge(self):
+        rows = merge_rows([[(1,), (4,)], [(2,), (3,), (5,)]], key=lambda row: row[0], limit=4)
+        self.assertEqual(rows, [(1,), (2,), (3,), (4,)])
+        newest = merge_rows([[(4,), (1,)], [(5,), (2,)]], key=lambda row: row[0], reverse=True)
+        self.assertEqual(newest, [(5,), (4,), (2,), (1,)])
+
+        conn = sqlite3.connect(':memory:')
+        cursors = [conn.execute('SELECT 1 AS n UNION ALL SELECT 3'), conn.execute('SELECT 2 AS n')]
+        merged = MergedCursor(cursors, key=lambda row: row[0])
+        self.assertEqual(merged.description[0][0], 'n')
+        self.assertEqual((merged.fetchmany(2), merged.fetchmany(2), merged.fetchmany(2)), ([(1,), (2,)], [(3,)], []))
+        conn.close()
+
+
+class PrepareStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmpdir, 'weather.db')
+        self.shard_dir = os.path.join(self.tmpdir, 'shards')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def store(self, path, device_ids):
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.executemany('INSERT INTO weather_data (device_id, datetime, temp_out_c) VALUES (?, ?, ?)',
+                             [(device_id, f'2026-01-01 07:00:0{n}', 20.0) for device_id in device_ids for n in range(3)])
+            conn.executemany('INSERT INTO outbox (payload) VALUES (?)', [('{}',)])
+        conn.close()
+
+    def test_stations_move_when_the_layout_changes(self):
+        self.assertEqual(prepare_storage(self.db_file, self.shard_dir, 0), 0)
+        self.store(self.db_file, [1, 2, 3])
+
+        # Unsharded -> 2 shards: every device and the outbox leave weather.db
+        self.assertEqual(prepare_storage(self.db_file, self.shard_dir, 2), 3)
+        first, second = shard_paths(self.db_file, self.shard_dir, 2)
+        self.assertEqual([count(first, 'weather_data', 2), count(second, 'weather_data', 1),
+                          count(second, 'weather_data', 3), count(self.db_file, 'weather_data', 1)], [3, 3, 3, 0])
+        conn = sqlite3.connect(first)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0], 1)
+        self.assertEqual(conn.execute('SELECT device_id FROM latest_reading').fetchall(), [(2,)])
+        conn.close()
+
+        # Nothing to move on the next start; 2 -> 3 shards moves devices 2 and 3, device 1 stays
+        self.assertEqual(prepare_storage(self.db_file, self.shard_dir, 2), 0)
+        self.assertEqual(prepare_storage(self.db_file, self.shard_dir, 3), 2)
+        third = shard_paths(self.db_file, self.shard_dir, 3)
+        self.assertEqual([count(third[1], 'weather_data', 1), count(third[0], 'weather_data', 3),
+                          count(third[2], 'weather_data', 2)], [3, 3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
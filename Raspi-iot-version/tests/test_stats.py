@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Vectorized range statistics (stats.py) and /api/weather/stats"""
+
+import os
+import statistics
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stats  # noqa: E402
+import station  # noqa: E402
+
+
+class StatsTest(unittest.TestCase):
+    def test_summarize_ignores_missing_values(self):
+        values = [12.5, 3.0, float('nan'), 7.25, 9.0, 1.0]
+        result = stats.summarize(np.array(values))
+        present = [value for value in values if value == value]
+        self.assertEqual((result['count'], result['min'], result['max']), (5, 1.0, 12.5))
+        self.assertAlmostEqual(result['mean'], statistics.mean(present))
+        self.assertAlmostEqual(result['std'], statistics.pstdev(present))
+        self.assertAlmostEqual(result['p50'], statistics.median(present))
+        self.assertEqual(stats.summarize(np.array([float('nan')])), {'count': 0})
+
+    def test_wind_rose_sectors_and_speed_bins(self):
+        rose = stats.wind_rose(np.array([0.0, 359.0, 90.0, 95.0, float('nan')]),
+                               np.array([3.0, 12.0, 60.0, 4.0, 10.0]))
+        self.assertEqual(rose['samples'], 4)
+        frequency = rose['frequency_pct']
+        self.assertEqual(frequency[0][0], 25.0)  # 0 degrees, below 5 km/h
+        self.assertEqual(frequency[0][2], 25.0)  # 359 degrees falls in the north sector
+        self.assertEqual(frequency[4][5], 25.0)  # east, 50 km/h and above
+        self.assertEqual(frequency[4][0], 25.0)
+        self.assertEqual(sum(map(sum, frequency)), 100.0)
+
+    def test_degree_days_from_daily_means(self):
+        day = 86400
+        result = stats.degree_days(np.array([0, 3600, day, day + 3600], dtype=float),
+                                   np.array([10.0, 14.0, 20.0, 24.0]), 18.0)
+        self.assertEqual((result['days'], result['heating'], result['cooling']), (2, 6.0, 4.0))
+
+    def test_percentiles_match_numpy(self):
+        values = np.round(np.random.default_rng(3).normal(20, 6, 1001), 1)
+        result = stats.summarize(values)
+        for p, expected in zip(stats.PERCENTILES, np.percentile(values, stats.PERCENTILES)):
+            self.assertAlmostEqual(result[f'p{p}'], expected)
+
+    def test_accumulated_chunks_equal_one_piece(self):
+        rng = np.random.default_rng(5)
+        size = 5000
+        columns = {name: np.round(rng.uniform(0, 40, size), 1) for name in stats.STAT_FIELDS}
+        columns['epoch'] = np.arange(size, dtype=np.float64) * 60
+        columns['wind_direction'] = rng.uniform(0, 360, size)
+        columns['temp_out_c'][::7] = np.nan
+        accumulator = stats.StatsAccumulator()
+        for offset in range(0, size, 999):
+            accumulator.add({name: values[offset:offset + 999] for name, values in columns.items()})
+        chunked, whole = accumulator.result(), stats.compute_stats(columns)
+        self.assertEqual(accumulator.rows, size)
+        self.assertEqual(chunked['wind_rose'], whole['wind_rose'])
+        self.assertEqual(chunked['degree_days']['days'], whole['degree_days']['days'])
+        self.assertAlmostEqual(chunked['degree_days']['heating'], whole['degree_days']['heating'])
+        temp = chunked['fields']['temp_out_c']
+        present = columns['temp_out_c'][~np.isnan(columns['temp_out_c'])]
+        self.assertEqual(temp['count'], present.size)
+        self.assertAlmostEqual(temp['mean'], present.mean())
+        self.assertAlmostEqual(temp['std'], present.std())
+        self.assertAlmostEqual(temp['p95'], np.percentile(present, 95))
+        self.assertEqual(chunked['heat_index_c']['count'], whole['heat_index_c']['count'])
+
+
+class StatsEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+        cls.temps = [float(minute % 17) for minute in range(120)]
+        cls.station.save_weather_batch([
+            {'device_id': 7301, 'datetime': f'2026-03-01 {7 + minute // 60:02d}:{minute % 60:02d}:00',
+             'temp_out_c': temp, 'humidity_out': 60, 'windspeed_kmh': 8.0, 'wind_direction': 180}
+            for minute, temp in enumerate(cls.temps)
+        ], publish=False)
+
+    def stats(self, **query):
+        response = self.client.get('/api/weather/stats', query_string=dict(query, device=7301))
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_raw_statistics(self):
+        result = self.stats(**{'from': '2026-03-01 07:00:00', 'to': '2026-03-01 08:59:59'})
+        self.assertEqual((result['source'], result['resolution_s'], result['rows']), ('raw', None, 120))
+        temp = result['fields']['temp_out_c']
+        self.assertAlmostEqual(temp['mean'], statistics.mean(self.temps))
+        self.assertAlmostEqual(temp['p50'], statistics.median(self.temps))
+        self.assertEqual(result['wind_rose']['frequency_pct'][8][1], 100.0)  # south, 5-10 km/h
+
+    def test_rollup_source_on_request(self):
+        result = self.stats(**{'from': '2026-03-01 07:00:00', 'to': '2026-03-01 08:59:59', 'source': '1h'})
+        self.assertEqual((result['source'], result['resolution_s'], result['rows']), ('1h', 3600, 2))
+
+    def test_long_span_stays_raw(self):
+        result = self.stats(**{'from': '2016-03-01 00:00:00', 'to': '2026-03-02 00:00:00'})
+        self.assertEqual((result['source'], result['resolution_s'], result['rows']), ('raw', None, 120))
+        self.assertAlmostEqual(result['fields']['temp_out_c']['p50'], statistics.median(self.temps))
+
+    def test_raw_rows_streamed_in_chunks(self):
+        previous, stats.FETCH_CHUNK = stats.FETCH_CHUNK, 7
+        try:
+            result = self.stats(**{'from': '2026-03-01 07:00:00', 'to': '2026-03-01 08:59:59'})
+        finally:
+            stats.FETCH_CHUNK = previous
+        self.assertEqual(result['rows'], 120)
+        self.assertAlmostEqual(result['fields']['temp_out_c']['p75'], np.percentile(self.temps, 75))
+
+    def test_unknown_source(self):
+        response = self.client.get('/api/weather/stats', query_string={'device': 7301, 'source': 'weekly'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Rolling-window metrics (windows.py) and /api/weather/windows"""
+
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import migrate  # noqa: E402
+from windows import RollingWindows, WindowMax, WindowSum, pressure_trend  # noqa: E402
+import station  # noqa: E402
+
+T0 = 1767225600  # 2026-01-01 00:00:00 UTC
+
+
+def reading(device_id, seconds, **values):
+    return dict(values, device_id=device_id, ts=T0 + seconds,
+                datetime=f'2026-01-01 {7 + seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}')
+
+
+class WindowTest(unittest.TestCase):
+    def test_sum_expires_old_values(self):
+        window = WindowSum(600)
+        for ts, value in ((0, 1.0), (300, 2.0), (600, 3.0)):
+            window.add(ts, value)
+        self.assertEqual((window.count, window.total), (2, 5.0))
+
+    def test_max_drops_smaller_values(self):
+        window = WindowMax(3600)
+        for ts, value in ((0, 5.0), (10, 9.0), (20, 4.0)):
+            window.add(ts, value)
+        self.assertEqual(window.value, 9.0)
+        window.expire(3610)
+        self.assertEqual(window.value, 4.0)
+
+    def test_pressure_trend(self):
+        self.assertEqual(pressure_trend(0.5), 'steady')
+        self.assertEqual(pressure_trend(-2.0), 'falling slowly')
+        self.assertEqual(pressure_trend(7.0), 'rising rapidly')
+
+
+class RollingWindowsTest(unittest.TestCase):
+    def test_windows_end_at_newest_reading(self):
+        windows = RollingWindows()
+        windows.update([reading(1, 0, windspeed_kmh=50.0, wind_gust_kmh=80.0, wind_direction=90,
+                                barometric_pressure_rel_in=30.0, daily_rain_in=0.0)])
+        windows.update([reading(1, seconds, windspeed_kmh=10.0, wind_gust_kmh=20.0, wind_direction=90,
+                                barometric_pressure_rel_in=29.9, daily_rain_in=0.1 * (seconds // 1200))
+                        for seconds in range(1800, 3 * 3600, 600)])
+        snapshot = windows.get(1)
+        self.assertEqual(snapshot['as_of_ts'], T0 + 10200)
+        self.assertEqual(snapshot['wind_avg_10m_kmh'], 10.0)  # the 50 km/h reading left the window
+        self.assertEqual((snapshot['wind_dir_avg_10m'], snapshot['wind_dir_steadiness_10m']), (90.0, 1.0))
+        self.assertEqual(snapshot['gust_max_1h_kmh'], 20.0)
+        self.assertEqual(snapshot['pressure_tendency_3h_in'], -0.1)
+        self.assertEqual(snapshot['pressure_trend'], 'falling slowly')
+        self.assertEqual(snapshot['rain_1h_in'], 0.3)
+
+        # Replayed readings are skipped
+        windows.update([reading(1, 3600, windspeed_kmh=99.0)])
+        self.assertEqual(windows.get(1)['wind_avg_10m_kmh'], 10.0)
+        self.assertIsNone(windows.get(2))
+
+    def test_warm_from_database(self):
+        conn = sqlite3.connect(':memory:')
+        migrate(conn)
+        conn.executemany('INSERT INTO weather_data (device_id, datetime, ts, wind_gust_kmh) VALUES (?, ?, ?, ?)',
+                         [(data['device_id'], data['datetime'], data['ts'], data['wind_gust_kmh'])
+                          for data in (reading(1, 0, wind_gust_kmh=30.0), reading(1, 600, wind_gust_kmh=12.0))])
+        windows = RollingWindows()
+        self.assertEqual(windows.warm(conn), 1)
+        self.assertEqual(windows.get(1)['gust_max_1h_kmh'], 30.0)
+        conn.close()
+
+
+class WindowsEndpointTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.station = station.start()
+        cls.client = cls.station.app.test_client()
+
+    def test_device_and_all_devices(self):
+        self.assertEqual(self.client.get('/api/weather/windows?device=7901').status_code, 404)
+        self.station.save_weather_batch([
+            {'device_id': 7901, 'datetime': '2026-09-01 07:00:00', 'ts': 1788220800, 'wind_gust_kmh': 15.0},
+            {'device_id': 7901, 'datetime': '2026-09-01 07:01:00', 'ts': 1788220860, 'wind_gust_kmh': 11.0},
+        ], publish=False)
+        windows = self.client.get('/api/weather/windows?device=7901').get_json()
+        self.assertEqual((windows['device_id'], windows['as_of'], windows['gust_max_1h_kmh']),
+                         (7901, '2026-09-01 07:01:00', 15.0))
+        devices = self.client.get('/api/weather/windows').get_json()['devices']
+        self.assertEqual(devices['7901']['gust_max_1h_kmh'], 15.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,30 +5,50 @@ Converted from ESP32 C++ code
 """
 
 import os
+import sys
 import json
+import argparse
 import sqlite3
+import signal
+import atexit
 import logging
+import logging.handlers
+import queue
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, send_file, redirect, url_for
-from flask_cors import CORS
+from flask import Flask, Response, g, request, jsonify, render_template, send_file, redirect, url_for, stream_with_context
 import threading
 import time
-import requests
 from pathlib import Path
+from database import Database
+from ingest_queue import IngestQueue, IngestQueueFull
+from schema import WEATHER_COLUMNS
+from rollups import RESOLUTIONS, RollupAggregator, pick_resolution, rollup_point
+from export import FORMATS, ChainedCursor, iter_export
+from serial_buffer import SerialRingBuffer, SharedSerialBuffer
+from live_feed import LiveFeed, StreamSlots
+from forwarder import INSERT_OUTBOX_SQL, Forwarder, uplink_payload
+from fields import IDENTITY_KEYS, format_timestamp, parse_form, parse_json, parse_timestamp
+from bulk import FORMATS as BULK_FORMATS, BulkFormatError, format_for, iter_records
+from workers import ActivityClock, OwnerLock
+from page_cache import DirectoryListing, RenderCache
+from latest_cache import LatestReadings
+from windows import RollingWindows
+from metrics import Registry
+from profiler import SamplingProfiler
+from maintenance import IngestRate, Maintenance, combine_reports
+from shards import MergedCursor, Shard, ShardRouter, merge_rows, prepare_storage, shard_paths
+from quality import CHECKS as QUALITY_CHECKS, QualityControl
+from binary import (ACK_BUSY, ACK_INVALID, ACK_OK, HEADER as BINARY_HEADER, RECORD as BINARY_RECORD,
+                    BinaryFormatError, UDPListener, decode as decode_binary)
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/weather_station.log'),
-        logging.StreamHandler()
-    ]
-)
+# Logging is set up by create_app() (configure_logging)
+LOG_FILE = 'logs/weather_station.log'
+log_listener = None
 logger = logging.getLogger(__name__)
 
+# Routes are registered on import; create_app() prepares the process around it
 app = Flask(__name__)
-CORS(app)
+_app_ready = False
 
 # Configuration
 class Config:
@@ -40,6 +60,65 @@ class Config:
         self.post_interval = 3  # seconds
         self.watchdog_timeout = 60  # seconds
         
+        # SQLite tuning
+        self.db_cache_size_kb = 8192  # page cache per connection
+        self.db_mmap_size = 64 * 1024 * 1024  # bytes of the database file memory-mapped
+        self.db_pool_size = 8  # idle connections kept for request threads
+        self.history_max_points = 500  # default point budget for /api/weather/history
+        self.export_page_size = 1000  # rows fetched from the cursor per export chunk
+        
+        # Storage sharded by device_id (shards.py); 0 keeps every station in db_file.
+        # With N shards device d is stored in shard_dir/weather-<d % N>.db, and the
+        # ingest queue, page cache and mmap sizes above apply per shard (the
+        # latter two divided by N)
+        self.shard_count = int(os.environ.get('WEATHER_STATION_SHARDS', '0'))
+        self.shard_dir = "data/shards"
+        self.shard_query_threads = 4  # threads fanning queries over every device out to the shards
+        
+        # Columnar archive of old readings
+        self.archive_dir = "data/archive"
+        self.archive_after_days = 90  # readings older than this leave weather_data
+        self.archive_interval = 6 * 3600  # seconds between archive runs
+        
+        # Retention, VACUUM and file rotation (maintenance.py)
+        # Days kept per resolution, None keeps everything. Raw readings otherwise
+        # leave through the archive; raw retention below archive_after_days
+        # deletes them before they are archived.
+        self.retention_days = {'raw': None, '1m': 365, '1h': None, '1d': None, 'quarantine': 90}
+        self.maintenance_interval = 3600  # seconds between retention / rotation runs
+        self.maintenance_check_interval = 60  # seconds between ingest rate samples
+        self.maintenance_quiet_fraction = 0.5  # vacuum when ingest is below this share of its average
+        self.maintenance_vacuum_max_delay = 24 * 3600  # seconds a due vacuum waits for a quiet period at most
+        self.maintenance_convert_vacuum = False  # allow one full VACUUM to enable incremental vacuum on an old database
+        self.maintenance_chunk_size = 2000  # rows deleted per transaction
+        self.maintenance_vacuum_pages = 2000  # pages released per incremental vacuum step
+        self.csv_rotate_bytes = 16 * 1024 * 1024  # the legacy CSV file is rotated past this size
+        self.log_rotate_bytes = 8 * 1024 * 1024  # the log file is moved aside and compressed past this size
+        self.rotated_keep = 30  # compressed CSV and log files kept of each
+        
+        # Quality control of incoming readings (quality.py)
+        self.qc_enabled = True
+        self.qc_mode = "quarantine"  # quarantine: failing values are stored as NULL; flag: stored unchanged
+        self.qc_window = 60  # recent values per device and field for the median / MAD
+        self.qc_min_samples = 20  # values needed before the z-score check applies
+        self.qc_z_threshold = 6.0  # robust z-score beyond which a value is an outlier
+        
+        # Write-behind ingest queue
+        self.ingest_queue_size = 1000  # readings pending before /post answers 503
+        self.ingest_batch_size = 100  # readings per transaction
+        self.ingest_flush_interval = 1.0  # seconds
+        self.ingest_retry_after = 5  # seconds, sent in Retry-After on 503
+        self.ingest_retries = 3  # further attempts at a batch that failed to store
+        self.ingest_retry_backoff = 0.5  # seconds before the first retry, doubling
+        self.ingest_spill_file = "data/ingest-spill.ndjson"  # batches that failed every retry, stored once writes succeed
+        self.bulk_batch_size = 5000  # readings per transaction for /api/weather/bulk
+        self.bulk_max_errors = 100  # rejected records listed in a bulk response
+        
+        # Compact binary ingest (binary.py): POST /api/weather/binary, and UDP when a port is set
+        self.binary_max_records = 1000  # records per HTTP message
+        self.udp_host = "0.0.0.0"
+        self.udp_port = int(os.environ.get('WEATHER_STATION_UDP_PORT', '0')) or None  # listened to by the process running the background services
+        
         # Default settings
         self.settings = {
             "ssid": "weather_station",
@@ -50,31 +129,120 @@ class Config:
             "gateway": "192.168.8.1",
             "subnet": "255.255.255.0",
             "dnsServer": "8.8.8.8",
-            "postUrl": "http://localhost:5000/api/weather"
+            "postUrl": "http://localhost:5000/api/weather",
+            "csvMirror": True,  # legacy per-reading append to data/weather_data.csv
+            "forwardEnabled": False,  # forward readings to postUrl (store-and-forward)
+            "timezoneOffset": 7  # hours added to the stations' dateutc (GMT+7)
         }
         
         # Serial buffer for logging
-        self.serial_buffer = []
         self.serial_buffer_size = 20
-        self.serial_buffer_index = 0
+        self.serial_keepalive = 15  # seconds between SSE keep-alive comments
+        
+        # Live reading feed
+        self.live_queue_size = 100  # messages buffered per subscriber before it is dropped
+        
+        # Streams (SSE / WebSocket) hold a request thread each for as long as they are
+        # open; at most max_streams per process, 0: half of the request threads, so
+        # dashboards can never take the threads stations post to
+        self.threads = int(os.environ.get('WEATHER_STATION_THREADS', '8'))  # request threads per process (--threads)
+        self.max_streams = int(os.environ.get('WEATHER_STATION_MAX_STREAMS', '0'))
+        self.stream_poll_interval = 0.5  # seconds, the dashboard stream checks the serial buffer
         
-        # Watchdog
-        self.watchdog_timer = 0
-        self.last_activity = time.time()
+        # Upstream forwarder
+        self.forward_batch_size = 50  # readings per upstream POST (1 posts a bare object like the ESP32)
+        self.forward_timeout = 10  # seconds
+        self.forward_backoff_max = 300  # seconds between retries at most
+        
+        # Serving; with several worker processes (gunicorn.conf.py) state they
+        # share lives in data/ and one elected worker runs the background services
+        self.workers = int(os.environ.get('WEATHER_STATION_WORKERS', '1'))
+        self.shared_state = self.workers > 1
+        self.owner_lock_file = "data/.owner.lock"
+        self.activity_file = "data/.activity"
+        self.serial_db_file = "data/serial.db"
+        self.owner_retry_interval = 5  # seconds between takeover attempts of the other workers
+        self.async_backlog = 1024  # pending connections of the asyncio server (--server async)
+        self.async_keepalive = 75  # seconds an idle keep-alive connection stays open
+        self.async_max_body = 1024 * 1024  # bytes of a request body
+        self.live_poll_interval = 1.0  # seconds, live feed and latest readings tailing the database with several workers
+        self.latest_rate_window = 20  # readings per device the reading rate in /api/devices covers
+        self.low_battery_volts = 2.5  # wh65_batt below this is reported as low (0/1 values are a flag)
+        
+        # Metrics (/metrics) and the sampling profiler (/profile/start, /profile/stop)
+        self.metrics_sqlite = True  # time every SQLite statement (a few microseconds each)
+        self.profile_interval = 0.005  # seconds between stack samples
+        self.profile_min_interval = 0.001  # shorter intervals would keep a core busy sampling
+        self.profile_dir = "logs"  # where stopped profiles are written as profile-<time>.folded
 
 config = Config()
 
+# In process memory; with several workers create_app() replaces both by ones shared through data/
+serial_buffer = SerialRingBuffer(config.serial_buffer_size)
+activity = ActivityClock()
+live_feed = LiveFeed(config.live_queue_size)
+stream_slots = StreamSlots(0)  # limit set by create_app()
+# The database files in data/ are in use and not listed for download / deletion
+data_files = DirectoryListing(os.path.dirname(config.data_file),
+                              protected=(os.path.basename(config.db_file), os.path.basename(config.serial_db_file)))
+dashboard_cache = RenderCache()
+latest_readings = LatestReadings(config.latest_rate_window, config.low_battery_volts)
+rolling_windows = RollingWindows()
+owner_lock = OwnerLock(config.owner_lock_file)
+profiler = SamplingProfiler(config.profile_interval)
+
+# Metrics of this process (with gunicorn every worker exports its own)
+metrics = Registry('weather_')
+http_requests = metrics.counter('http_requests_total', "HTTP requests by route, method and status",
+                                ('route', 'method', 'status'))
+http_duration = metrics.histogram('http_request_duration_seconds', "Time to build the response (streams: until the first byte)",
+                                  ('route', 'method'))
+sqlite_duration = metrics.histogram('sqlite_statement_seconds', "SQLite statement and commit time", ('kind',))
+ingest_batch_duration = metrics.histogram('ingest_batch_seconds', "Time to store a batch of readings, CSV mirror included")
+csv_append_duration = metrics.histogram('csv_append_seconds', "Time to append a batch to the legacy CSV file")
+readings_received = metrics.counter('readings_received_total', "Readings accepted for storage by source", ('source',))
+readings_rejected = metrics.counter('readings_rejected_total', "Readings rejected as invalid by source", ('source',))
+readings_stored = metrics.counter('readings_stored_total', "Readings written to the database")
+readings_duplicate = metrics.counter('readings_duplicate_total', "Readings skipped as already stored")
+quality_failures = metrics.counter('quality_failures_total', "Values failing quality control by field and check",
+                                   ('field', 'check'))
+ingest_backpressure = metrics.counter('ingest_backpressure_total', "Readings refused with 503 because the ingest queue was full")
+seconds_since_ingest = metrics.gauge('seconds_since_last_ingest', "Seconds since the last reading arrived (set by the watchdog)")
+ingest_queue_depth = metrics.gauge('ingest_queue_depth', "Readings waiting for the ingest writer")
+db_size = metrics.gauge('db_size_bytes', "Size of the database file plus its write-ahead log")
+live_subscribers = metrics.gauge('live_feed_subscribers', "Connected live feed clients")
+open_streams = metrics.gauge('open_streams', "SSE / WebSocket streams holding a request thread")
+streams_refused = metrics.counter('streams_refused_total', "Streams refused with 503 because max_streams were open")
+forwarder_sent = metrics.gauge('forwarder_sent_readings', "Readings forwarded upstream since start")
+forwarder_failures = metrics.gauge('forwarder_consecutive_failures', "Failed upstream posts since the last success")
+
+# Database files and their writers, opened by create_app() (open_shards); one shard unless sharded
+shards = ShardRouter(config.shard_query_threads)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and observe its duration, labelled by URL rule to keep the label set small"""
+    started = g.pop('request_started', None)
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    http_requests.labels(route, request.method, str(response.status_code)).inc()
+    if started is not None:
+        http_duration.labels(route, request.method).observe(time.perf_counter() - started)
+    return response
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Return the request thread's database connections to the pools"""
+    shards.release()
+
 def add_to_serial_buffer(message):
     """Add message to serial buffer (equivalent to addToSerialBuffer in C++)"""
     timestamped_message = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}"
     logger.info(timestamped_message)
-    
-    # Initialize buffer if not already done
-    if not config.serial_buffer:
-        config.serial_buffer = [""] * config.serial_buffer_size
-    
-    config.serial_buffer[config.serial_buffer_index] = timestamped_message
-    config.serial_buffer_index = (config.serial_buffer_index + 1) % config.serial_buffer_size
+    serial_buffer.add(timestamped_message)
 
 def load_settings():
     """Load settings from JSON file (equivalent to loadSettings in C++)"""
@@ -95,117 +263,434 @@ def load_settings():
         add_to_serial_buffer("Settings file not found. Using default settings...")
         save_settings()
 
+settings_mtime = None
+
+@app.before_request
+def sync_settings():
+    """Pick up settings saved by another worker process"""
+    global settings_mtime
+    if not config.shared_state:
+        return
+    try:
+        mtime = os.stat(config.settings_file).st_mtime
+    except OSError:
+        return
+    if mtime != settings_mtime:
+        settings_mtime = mtime
+        try:
+            with open(config.settings_file, 'r') as file:
+                config.settings.update(json.load(file))
+            data_files.invalidate()
+        except (OSError, ValueError) as e:
+            add_to_serial_buffer(f"Failed to reload settings file: {str(e)}")
+
 def save_settings():
     """Save settings to JSON file (equivalent to saveSettings in C++)"""
     try:
         os.makedirs(os.path.dirname(config.settings_file), exist_ok=True)
         with open(config.settings_file, 'w') as file:
             json.dump(config.settings, file, indent=2)
+        data_files.invalidate()
         add_to_serial_buffer("Settings saved successfully")
     except Exception as e:
         add_to_serial_buffer(f"Failed to save settings: {str(e)}")
 
 def init_database():
-    """Initialize SQLite database for weather data"""
+    """Initialize SQLite database for weather data (the in-memory state is loaded by warm_caches)"""
     try:
         os.makedirs(os.path.dirname(config.db_file), exist_ok=True)
-        conn = sqlite3.connect(config.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS weather_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id INTEGER NOT NULL,
-                datetime TEXT NOT NULL,
-                windspeed_kmh REAL,
-                wind_direction INTEGER,
-                rain_rate_in REAL,
-                temp_in_c REAL,
-                temp_out_c REAL,
-                humidity_in INTEGER,
-                humidity_out INTEGER,
-                uv_index REAL,
-                wind_gust_kmh REAL,
-                barometric_pressure_rel_in REAL,
-                barometric_pressure_abs_in REAL,
-                solar_radiation_wm2 REAL,
-                daily_rain_in REAL,
-                rain_today_in REAL,
-                total_rain_in REAL,
-                weekly_rain_in REAL,
-                monthly_rain_in REAL,
-                yearly_rain_in REAL,
-                max_daily_gust REAL,
-                wh65_batt REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        # Migrates every database file and moves stations stored outside their shard
+        prepare_storage(config.db_file, config.shard_dir, config.shard_count, log=add_to_serial_buffer,
+                        utc_offset_hours=utc_offset_hours())
         add_to_serial_buffer("Database initialized successfully")
     except Exception as e:
         add_to_serial_buffer(f"Failed to initialize database: {str(e)}")
 
-def save_weather_data(data):
-    """Save weather data to database and CSV file"""
+def warm_caches(shard):
+    """Load rollup state, latest readings, rolling windows and quality control history from a shard's database
+
+    Run by the shard's ingest writer before its first batch: the server
+    accepts (queues) readings while this reads, and every update of these
+    caches happens after it.
+    """
     try:
-        # Save to database
-        conn = sqlite3.connect(config.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO weather_data (
-                device_id, datetime, windspeed_kmh, wind_direction, rain_rate_in,
-                temp_in_c, temp_out_c, humidity_in, humidity_out,
-                uv_index, wind_gust_kmh, barometric_pressure_rel_in,
-                barometric_pressure_abs_in, solar_radiation_wm2,
-                daily_rain_in, rain_today_in, total_rain_in,
-                weekly_rain_in, monthly_rain_in, yearly_rain_in,
-                max_daily_gust, wh65_batt
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('device_id', 1),
-            data.get('datetime', ''),
-            data.get('windspeed_kmh', 0),
-            data.get('wind_direction', 0),
-            data.get('rain_rate_in', 0),
-            data.get('temp_in_c', 0),
-            data.get('temp_out_c', 0),
-            data.get('humidity_in', 0),
-            data.get('humidity_out', 0),
-            data.get('uv_index', 0),
-            data.get('wind_gust_kmh', 0),
-            data.get('barometric_pressure_rel_in', 0),
-            data.get('barometric_pressure_abs_in', 0),
-            data.get('solar_radiation_wm2', 0),
-            data.get('daily_rain_in', 0),
-            data.get('rain_today_in', 0),
-            data.get('total_rain_in', 0),
-            data.get('weekly_rain_in', 0),
-            data.get('monthly_rain_in', 0),
-            data.get('yearly_rain_in', 0),
-            data.get('max_daily_gust', 0),
-            data.get('wh65_batt', 0)
+        started = time.perf_counter()
+        conn = shard.db.connection()
+        shard.rollups.warm(conn)
+        devices = latest_readings.warm(conn)
+        rolling_windows.warm(conn)
+        if shard.quality is not None:
+            shard.quality.warm(conn)
+        add_to_serial_buffer(f"Caches loaded for {devices} devices in {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        add_to_serial_buffer(f"Failed to load caches: {str(e)}")
+    finally:
+        shard.warmed.set()
+
+INSERT_WEATHER_SQL = f'''
+    INSERT OR IGNORE INTO weather_data ({', '.join(WEATHER_COLUMNS)}, ts)
+    VALUES ({', '.join('?' * (len(WEATHER_COLUMNS) + 1))})
+'''
+
+def utc_offset_hours():
+    """Station timezone offset from UTC in hours (settings 'timezoneOffset')"""
+    return float(config.settings.get('timezoneOffset', 7))
+
+def reading_ts(data):
+    """UTC epoch seconds of a reading, derived from its station-local datetime when not parsed yet"""
+    ts = data.get('ts')
+    if ts is None:
+        try:
+            ts = parse_timestamp(str(data.get('datetime', ''))) - int(utc_offset_hours() * 3600)
+        except ValueError:
+            ts = None
+    return ts
+
+def stamp_received(data):
+    """Give a reading that arrived without a timestamp the server's clock"""
+    data['ts'] = int(time.time())
+    data['datetime'] = format_timestamp(data['ts'] + int(utc_offset_hours() * 3600))
+
+def archived_stamps(device_id, stamps):
+    """Those of a device's reading datetimes whose readings were moved to the archive"""
+    if not os.path.isdir(config.archive_dir):
+        return []  # nothing archived yet, numpy need not be imported
+    archive = get_archive()
+    if archive is None:
+        return []
+    epochs = {}
+    for stamp in stamps:
+        try:
+            # Archived epochs are the stored (station-local) datetimes read as UTC
+            epochs[parse_timestamp(stamp)] = stamp
+        except ValueError:
+            pass
+    if not epochs:
+        return []
+    archived = archive.archived_epochs(device_id, min(epochs), max(epochs))
+    return [stamp for epoch, stamp in epochs.items() if epoch in archived]
+
+def drop_duplicate_readings(conn, readings):
+    """Readings whose (device_id, datetime) is not stored yet (nor archived) nor repeated earlier in the batch"""
+    stamps = {}
+    for data in readings:
+        stamps.setdefault(data.get('device_id', 1), []).append(data.get('datetime', ''))
+    seen = set()
+    for device_id, values in stamps.items():
+        seen.update((device_id, row[0]) for row in conn.execute(
+            'SELECT datetime FROM weather_data WHERE device_id = ? AND datetime BETWEEN ? AND ?',
+            (device_id, min(values), max(values))
         ))
+        # Archived readings left weather_data; a replayed backlog must not store them again
+        seen.update((device_id, stamp) for stamp in archived_stamps(device_id, values))
+    
+    fresh = []
+    for data in readings:
+        key = (data.get('device_id', 1), data.get('datetime', ''))
+        if key not in seen:
+            seen.add(key)
+            fresh.append(data)
+    return fresh
+
+def weather_row(data):
+    """Convert a weather data dict into an INSERT parameter tuple"""
+    return (
+        data.get('device_id', 1),
+        data.get('datetime', ''),
+    ) + tuple(data.get(column) for column in WEATHER_COLUMNS[2:]) + (reading_ts(data),)
+
+def weather_csv_line(data):
+    """Format a weather data dict as a line of the legacy CSV file (no device_id, missing values empty)"""
+    return ','.join('' if data.get(column) is None else str(data[column]) for column in WEATHER_COLUMNS[1:])
+
+def format_field_errors(errors):
+    """Render per-field parse errors for a plain-text response"""
+    return '; '.join(f"{key}: {message}" for key, message in errors.items())
+
+INSERT_QUARANTINE_SQL = '''
+    INSERT INTO quarantine (device_id, datetime, ts, field, value, check_name, detail, action)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Appends to the legacy CSV file, shared by the shards' writers
+csv_lock = threading.Lock()
+
+def save_weather_batch(readings, publish=True, shard=None):
+    """Save a batch of weather readings to database and CSV file in one transaction
+
+    Readings already stored for the same device and timestamp are skipped;
+    returns the number of readings saved. Without `shard` the readings are
+    split over their devices' shards, one transaction each.
+    """
+    if shard is None:
+        return sum(save_weather_batch(group, publish, shard) for shard, group in shards.split(readings))
+    forward = config.settings.get('forwardEnabled', False)
+    received = len(readings)
+    with shard.write_lock, ingest_batch_duration.time():
+        conn = shard.db.connection()
+        with conn:
+            # Take SQLite's write lock up front so the duplicate check and the
+            # insert are atomic, also against writers in other worker processes
+            conn.execute('BEGIN IMMEDIATE')
+            if config.shared_state:
+                # Another worker may have stored newer readings since this one last wrote
+                shard.rollups.warm(conn)
+            readings = drop_duplicate_readings(conn, readings)
+            readings_duplicate.inc(received - len(readings))
+            if not readings:
+                return 0
+            
+            # Quality control first: quarantined values are stored as NULL and kept out of the rollups
+            quarantined = []
+            if shard.quality is not None:
+                if config.shared_state:
+                    # Other workers store part of each device's readings; check against all of them
+                    shard.quality.reload(conn, {data.get('device_id', 1) for data in readings})
+                quarantined = shard.quality.check(readings)
+            if quarantined:
+                conn.executemany(INSERT_QUARANTINE_SQL, quarantined)
+            
+            # Save to database, rollups are updated in the same transaction
+            rollup_rows, rain_counters = shard.rollups.prepare(readings)
+            conn.executemany(INSERT_WEATHER_SQL, [weather_row(data) for data in readings])
+            shard.rollups.apply(conn, rollup_rows)
+            if forward:
+                conn.executemany(INSERT_OUTBOX_SQL, [(uplink_payload(data),) for data in readings])
+        shard.rollups.commit(rain_counters)
+        readings_stored.inc(len(readings))
+        for row in quarantined:
+            quality_failures.labels(row[3], row[5]).inc()
+        if not config.shared_state:
+            # With several workers these follow the database instead (feed_tail_worker)
+            latest_readings.update(readings)
+            rolling_windows.update(readings)
+        if forward:
+            shard.forwarder.notify()
         
-        conn.commit()
-        conn.close()
-        
-        # Save to CSV file (for compatibility with original system)
-        csv_line = f"{data.get('datetime', '')},{data.get('windspeed_kmh', 0)},{data.get('wind_direction', 0)},{data.get('rain_rate_in', 0)},{data.get('temp_in_c', 0)},{data.get('temp_out_c', 0)},{data.get('humidity_in', 0)},{data.get('humidity_out', 0)},{data.get('uv_index', 0)},{data.get('wind_gust_kmh', 0)},{data.get('barometric_pressure_rel_in', 0)},{data.get('barometric_pressure_abs_in', 0)},{data.get('solar_radiation_wm2', 0)},{data.get('daily_rain_in', 0)},{data.get('rain_today_in', 0)},{data.get('total_rain_in', 0)},{data.get('weekly_rain_in', 0)},{data.get('monthly_rain_in', 0)},{data.get('yearly_rain_in', 0)},{data.get('max_daily_gust', 0)},{data.get('wh65_batt', 0)}"
-        
-        os.makedirs(os.path.dirname(config.data_file), exist_ok=True)
-        with open(config.data_file, 'a') as file:
-            file.write(csv_line + '\n')
-        
-        add_to_serial_buffer("Weather data saved successfully")
+        # Save to CSV file (legacy mode for compatibility with original system, see /api/weather/export)
+        if config.settings.get('csvMirror', True):
+            with csv_lock, csv_append_duration.time():
+                os.makedirs(os.path.dirname(config.data_file), exist_ok=True)
+                with open(config.data_file, 'a') as file:
+                    file.write(''.join(weather_csv_line(data) + '\n' for data in readings))
+        data_files.invalidate()
+    
+    add_to_serial_buffer(f"Weather data saved successfully ({len(readings)} readings)")
+    if publish:
+        publish_readings(readings)
+    return len(readings)
+
+def publish_readings(readings):
+    """Fan stored readings out to live feed subscribers, with the device's rolling windows"""
+    if not live_feed.subscriber_count or config.shared_state:
+        # With several workers the feed tails the database instead (feed_tail_worker)
+        return
+    windows = {}
+    for data in readings:
+        device_id = data.get('device_id', 1)
+        if device_id not in windows:
+            windows[device_id] = rolling_windows.get(device_id)
+        live_feed.publish(device_id, json.dumps(dict(data, windows=windows[device_id]), default=str))
+
+def save_weather_data(data):
+    """Save weather data to database and CSV file"""
+    try:
+        save_weather_batch([data])
         return True
-        
     except Exception as e:
         add_to_serial_buffer(f"Failed to save weather data: {str(e)}")
         return False
 
+def on_ingest_error(error, readings):
+    """Report a batch the ingest writer failed to store after its retries (it goes to the spill file)"""
+    add_to_serial_buffer(f"Failed to save weather data ({len(readings)} readings): {str(error)}")
+
+def open_shard(index, path):
+    """A database file with its writer state: ingest queue, rollups, quality control, outbox forwarder, maintenance
+
+    Writers of a shard (its ingest queue, bulk uploads, maintenance) take
+    shard.write_lock: the rollup and quality control state is not thread-safe.
+    """
+    share = max(1, config.shard_count)
+    shard = Shard(index, path, Database(
+        path,
+        cache_size_kb=config.db_cache_size_kb // share,
+        mmap_size=config.db_mmap_size // share,
+        max_idle=config.db_pool_size,
+        observe=(lambda kind, seconds: sqlite_duration.labels(kind).observe(seconds)) if config.metrics_sqlite else None
+    ))
+    shard.rollups = RollupAggregator()
+    shard.quality = QualityControl(config.qc_window, config.qc_min_samples, config.qc_z_threshold,
+                                   config.qc_mode) if config.qc_enabled else None
+    spill_base, spill_ext = os.path.splitext(config.ingest_spill_file)
+    shard.ingest_queue = IngestQueue(
+        lambda readings: save_weather_batch(readings, shard=shard),
+        max_depth=config.ingest_queue_size,
+        batch_size=config.ingest_batch_size,
+        flush_interval=config.ingest_flush_interval,
+        on_error=on_ingest_error,
+        on_start=lambda: warm_caches(shard),
+        name=f'ingest-writer-{index}' if config.shard_count else 'ingest-writer',
+        retries=config.ingest_retries,
+        retry_backoff=config.ingest_retry_backoff,
+        spill_file=f'{spill_base}-{index}{spill_ext}' if config.shard_count else config.ingest_spill_file,
+        log=add_to_serial_buffer
+    )
+    shard.forwarder = Forwarder(
+        shard.db,
+        lambda: config.settings['postUrl'],
+        batch_size=config.forward_batch_size,
+        timeout=config.forward_timeout,
+        backoff_max=config.forward_backoff_max,
+        log=add_to_serial_buffer
+    )
+    shard.maintenance = Maintenance(
+        shard.db,
+        shard.write_lock,
+        config.retention_days,
+        path,
+        config.data_file,
+        LOG_FILE,
+        chunk_size=config.maintenance_chunk_size,
+        vacuum_pages=config.maintenance_vacuum_pages,
+        csv_rotate_bytes=config.csv_rotate_bytes,
+        log_rotate_bytes=config.log_rotate_bytes,
+        rotated_keep=config.rotated_keep,
+        csv_lock=csv_lock
+    )
+    return shard
+
+def open_shards():
+    """Open the database files of the configured layout (config.shard_count), once per process"""
+    if not len(shards):
+        paths = shard_paths(config.db_file, config.shard_dir, config.shard_count)
+        shards.open(open_shard(index, path) for index, path in enumerate(paths))
+
+maintenance_lock = threading.Lock()
+maintenance_report = None
+
+def queue_weather_data(data):
+    """Queue weather data for its shard's background writer, returns False when the queue is full"""
+    try:
+        shards.route(data.get('device_id', 1)).ingest_queue.put(data)
+        return True
+    except IngestQueueFull as e:
+        ingest_backpressure.inc()
+        add_to_serial_buffer(f"Ingest backpressure: {str(e)}")
+        return False
+
+def database_size():
+    """Bytes of the database files and their WALs"""
+    total = 0
+    for shard in shards:
+        for path in (shard.path, shard.path + '-wal'):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+    return total
+
+ingest_queue_depth.set_function(lambda: sum(shard.ingest_queue.depth for shard in shards))
+db_size.set_function(database_size)
+live_subscribers.set_function(lambda: live_feed.subscriber_count)
+open_streams.set_function(lambda: stream_slots.open)
+forwarder_sent.set_function(lambda: sum(shard.forwarder.sent for shard in shards))
+forwarder_failures.set_function(lambda: max((shard.forwarder.failures for shard in shards), default=0))
+
+def shutdown_ingest(*args):
+    """Flush queued readings to the database before the process exits"""
+    udp_listener.stop()
+    for shard in shards:
+        shard.ingest_queue.stop()
+    for shard in shards:
+        shard.forwarder.stop()
+    shards.close_all()
+    serial_buffer.flush(timeout=1.0)
+    stop_logging()
+
+def handle_sigterm(signum, frame):
+    """Turn SIGTERM (systemctl stop) into a normal exit so queued readings get flushed"""
+    raise SystemExit(0)
+
+_archive = None
+
+def get_archive():
+    """Return the columnar archive, or None when numpy is not installed"""
+    global _archive
+    if _archive is None:
+        try:
+            from archive import Archive
+        except ImportError:
+            return None
+        _archive = Archive(config.archive_dir, config.archive_after_days, delete_chunk=config.maintenance_chunk_size)
+    return _archive
+
+def archive_worker():
+    """Periodically move old readings out of weather_data into the columnar archive"""
+    while True:
+        time.sleep(config.archive_interval)
+        archive = get_archive()
+        if archive is None:
+            add_to_serial_buffer("Archive disabled: numpy is not installed")
+            return
+        try:
+            moved = sum(archive.run(shard.db.connection(), write_lock=shard.write_lock) for shard in shards)
+            if moved:
+                add_to_serial_buffer(f"Archived {moved} readings older than {config.archive_after_days} days ({archive.format})")
+        except Exception as e:
+            add_to_serial_buffer(f"Archive run failed: {str(e)}")
+
+def run_maintenance(vacuum=True, convert=False):
+    """One maintenance pass, reported to the serial buffer; None when a pass is already running"""
+    if not maintenance_lock.acquire(blocking=False):
+        return None
+    global maintenance_report
+    try:
+        # Files are rotated once, with the first shard
+        report = combine_reports([shard.maintenance.run(vacuum=vacuum, convert=convert, files=shard.index == 0)
+                                  for shard in shards])
+        maintenance_report = report
+    finally:
+        maintenance_lock.release()
+    data_files.invalidate()
+    deleted = sum(report['deleted'].values())
+    add_to_serial_buffer(f"Maintenance: {deleted} rows past retention deleted, "
+                         f"{report['reclaimed_bytes']['total'] / 1024:.0f} KB reclaimed "
+                         f"(vacuum: {report['vacuum']}) in {report['duration_s']} s")
+    return report
+
+def maintenance_worker():
+    """Retention and file rotation every maintenance_interval; VACUUM / ANALYZE when ingest is quiet
+
+    The ingest rate is sampled every maintenance_check_interval. A due
+    vacuum runs once the rate drops below maintenance_quiet_fraction of its
+    average, or after maintenance_vacuum_max_delay regardless.
+    """
+    rate = IngestRate()
+    last_run = last_vacuum = time.monotonic()
+    while True:
+        time.sleep(config.maintenance_check_interval)
+        try:
+            rate.sample(sum(shard.db.connection().execute('SELECT COALESCE(MAX(id), 0) FROM weather_data').fetchone()[0]
+                            for shard in shards))
+            now = time.monotonic()
+            vacuum_due = now - last_vacuum >= config.maintenance_interval and (
+                rate.quiet(config.maintenance_quiet_fraction)
+                or now - last_vacuum >= config.maintenance_vacuum_max_delay
+            )
+            if not vacuum_due and now - last_run < config.maintenance_interval:
+                continue
+            if run_maintenance(vacuum_due, config.maintenance_convert_vacuum) is not None:
+                last_run = now
+                if vacuum_due:
+                    last_vacuum = now
+        except Exception as e:
+            add_to_serial_buffer(f"Maintenance run failed: {str(e)}")
+
+def to_epoch(value):
+    """Seconds for a station-local datetime, matching SQLite strftime('%s', datetime)"""
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
 def get_connected_devices():
     """Get list of connected devices (simplified version)"""
     # This would need to be implemented based on your network setup
@@ -213,37 +698,88 @@ def get_connected_devices():
 
 def watchdog_timer():
     """Watchdog timer to monitor system health"""
+    last_alarm = 0
     while True:
         time.sleep(1)
-        config.watchdog_timer += 1
+        now = time.time()
+        idle = activity.idle_seconds()
+        seconds_since_ingest.set(round(idle, 3))
         
-        if config.watchdog_timer >= config.watchdog_timeout:
+        if idle >= config.watchdog_timeout and now - last_alarm >= config.watchdog_timeout:
             add_to_serial_buffer("Watchdog timeout! Restarting system...")
             # In a real implementation, you might want to restart the service
-            config.watchdog_timer = 0
+            last_alarm = now
+
+def feed_tail_worker():
+    """With several workers, feed the latest readings cache, rolling windows and local live subscribers from the database
+
+    Readings stored by any worker show up here, the local writer only sees its own.
+    """
+    for shard in shards:
+        shard.warmed.wait()  # tailing starts where the warmed caches end
+    last_ids = {}
+    while True:
+        try:
+            for shard in shards:
+                db = shard.db
+                last_id = last_ids.get(shard.index)
+                if last_id is None:
+                    last_ids[shard.index] = db.execute('SELECT COALESCE(MAX(id), 0) FROM weather_data').fetchone()[0]
+                    continue
+                rows = [dict(row) for row in db.query(
+                    'SELECT * FROM weather_data WHERE id > ? ORDER BY id LIMIT 1000', (last_id,))]
+                if rows:
+                    last_ids[shard.index] = rows[-1]['id']
+                    latest_readings.update(rows)
+                    rolling_windows.update(rows)
+                if live_feed.subscriber_count:
+                    for data in rows:
+                        data['windows'] = rolling_windows.get(data['device_id'])
+                        live_feed.publish(data['device_id'], json.dumps(data, default=str))
+        except Exception as e:
+            add_to_serial_buffer(f"Live feed tail failed: {str(e)}")
+        time.sleep(config.live_poll_interval)
+
+@app.template_filter('fixed')
+def format_fixed(value):
+    """Jinja filter: a measurement with one decimal, empty when it is missing (as fixed() in the page script)"""
+    return '' if value is None else '%.1f' % value
+
+@app.template_filter('localtime')
+def format_localtime(epoch):
+    """Jinja filter: epoch seconds as server-local 'YYYY-MM-DD HH:MM:SS'"""
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
+
+def render_dashboard(files):
+    """Render index.html with the recent readings"""
+    recent_data = merge_rows(shards.map(lambda db: db.query('SELECT * FROM weather_data ORDER BY id DESC LIMIT 10')),
+                             key=lambda row: row['created_at'] or '', reverse=True, limit=10)
+    return render_template('index.html', 
+                         settings=config.settings,
+                         latest=latest_readings.latest(),
+                         recent_data=recent_data,
+                         files=files,
+                         connected_devices=get_connected_devices())
 
 # Flask Routes
 @app.route('/')
 def handle_root():
-    """Main web interface (equivalent to handleRoot in C++)"""
+    """Main web interface (equivalent to handleRoot in C++)
+
+    The page is rendered again only after a new reading was stored or the
+    data directory (including settings.json) changed; browsers revalidate
+    with If-None-Match / If-Modified-Since and get 304 otherwise.
+    """
     try:
-        # Get recent weather data
-        conn = sqlite3.connect(config.db_file)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM weather_data ORDER BY created_at DESC LIMIT 10')
-        recent_data = cursor.fetchall()
-        conn.close()
-        
-        # Get file list
-        files = []
-        if os.path.exists('data'):
-            files = [f for f in os.listdir('data') if os.path.isfile(os.path.join('data', f))]
+        latest_id = tuple(shards.map(lambda db: db.execute('SELECT MAX(id) FROM weather_data').fetchone()[0]))
+        files = data_files.entries()
+        page = dashboard_cache.get((latest_id, data_files.generation), lambda: render_dashboard(files))
         
-        return render_template('index.html', 
-                             settings=config.settings,
-                             recent_data=recent_data,
-                             files=files,
-                             connected_devices=get_connected_devices())
+        response = Response(page.body, mimetype='text/html')
+        response.set_etag(page.etag)
+        response.last_modified = page.last_modified
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         add_to_serial_buffer(f"Error in handle_root: {str(e)}")
         return f"Error: {str(e)}", 500
@@ -270,72 +806,217 @@ def handle_save_settings():
         add_to_serial_buffer(f"Error saving settings: {str(e)}")
         return f"Error: {str(e)}", 500
 
+def accept_form_reading(form):
+    """Parse and queue a reading posted as a form, returns (text, status, headers)
+
+    Shared by /post of the Flask app and of the asyncio server (async_server.py).
+    """
+    # Use device ID from ESP32 settings as default if not provided
+    weather_data, errors = parse_form(form, config.settings.get('id', 1), utc_offset_hours())
+    if IDENTITY_KEYS.intersection(errors):
+        readings_rejected.labels('form').inc()
+        add_to_serial_buffer(f"Rejected weather data: {errors}")
+        return f"Invalid reading: {format_field_errors(errors)}", 400, {}
+    if not weather_data['datetime']:
+        stamp_received(weather_data)
+    
+    add_to_serial_buffer(f"Received weather data from device {weather_data['device_id']}: {weather_data['datetime']}")
+    
+    if queue_weather_data(weather_data):
+        activity.touch()
+        readings_received.labels('form').inc()
+        if errors:
+            return f"Data queued for database, ignored invalid fields: {format_field_errors(errors)}", 200, {}
+        return "Data queued for database.", 200, {}
+    else:
+        return "Server busy, retry later.", 503, {'Retry-After': str(config.ingest_retry_after)}
+
+def accept_json_reading(payload):
+    """Parse and queue a reading posted as JSON, returns (response dict, status, headers)"""
+    if not isinstance(payload, dict):
+        return {"status": "error", "message": "Expected a JSON object"}, 400, {}
+    
+    # device_id defaults to the ID from the settings file
+    data, errors = parse_json(payload, config.settings.get('id', 1), utc_offset_hours())
+    if IDENTITY_KEYS.intersection(errors):
+        readings_rejected.labels('json').inc()
+        return {"status": "error", "message": "Invalid reading", "errors": errors}, 400, {}
+    if not data['datetime']:
+        stamp_received(data)
+    
+    if queue_weather_data(data):
+        activity.touch()
+        readings_received.labels('json').inc()
+        return {"status": "success", "message": "Data queued", "errors": errors}, 200, {}
+    else:
+        return ({"status": "error", "message": "Server busy, retry later"}, 503,
+                {'Retry-After': str(config.ingest_retry_after)})
+
+def accept_binary_readings(buffer, source='binary'):
+    """Decode and queue a binary message (binary.py), returns (response dict, status, headers)
+
+    Shared by /api/weather/binary of both servers and the UDP listener.
+    Records are queued in order; once the queue is full the rest are
+    refused with 503 and `accepted` says how many were taken (resending
+    the whole message is harmless, stored readings are skipped).
+    """
+    try:
+        readings = decode_binary(buffer, config.settings.get('id', 1), utc_offset_hours())
+    except BinaryFormatError as e:
+        readings_rejected.labels(source).inc()
+        return {"status": "error", "message": str(e)}, 400, {}
+    
+    accepted = 0
+    for data in readings:
+        if not data['datetime']:
+            stamp_received(data)
+        if not queue_weather_data(data):
+            break
+        accepted += 1
+    if accepted:
+        activity.touch()
+        readings_received.labels(source).inc(accepted)
+        add_to_serial_buffer(f"Received {accepted} {source} readings from device {readings[0]['device_id']}")
+    if accepted < len(readings):
+        return ({"status": "error", "message": "Server busy, retry later", "received": len(readings),
+                 "accepted": accepted}, 503, {'Retry-After': str(config.ingest_retry_after)})
+    return {"status": "success", "message": "Data queued", "accepted": accepted}, 200, {}
+
+def handle_udp_message(buffer):
+    """UDPListener handler: queue the datagram's readings, returns (ACK status, records accepted)"""
+    result, status, _ = accept_binary_readings(buffer, 'udp')
+    if status == 200:
+        return ACK_OK, result['accepted']
+    if status == 503:
+        return ACK_BUSY, result['accepted']
+    return ACK_INVALID, 0
+
+udp_listener = UDPListener(config.udp_host, config.udp_port, handle_udp_message, log=add_to_serial_buffer)
+
+def binary_max_bytes():
+    return BINARY_HEADER.size + config.binary_max_records * BINARY_RECORD.size
+
 @app.route('/post', methods=['POST'])
 def handle_post():
     """Handle weather data POST (equivalent to handlePost in C++)"""
     try:
-        # Parse weather data from request
-        # Use device ID from ESP32 settings as default if not provided
-        device_id = request.form.get('id')
-        if device_id:
-            device_id = int(device_id)
-        else:
-            # Use ID from ESP32 settings file as default
-            device_id = config.settings.get('id', 1)
-        
-        weather_data = {
-            'device_id': device_id,
-            'datetime': request.form.get('dateutc', ''),
-            'windspeed_kmh': float(request.form.get('windspeedmph', 0)) * 1.60934,
-            'wind_direction': int(request.form.get('winddir', 0)),
-            'rain_rate_in': float(request.form.get('rainratein', 0)),
-            'temp_in_c': (5.0 / 9.0) * (float(request.form.get('tempinf', 0)) - 32.0),
-            'temp_out_c': (5.0 / 9.0) * (float(request.form.get('tempf', 0)) - 32.0),
-            'humidity_in': int(request.form.get('humidityin', 0)),
-            'humidity_out': int(request.form.get('humidity', 0)),
-            'uv_index': float(request.form.get('uv', 0)),
-            'wind_gust_kmh': float(request.form.get('windgustmph', 0)) * 1.60934,
-            'barometric_pressure_rel_in': float(request.form.get('baromrelin', 0)),
-            'barometric_pressure_abs_in': float(request.form.get('baromabsin', 0)),
-            'solar_radiation_wm2': float(request.form.get('solarradiation', 0)),
-            'daily_rain_in': float(request.form.get('dailyrainin', 0)),
-            'rain_today_in': float(request.form.get('raintodayin', 0)),
-            'total_rain_in': float(request.form.get('totalrainin', 0)),
-            'weekly_rain_in': float(request.form.get('weeklyrainin', 0)),
-            'monthly_rain_in': float(request.form.get('monthlyrainin', 0)),
-            'yearly_rain_in': float(request.form.get('yearlyrainin', 0)),
-            'max_daily_gust': float(request.form.get('maxdailygust', 0)),
-            'wh65_batt': float(request.form.get('wh65batt', 0))
-        }
-        
-        # Adjust timezone (add 7 hours for GMT+7)
-        if weather_data['datetime']:
-            dt = datetime.strptime(weather_data['datetime'], '%Y-%m-%d %H:%M:%S')
-            dt += timedelta(hours=7)
-            weather_data['datetime'] = dt.strftime('%Y-%m-%d %H:%M:%S')
-        
-        add_to_serial_buffer(f"Received weather data from device {weather_data['device_id']}: {weather_data['datetime']}")
-        
-        if save_weather_data(weather_data):
-            config.last_activity = time.time()
-            config.watchdog_timer = 0
-            return "Data saved to database.", 200
-        else:
-            return "Failed to save data.", 500
-            
+        return accept_form_reading(request.form)
     except Exception as e:
         add_to_serial_buffer(f"Error in handle_post: {str(e)}")
         return f"Error: {str(e)}", 500
 
 @app.route('/serial')
 def handle_serial():
-    """Get serial monitor output (equivalent to handleSerial in C++)"""
-    output = ""
-    for i in range(config.serial_buffer_size):
-        index = (config.serial_buffer_index + i) % config.serial_buffer_size
-        if config.serial_buffer[index]:
-            output += config.serial_buffer[index] + "\n"
-    return output
+    """Get serial monitor output (equivalent to handleSerial in C++)
+
+    With ?since=<seq> only lines newer than seq are returned, as JSON; a seq
+    from before a restart returns the whole buffer, "seq" is the cursor to
+    send next.
+    """
+    since = request.args.get('since', type=int)
+    if since is None:
+        return "".join(line + "\n" for line in serial_buffer.lines())
+    
+    entries = serial_buffer.since(since)
+    return jsonify({
+        "seq": entries[-1][0] if entries else serial_buffer.last_seq,
+        "lines": [line for _, line in entries]
+    })
+
+def event_stream(chunks, on_close=None):
+    """Server-Sent Events response for a generator that took a stream slot
+
+    The slot is handed back (and on_close called) when the server closes
+    the response, which also happens if the client left before the
+    generator ever ran.
+    """
+    response = Response(chunks, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if on_close is not None:
+        response.call_on_close(on_close)
+    response.call_on_close(stream_slots.release)
+    return response
+
+def client_gone():
+    """Function telling whether the client of this request has disconnected
+
+    waitress (with channel_request_lookahead) notices while the stream
+    waits; elsewhere it is noticed when a write fails.
+    """
+    return request.environ.get('waitress.client_disconnected', lambda: False)
+
+def streams_full():
+    streams_refused.inc()
+    return (jsonify({"error": f"Too many open streams ({stream_slots.limit})"}), 503,
+            {'Retry-After': str(config.ingest_retry_after)})
+
+def serial_cursor():
+    """Serial sequence number a stream resumes after (Last-Event-ID, else ?since=)"""
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int, default=0)
+    return since
+
+def serial_event(seq, line, event=None):
+    data = line.replace('\n', '\ndata: ')
+    if event:
+        return f"event: {event}\nid: {seq}\ndata: {data}\n\n"
+    return f"id: {seq}\ndata: {data}\n\n"
+
+@app.route('/serial/stream')
+def handle_serial_stream():
+    """Server-Sent Events stream of serial monitor lines"""
+    since = serial_cursor()
+    if not stream_slots.acquire():
+        return streams_full()
+    gone = client_gone()
+    
+    def generate(seq):
+        while not gone():
+            entries = serial_buffer.wait(seq, timeout=config.serial_keepalive)
+            if not entries:
+                yield ": keep-alive\n\n"
+                continue
+            for seq, line in entries:
+                yield serial_event(seq, line)
+    
+    return event_stream(generate(since))
+
+@app.route('/api/dashboard/stream')
+def api_dashboard_stream():
+    """The dashboard's single stream: serial lines as `serial` events, readings as `reading` events
+
+    Serial events carry the line's sequence number as id, so a browser
+    reconnecting with Last-Event-ID continues the log where it left off.
+    Lines are picked up every stream_poll_interval, readings as they are
+    published.
+    """
+    since = serial_cursor()
+    if not stream_slots.acquire():
+        return streams_full()
+    subscriber = live_feed.subscribe()
+    gone = client_gone()
+    
+    def generate(seq):
+        yield "retry: 3000\n\n"
+        last_write = time.monotonic()
+        while not gone():
+            for seq, line in serial_buffer.since(seq):
+                yield serial_event(seq, line, 'serial')
+                last_write = time.monotonic()
+            message = subscriber.get(timeout=config.stream_poll_interval)
+            if message is not None:
+                yield f"event: reading\ndata: {message}\n\n"
+                last_write = time.monotonic()
+            elif subscriber.dropped:
+                # Too slow to keep up; the browser reconnects and starts fresh
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            elif time.monotonic() - last_write >= config.serial_keepalive:
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+    
+    return event_stream(generate(since), lambda: live_feed.unsubscribe(subscriber))
 
 @app.route('/download')
 def handle_download():
@@ -349,8 +1030,11 @@ def handle_download():
 def handle_delete():
     """Delete file (equivalent to handleDelete in C++)"""
     filename = request.args.get('file')
+    if filename and data_files.is_protected(filename):
+        return f"{filename} is in use by the database and cannot be deleted", 403
     if filename and os.path.exists(f'data/{filename}'):
         os.remove(f'data/{filename}')
+        data_files.invalidate()
         add_to_serial_buffer(f"File {filename} deleted")
         return redirect(url_for('handle_root'))
     return "File not found", 404
@@ -362,81 +1046,734 @@ def handle_restart():
     # In a real implementation, you might want to restart the service
     return "System restart initiated", 200
 
+@app.route('/metrics')
+def handle_metrics():
+    """Counters, gauges and latency histograms of this process
+
+    Prometheus text format by default, JSON with ?format=json (or an Accept
+    header preferring application/json). Under gunicorn each worker answers
+    with its own numbers; scrape every worker or read them as samples.
+    """
+    fmt = request.args.get('format')
+    if fmt is None:
+        best = request.accept_mimetypes.best_match(['text/plain', 'application/json'])
+        fmt = 'json' if best == 'application/json' and request.accept_mimetypes['text/plain'] < 1 else 'prometheus'
+    if fmt == 'json':
+        return jsonify({"pid": os.getpid(), "metrics": metrics.as_dict()})
+    if fmt != 'prometheus':
+        return jsonify({"status": "error", "message": "format must be prometheus or json"}), 400
+    return Response(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/profile/start', methods=['POST'])
+def handle_profile_start():
+    """Start the sampling profiler (?interval=<seconds> between samples)"""
+    if profiler.running:
+        return jsonify({"status": "error", "message": "Profiler already running"}), 409
+    interval = request.args.get('interval', type=float, default=config.profile_interval)
+    if not interval >= config.profile_min_interval:  # also rejects NaN
+        return jsonify({"status": "error",
+                        "message": f"interval must be at least {config.profile_min_interval:g} seconds"}), 400
+    profiler.interval = interval
+    profiler.start()
+    add_to_serial_buffer(f"Profiler started, sampling every {profiler.interval * 1000:g} ms")
+    return jsonify({"status": "success", "pid": os.getpid(), "interval": profiler.interval})
+
+@app.route('/profile/stop', methods=['POST'])
+def handle_profile_stop():
+    """Stop the profiler; returns the folded stacks and writes them to logs/profile-<time>.folded
+
+    The output is the collapsed format of flamegraph.pl, inferno and
+    speedscope: one "thread;outer;...;inner count" line per distinct stack.
+    """
+    if not profiler.running:
+        return jsonify({"status": "error", "message": "Profiler not running"}), 409
+    folded = profiler.stop()
+    path = os.path.join(config.profile_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+    try:
+        profiler.dump(path)
+        add_to_serial_buffer(f"Profile written to {path} ({profiler.samples} samples)")
+    except OSError as e:
+        add_to_serial_buffer(f"Failed to write profile: {str(e)}")
+    return Response(folded, mimetype='text/plain')
+
+@app.route('/api/maintenance', methods=['GET', 'POST'])
+def api_maintenance():
+    """GET: report of the last maintenance pass; POST: run one now (?vacuum=0 skips VACUUM, ?convert=1 allows a full one)"""
+    try:
+        if request.method == 'GET':
+            if maintenance_report is None:
+                return jsonify({"message": "No maintenance pass yet"}), 404
+            return jsonify(maintenance_report)
+        vacuum = request.args.get('vacuum', '1') != '0'
+        convert = request.args.get('convert', '0') == '1'
+        report = run_maintenance(vacuum, convert)
+        if report is None:
+            return jsonify({"status": "error", "message": "Maintenance already running"}), 409
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/weather', methods=['POST'])
 def api_weather():
     """API endpoint for receiving weather data from ESP32"""
     try:
-        data = request.get_json()
-        
-        # Add device_id if not provided
-        if 'device_id' not in data:
-            data['device_id'] = config.settings.get('id', 1)
-        
-        if save_weather_data(data):
-            return jsonify({"status": "success", "message": "Data saved"}), 200
-        else:
-            return jsonify({"status": "error", "message": "Failed to save data"}), 500
+        result, status, headers = accept_json_reading(request.get_json())
+        return jsonify(result), status, headers
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/weather/binary', methods=['POST'])
+def api_weather_binary():
+    """Readings in the compact binary format of binary.py, many per request"""
+    try:
+        if request.content_length is not None and request.content_length > binary_max_bytes():
+            return jsonify({"status": "error",
+                            "message": f"at most {config.binary_max_records} records per message"}), 413
+        result, status, headers = accept_binary_readings(request.get_data())
+        return jsonify(result), status, headers
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/weather/bulk', methods=['POST'])
+def api_weather_bulk():
+    """Bulk ingest of buffered readings, e.g. a station's SD card backlog
+
+    The body is a JSON array, NDJSON, or CSV lines in the order of the
+    legacy CSV file / the ESP32's /data.txt (optionally with a header row);
+    the format comes from ?format=, the Content-Type, or is sniffed. CSV
+    lines carry no device id, it is taken from ?device= (default: settings
+    id). Readings are stored in large transactions straight away, skipping
+    any already stored for the same device and timestamp, so an upload can
+    simply be repeated after a failure.
+    """
+    fmt = request.args.get('format') or format_for(request.mimetype)
+    if fmt is not None and fmt not in BULK_FORMATS:
+        return jsonify({"status": "error", "message": f"format must be one of {', '.join(BULK_FORMATS)}"}), 400
+    default_device = request.args.get('device', type=int, default=config.settings.get('id', 1))
+    offset = utc_offset_hours()
+    
+    received = stored = rejected = 0
+    errors = []
+    batch = []
+    status, message = "success", None
+    try:
+        for number, record, error in iter_records(request.stream, fmt):
+            received += 1
+            if error is None and not isinstance(record, dict):
+                error = "expected an object"
+            if error is None:
+                data, field_errors = parse_json(record, default_device, offset)
+                if not data['datetime']:
+                    field_errors['datetime'] = "missing timestamp"
+                if IDENTITY_KEYS.intersection(field_errors):
+                    error = format_field_errors(field_errors)
+            if error is not None:
+                rejected += 1
+                if len(errors) < config.bulk_max_errors:
+                    errors.append({"record": number, "error": error})
+                continue
+            
+            batch.append(data)
+            if len(batch) >= config.bulk_batch_size:
+                stored += save_weather_batch(batch, publish=False)
+                batch = []
+    except BulkFormatError as e:
+        status, message = "error", str(e)
+    except Exception as e:
+        add_to_serial_buffer(f"Error in bulk upload: {str(e)}")
+        return jsonify({"status": "error", "message": str(e), "received": received, "stored": stored}), 500
+    
+    try:
+        # Records before a format error are kept, a retry skips them as duplicates
+        if batch:
+            stored += save_weather_batch(batch, publish=False)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e), "received": received, "stored": stored}), 500
+    
+    if stored:
+        activity.touch()
+    readings_received.labels('bulk').inc(received - rejected)
+    readings_rejected.labels('bulk').inc(rejected)
+    add_to_serial_buffer(f"Bulk upload: {received} received, {stored} stored, {rejected} rejected")
+    result = {
+        "status": status,
+        "received": received,
+        "stored": stored,
+        "duplicates": received - rejected - stored,
+        "rejected": rejected,
+        "errors": errors
+    }
+    if message:
+        result["message"] = message
+        return jsonify(result), 400
+    return jsonify(result), 200
+
 @app.route('/api/weather/latest')
 def api_weather_latest():
-    """API endpoint to get latest weather data"""
+    """API endpoint to get latest weather data
+
+    The newest reading of ?device=<id>, or of whichever device reported
+    last, with every column by name; served from memory.
+    """
     try:
-        conn = sqlite3.connect(config.db_file)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM weather_data ORDER BY created_at DESC LIMIT 1')
-        data = cursor.fetchone()
-        conn.close()
+        device_id = request.args.get('device', type=int)
+        data = latest_readings.get(device_id) if device_id is not None else latest_readings.latest()
         
         if data:
-            return jsonify({
-                "datetime": data[1],
-                "windspeed_kmh": data[2],
-                "wind_direction": data[3],
-                "temp_in_c": data[5],
-                "temp_out_c": data[6],
-                "humidity_in": data[7],
-                "humidity_out": data[8],
-                "uv_index": data[9],
-                "barometric_pressure_rel_in": data[11],
-                "solar_radiation_wm2": data[13]
-            })
+            return jsonify(data)
         else:
             return jsonify({"message": "No data available"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def main():
-    """Main function to start the weather station"""
-    add_to_serial_buffer("Weather Station Raspberry Pi Version Starting...")
+@app.route('/api/weather/windows')
+def api_weather_windows():
+    """Rolling-window values: 10-minute average wind, 1-hour max gust, 3-hour pressure tendency, 1-hour rain
+
+    For ?device=<id>, or for every device keyed by id. Windows end at each
+    device's newest reading (as_of) and are kept in memory.
+    """
+    try:
+        device_id = request.args.get('device', type=int)
+        if device_id is None:
+            return jsonify({"devices": {str(key): value for key, value in rolling_windows.all().items()}})
+        windows = rolling_windows.get(device_id)
+        if windows is None:
+            return jsonify({"message": "No data available"}), 404
+        return jsonify(dict(windows, device_id=device_id))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/quality')
+def api_quality():
+    """Values that failed quality control, newest first (?device, ?check=range|rate|zscore, ?limit), with counts per field and check"""
+    try:
+        device_id = request.args.get('device', type=int)
+        check = request.args.get('check')
+        limit = min(request.args.get('limit', type=int, default=100), 1000)
+        if check is not None and check not in QUALITY_CHECKS:
+            return jsonify({"error": f"check must be one of {', '.join(QUALITY_CHECKS)}"}), 400
+        
+        where, params = [], []
+        if device_id is not None:
+            where.append('device_id = ?')
+            params.append(device_id)
+        if check is not None:
+            where.append('check_name = ?')
+            params.append(check)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+        
+        def query(db):
+            counts = db.query(f'''
+                SELECT field, check_name, COUNT(*) AS count FROM quarantine {where_sql}
+                GROUP BY field, check_name
+            ''', params)
+            entries = db.query(f'''
+                SELECT id, device_id, datetime, field, value, check_name, detail, action, created_at
+                FROM quarantine {where_sql} ORDER BY id DESC LIMIT ?
+            ''', params + [limit])
+            return counts, entries
+        
+        results = [query(shards.database(device_id))] if device_id is not None else shards.map(query)
+        counts = {}
+        for shard_counts, _ in results:
+            for row in shard_counts:
+                key = (row['field'], row['check_name'])
+                counts[key] = counts.get(key, 0) + row['count']
+        entries = merge_rows([shard_entries for _, shard_entries in results],
+                             key=lambda row: row['created_at'] or '', reverse=True, limit=limit)
+        return jsonify({
+            "enabled": config.qc_enabled,
+            "mode": config.qc_mode if config.qc_enabled else None,
+            "counts": [{"field": field, "check_name": check_name, "count": count}
+                       for (field, check_name), count in sorted(counts.items(), key=lambda item: -item[1])],
+            "entries": [dict(row) for row in entries]
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/devices')
+def api_devices():
+    """Devices that have reported: last reading time, reading rate and WH65 battery state (from memory)"""
+    try:
+        return jsonify({"devices": latest_readings.devices()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def parse_time_arg(value, default):
+    """Parse a from/to query argument ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS')"""
+    if not value:
+        return default
+    return datetime.fromisoformat(value.replace('T', ' '))
+
+def archived_points(device_id, start, end):
+    """Raw readings of a device/time range that were moved to the archive"""
+    archive = get_archive()
+    if archive is None or not archive.manifest()['partitions']:
+        return []
+    from archive import VALUE_COLUMNS, epoch_to_datetime
+    columns = archive.load_columns(device_id, to_epoch(start), to_epoch(end), ('id',) + VALUE_COLUMNS)
+    order = columns['epoch'].argsort(kind='stable')
+    points = []
+    for i in order:
+        point = {name: (None if values[i] != values[i] else float(values[i])) for name, values in columns.items()}
+        point['id'] = int(point['id'])
+        point['device_id'] = device_id
+        point['datetime'] = epoch_to_datetime(point.pop('epoch'))
+        points.append(point)
+    return points
+
+def archived_rows(names, integer_names, device_id, start, end):
+    """Archived readings as weather_data rows of the columns `names`, for the export
+
+    Partition by partition, a batch at a time; `ts` is derived from the
+    archived station-local time, `created_at` is not archived (None).
+    """
+    if not os.path.isdir(config.archive_dir):
+        return  # nothing archived yet, numpy need not be imported
+    archive = get_archive()
+    if archive is None or not archive.manifest()['partitions']:
+        return
+    from archive import epoch_to_datetime
+    offset = int(utc_offset_hours() * 3600)
+    batches = archive.iter_batches(device_id, to_epoch(start) if start else None, to_epoch(end) if end else None)
+    for columns in batches:
+        epochs = columns['epoch'].tolist()
+        values = []
+        for name in names:
+            if name == 'datetime':
+                values.append([epoch_to_datetime(epoch) for epoch in epochs])
+            elif name == 'ts':
+                values.append([epoch - offset for epoch in epochs])
+            elif name in columns:
+                convert = int if name in integer_names else float
+                values.append([None if value != value else convert(value) for value in columns[name].tolist()])
+            else:
+                values.append([None] * len(epochs))
+        yield from zip(*values)
+
+@app.route('/api/weather/history')
+def api_weather_history():
+    """API endpoint for chart history, served from the coarsest rollup that fits the point budget"""
+    try:
+        device_id = request.args.get('device', type=int, default=config.settings.get('id', 1))
+        end = parse_time_arg(request.args.get('to'), datetime.now())
+        start = parse_time_arg(request.args.get('from'), end - timedelta(days=1))
+        max_points = request.args.get('points', type=int, default=config.history_max_points)
+        resolution = request.args.get('resolution', 'auto')
+        
+        if resolution == 'auto':
+            resolution = pick_resolution((end - start).total_seconds(), max_points, config.post_interval)
+        if resolution != 'raw' and resolution not in RESOLUTIONS:
+            return jsonify({"error": f"Unknown resolution: {resolution}"}), 400
+        
+        params = (device_id, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+        db = shards.database(device_id)
+        if resolution == 'raw':
+            rows = db.query('''
+                SELECT * FROM weather_data
+                WHERE device_id = ? AND datetime >= ? AND datetime <= ?
+                ORDER BY datetime
+            ''', params)
+            points = archived_points(device_id, start, end) + [dict(row) for row in rows]
+        else:
+            table, prefix, suffix, _ = RESOLUTIONS[resolution]
+            # Include the bucket the start time falls into
+            bucket_start = params[1][:prefix] + suffix
+            rows = db.query(f'''
+                SELECT * FROM {table}
+                WHERE device_id = ? AND bucket >= ? AND bucket <= ?
+                ORDER BY bucket
+            ''', (device_id, bucket_start, params[2]))
+            points = [rollup_point(row) for row in rows]
+        
+        return jsonify({
+            "device_id": device_id,
+            "from": params[1],
+            "to": params[2],
+            "resolution": resolution,
+            "points": points
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/weather/stats')
+def api_weather_stats():
+    """API endpoint for statistics over a device/time range (percentiles, wind rose, degree-days)"""
+    try:
+        import stats
+    except ImportError:
+        return jsonify({"error": "Statistics require numpy (pip install numpy)"}), 501
     
-    # Initialize directories
-    os.makedirs('data', exist_ok=True)
-    os.makedirs('logs', exist_ok=True)
-    os.makedirs('templates', exist_ok=True)
-    os.makedirs('static/css', exist_ok=True)
-    os.makedirs('static/js', exist_ok=True)
+    try:
+        device_id = request.args.get('device', type=int, default=config.settings.get('id', 1))
+        end = parse_time_arg(request.args.get('to'), datetime.now())
+        start = parse_time_arg(request.args.get('from'), end - timedelta(days=1))
+        base_c = request.args.get('base', type=float, default=18.0)
+        source = request.args.get('source', 'raw')
+        if source != 'raw' and source not in RESOLUTIONS:
+            return jsonify({"error": f"Unknown source: {source}"}), 400
+        
+        start_str, end_str = start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')
+        conn = shards.database(device_id).connection()
+        if source == 'raw':
+            # Every raw reading, archived ones first, folded in a chunk at a time
+            archive = get_archive()
+            archived = ()
+            if archive is not None and archive.manifest()['partitions']:
+                archived = archive.iter_batches(device_id, to_epoch(start), to_epoch(end))
+            chunks = stats.iter_raw(conn, device_id, start_str, end_str, archived)
+        else:
+            chunks = iter([stats.load_rollup(conn, source, device_id, start_str, end_str)])
+        accumulator = stats.StatsAccumulator()
+        load_s = compute_s = 0.0
+        while True:
+            started = time.perf_counter()
+            columns = next(chunks, None)
+            loaded = time.perf_counter()
+            load_s += loaded - started
+            if columns is None:
+                break
+            accumulator.add(columns)
+            compute_s += time.perf_counter() - loaded
+        started = time.perf_counter()
+        result = accumulator.result(base_c)
+        compute_s += time.perf_counter() - started
+        
+        result.update({
+            "device_id": device_id,
+            "from": start_str,
+            "to": end_str,
+            "source": source,
+            # None: statistics over the readings themselves; else the rollup bucket seconds they are means of
+            "resolution_s": None if source == 'raw' else RESOLUTIONS[source][3],
+            "rows": accumulator.rows,
+            "load_ms": round(load_s * 1000, 1),
+            "compute_ms": round(compute_s * 1000, 1)
+        })
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/weather/export')
+def api_weather_export():
+    """Stream weather data as CSV or NDJSON (optionally gzip) filtered by device and time range
+
+    Archived readings in the range come first, then the rows of weather_data.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+    compress = request.args.get('compress') == 'gzip'
+    
+    conditions, params = [], []
+    device_id = request.args.get('device', type=int)
+    if device_id is not None:
+        conditions.append('device_id = ?')
+        params.append(device_id)
+    try:
+        bounds = {}
+        for arg, op in (('from', '>='), ('to', '<=')):
+            value = bounds[arg] = parse_time_arg(request.args.get(arg), None)
+            if value is not None:
+                conditions.append(f'datetime {op} ?')
+                params.append(value.strftime('%Y-%m-%d %H:%M:%S'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    if device_id is not None or len(shards) == 1:
+        db = shards.database(device_id if device_id is not None else 0)
+        cursor = db.connection().execute(f'SELECT * FROM weather_data {where} ORDER BY id', params)
+    else:
+        # Every shard in storage order (created_at is indexed), merged as rows are streamed
+        cursors = [shard.db.connection().execute(f'SELECT * FROM weather_data {where} ORDER BY created_at, id', params)
+                   for shard in shards]
+        created_at = [description[0] for description in cursors[0].description].index('created_at')
+        cursor = MergedCursor(cursors, key=lambda row: row[created_at] or '')
+    names = [description[0] for description in cursor.description]
+    integer_names = {row[1] for row in shards.database(0).query('PRAGMA table_info(weather_data)') if row[2] == 'INTEGER'}
+    cursor = ChainedCursor(archived_rows(names, integer_names, device_id, bounds['from'], bounds['to']), cursor)
     
-    # Initialize serial buffer
-    config.serial_buffer = [""] * config.serial_buffer_size
+    mimetype, extension = FORMATS[fmt]
+    filename = f"weather_data.{extension}"
+    if compress:
+        mimetype, filename = 'application/gzip', filename + '.gz'
+    
+    chunks = iter_export(cursor, fmt, compress, config.export_page_size)
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+def parse_device_list(value):
+    """Parse a comma-separated ?device= filter into a set of ids (None for all devices)"""
+    if not value:
+        return None
+    return {int(device) for device in value.split(',') if device.strip()}
+
+@app.route('/api/weather/stream')
+def api_weather_stream():
+    """Server-Sent Events feed of ingested readings, optionally filtered with ?device=1,2"""
+    try:
+        devices = parse_device_list(request.args.get('device'))
+    except ValueError:
+        return jsonify({"error": "device must be a comma-separated list of ids"}), 400
+    if not stream_slots.acquire():
+        return streams_full()
+    subscriber = live_feed.subscribe(devices)
+    gone = client_gone()
+    
+    def generate():
+        yield "retry: 3000\n\n"
+        while not gone():
+            message = subscriber.get(timeout=config.serial_keepalive)
+            if message is not None:
+                yield f"event: reading\ndata: {message}\n\n"
+            elif subscriber.dropped:
+                # Too slow to keep up; the browser reconnects and starts fresh
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            else:
+                yield ": keep-alive\n\n"
+    
+    return event_stream(generate(), lambda: live_feed.unsubscribe(subscriber))
+
+def register_websocket_feed():
+    """Serve the live feed over WebSocket at /api/weather/ws when flask-sock is installed"""
+    try:
+        from flask_sock import Sock
+    except ImportError:
+        return False
+    
+    sock = Sock(app)
+    
+    @sock.route('/api/weather/ws')
+    def api_weather_ws(ws):
+        if not stream_slots.acquire():
+            streams_refused.inc()
+            ws.close(1013, "Too many open streams")  # 1013: try again later
+            return
+        subscriber = live_feed.subscribe(parse_device_list(request.args.get('device')))
+        try:
+            while not subscriber.dropped:
+                message = subscriber.get(timeout=config.serial_keepalive)
+                if message is not None:
+                    ws.send(message)
+        finally:
+            live_feed.unsubscribe(subscriber)
+            stream_slots.release()
+    
+    return True
+
+def start_background_services():
+    """Start the forwarder, archiver, maintenance and watchdog threads (in exactly one process)"""
+    # Start forwarding stored readings to postUrl in background
+    if config.settings.get('forwardEnabled', False):
+        for shard in shards:
+            shard.forwarder.start()
+        add_to_serial_buffer(f"Forwarding readings to {config.settings['postUrl']}")
+    
+    # Listen for binary readings over UDP
+    if config.udp_port:
+        try:
+            udp_listener.start()
+            add_to_serial_buffer(f"Listening for binary readings on UDP port {config.udp_port}")
+        except OSError as e:
+            add_to_serial_buffer(f"UDP listener failed to start: {str(e)}")
+    
+    # Start archiving of old readings in background
+    archive_thread = threading.Thread(target=archive_worker, daemon=True)
+    archive_thread.start()
+    
+    # Start retention, vacuum and file rotation in background
+    maintenance_thread = threading.Thread(target=maintenance_worker, name='maintenance', daemon=True)
+    maintenance_thread.start()
+    
+    # Start watchdog timer in background
+    watchdog_thread = threading.Thread(target=watchdog_timer, daemon=True)
+    watchdog_thread.start()
+
+def claim_data_directory():
+    """Exit unless no other server process runs on the data directory, else hold the owner lock
+
+    Each server runs the background services (forwarder, archive,
+    maintenance), so e.g. the async server next to the Flask server would
+    run them twice on the same files.
+    """
+    if not owner_lock.try_acquire():
+        sys.exit(f"Another Weather Station server (pid {owner_lock.holder()}) runs on this data directory; "
+                 "the Flask and the async server must not run together")
+
+def claim_background_services():
+    """Run the background services as soon as no other worker process does"""
+    while not owner_lock.try_acquire():
+        time.sleep(config.owner_retry_interval)
+    add_to_serial_buffer(f"Worker {os.getpid()} runs the background services")
+    start_background_services()
+
+def configure_logging():
+    """Log to logs/weather_station.log and the console; a listener thread writes, callers only enqueue"""
+    global log_listener
+    if log_listener is not None:
+        return
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    log_queue = queue.SimpleQueue()
+    log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    # Reopens the file once maintenance moved it aside, in every worker process
+    log_handlers = [logging.handlers.WatchedFileHandler(LOG_FILE), logging.StreamHandler()]
+    for log_handler in log_handlers:
+        log_handler.setFormatter(log_formatter)
+    log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+    log_listener.start()
+    # The queue handler passes the bare message on, the listener's handlers format it
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.handlers.QueueHandler(log_queue)])
+
+def stop_logging():
+    """Flush and stop the log listener thread"""
+    if log_listener is not None:
+        log_listener.stop()
+
+def allow_any_origin(response):
+    """CORS header for every origin, used when flask-cors is not installed"""
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+    return response
+
+def create_app():
+    """App factory: directories, worker-shared state, logging, CORS and WebSocket route; returns the Flask app
+
+    Importing this module defines the routes but has no side effects;
+    gunicorn loads weather_station:create_app(), main() calls it through
+    start_worker(). Optional subsystems are imported where first used:
+    requests by the forwarder's first upload, numpy with the archive and
+    statistics, aiohttp with --server async; Flask compiles the dashboard
+    template on its first request.
+    """
+    global _app_ready, serial_buffer, activity
+    if _app_ready:
+        return app
+    os.makedirs(os.path.dirname(config.db_file), exist_ok=True)
+    if config.shared_state:
+        serial_buffer = SharedSerialBuffer(config.serial_db_file, config.serial_buffer_size)
+        activity = ActivityClock(config.activity_file)
+    configure_logging()
+    stream_slots.limit = config.max_streams or max(config.threads // 2, 1)
+    open_shards()
+    try:
+        from flask_cors import CORS
+        CORS(app)
+    except ImportError:
+        app.after_request(allow_any_origin)
+    register_websocket_feed()
+    _app_ready = True
+    return app
+
+def start_worker():
+    """Per-process startup: settings, database and ingest writer, plus the background services when elected
+
+    Called by main() for the single-process servers and by gunicorn's
+    post_worker_init hook in every worker. Each worker keeps its own ingest
+    writer (readings it acknowledged only exist in its memory); SQLite
+    serializes their transactions. Readings are accepted as soon as the
+    writer runs; it loads the in-memory state (warm_caches) first.
+    """
+    global settings_mtime
+    create_app()
     
     # Load settings
     load_settings()
+    if os.path.exists(config.settings_file):
+        settings_mtime = os.stat(config.settings_file).st_mtime
     
     # Initialize database
     init_database()
     
-    # Start watchdog timer in background
-    watchdog_thread = threading.Thread(target=watchdog_timer, daemon=True)
-    watchdog_thread.start()
+    # Start the background writers for incoming readings, one per shard
+    for shard in shards:
+        shard.ingest_queue.start()
+    
+    if config.shared_state:
+        threading.Thread(target=claim_background_services, name='owner-election', daemon=True).start()
+        threading.Thread(target=feed_tail_worker, name='live-feed-tail', daemon=True).start()
+    else:
+        claim_data_directory()
+        start_background_services()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Weather Station Raspberry Pi Version")
+    parser.add_argument('--server', choices=('dev', 'waitress', 'gunicorn', 'async'),
+                        default=os.environ.get('WEATHER_STATION_SERVER', 'dev'),
+                        help="dev: Flask development server; waitress: threaded production server; "
+                             "gunicorn: multi-process production server (see gunicorn.conf.py); "
+                             "async: asyncio server for the ingest, latest, serial and stream routes")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=8, help="request threads (per worker for gunicorn)")
+    parser.add_argument('--udp-port', type=int, help="also accept binary readings as UDP datagrams on this port")
+    parser.add_argument('--shards', type=int, default=config.shard_count,
+                        help="database files the stations are split over by device id (0: one data/weather.db)")
+    return parser.parse_args(argv)
+
+def exec_gunicorn(args):
+    """Replace this process with a gunicorn master serving weather_station:create_app()"""
+    env = dict(os.environ,
+               WEATHER_STATION_DIR=os.getcwd(),
+               WEATHER_STATION_BIND=f"{args.host}:{args.port}",
+               WEATHER_STATION_WORKERS=str(args.workers),
+               WEATHER_STATION_THREADS=str(args.threads),
+               WEATHER_STATION_SHARDS=str(args.shards))
+    if args.udp_port:
+        env['WEATHER_STATION_UDP_PORT'] = str(args.udp_port)
+    conf = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    stop_logging()
+    os.execvpe(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', conf, 'weather_station:create_app()'], env)
+
+def main():
+    """Main function to start the weather station"""
+    args = parse_args()
+    if args.server == 'gunicorn':
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            sys.exit("gunicorn is not installed: pip install gunicorn")
+        exec_gunicorn(args)
+    
+    if args.udp_port:
+        config.udp_port = udp_listener.port = args.udp_port
+    config.shard_count = args.shards
+    config.threads = args.threads
+    claim_data_directory()
+    create_app()
+    add_to_serial_buffer("Weather Station Raspberry Pi Version Starting...")
+    start_worker()
+    
+    # Queued readings are flushed on exit
+    atexit.register(shutdown_ingest)
+    signal.signal(signal.SIGTERM, handle_sigterm)
     
     add_to_serial_buffer("Weather Station started successfully")
-    add_to_serial_buffer(f"Web interface available at: http://localhost:5000")
-    add_to_serial_buffer(f"API endpoint: http://localhost:5000/api/weather")
+    add_to_serial_buffer(f"Web interface available at: http://localhost:{args.port}")
+    add_to_serial_buffer(f"API endpoint: http://localhost:{args.port}/api/weather")
     
-    # Start Flask app
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    if args.server == 'waitress':
+        try:
+            from waitress import serve
+        except ImportError:
+            sys.exit("waitress is not installed: pip install waitress")
+        # The lookahead keeps reading connections whose request runs, so a stream notices a client leaving
+        serve(app, host=args.host, port=args.port, threads=args.threads, channel_request_lookahead=1)
+    elif args.server == 'async':
+        try:
+            import async_server
+        except ImportError:
+            sys.exit("aiohttp is not installed: pip install aiohttp")
+        async_server.serve(sys.modules[__name__], host=args.host, port=args.port)
+    else:
+        # Start Flask app (development server)
+        app.run(host=args.host, port=args.port, debug=False)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Rolling-window metrics for the Weather Station
+Per device, a 10-minute average wind (speed and vector-mean direction),
+the highest gust of the last hour, the 3-hour pressure tendency and the
+rain of the last hour are kept up to date as readings arrive, each in
+amortized O(1) per reading, so nothing is recomputed from stored rows
+"""
+
+import math
+import threading
+from collections import deque
+
+from fields import format_timestamp, parse_timestamp
+from rollups import rain_delta, to_number
+
+HPA_PER_INHG = 33.8639
+
+# Window lengths in seconds
+WIND_WINDOW = 600
+GUST_WINDOW = 3600
+PRESSURE_WINDOW = 3 * 3600
+RAIN_WINDOW = 3600
+LONGEST_WINDOW = max(WIND_WINDOW, GUST_WINDOW, PRESSURE_WINDOW, RAIN_WINDOW)
+
+PRESSURE_SAMPLE_INTERVAL = 60  # seconds between kept pressure samples
+
+# Barometric tendency over 3 hours, by absolute change in hPa (Met Office wording)
+PRESSURE_TRENDS = ((1.0, 'steady'), (3.5, 'slowly'), (6.0, 'quickly'), (math.inf, 'rapidly'))
+
+# Columns read back from weather_data to rebuild the windows
+WARM_COLUMNS = ('datetime', 'ts', 'windspeed_kmh', 'wind_direction', 'wind_gust_kmh',
+                'barometric_pressure_rel_in', 'total_rain_in', 'daily_rain_in')
+
+
+class WindowSum:
+    """Sum and count of the values of the last `span` seconds"""
+
+    __slots__ = ('span', 'entries', 'total')
+
+    def __init__(self, span):
+        self.span = span
+        self.entries = deque()
+        self.total = 0.0
+
+    def add(self, ts, value):
+        self.entries.append((ts, value))
+        self.total += value
+        self.expire(ts)
+
+    def expire(self, now):
+        entries = self.entries
+        while entries and entries[0][0] <= now - self.span:
+            self.total -= entries.popleft()[1]
+        if not entries:
+            self.total = 0.0  # drop the rounding error accumulated by the subtractions
+
+    @property
+    def count(self):
+        return len(self.entries)
+
+
+class WindowMax:
+    """Maximum of the values of the last `span` seconds (monotonic deque)
+
+    The deque holds decreasing values; a new value removes every smaller
+    one before it, as those can never be the maximum again.
+    """
+
+    __slots__ = ('span', 'entries')
+
+    def __init__(self, span):
+        self.span = span
+        self.entries = deque()
+
+    def add(self, ts, value):
+        entries = self.entries
+        while entries and entries[-1][1] <= value:
+            entries.pop()
+        entries.append((ts, value))
+        self.expire(ts)
+
+    def expire(self, now):
+        entries = self.entries
+        while entries and entries[0][0] <= now - self.span:
+            entries.popleft()
+
+    @property
+    def value(self):
+        return self.entries[0][1] if self.entries else None
+
+
+class WindowFirst:
+    """Oldest value of the last `span` seconds, sampled at most every `interval` seconds"""
+
+    __slots__ = ('span', 'interval', 'entries')
+
+    def __init__(self, span, interval):
+        self.span = span
+        self.interval = interval
+        self.entries = deque()
+
+    def add(self, ts, value):
+        entries = self.entries
+        if entries and ts - entries[-1][0] < self.interval:
+            return
+        entries.append((ts, value))
+        while entries[0][0] < ts - self.span:
+            entries.popleft()
+
+    @property
+    def first(self):
+        return self.entries[0] if self.entries else None
+
+
+def pressure_trend(change_hpa):
+    """'steady', 'rising slowly', 'falling rapidly', ... for a 3-hour change"""
+    for limit, word in PRESSURE_TRENDS:
+        if abs(change_hpa) < limit:
+            if word == 'steady':
+                return word
+            return f"{'rising' if change_hpa > 0 else 'falling'} {word}"
+
+
+class DeviceWindows:
+    """The windows of one device; readings must arrive in timestamp order"""
+
+    def __init__(self):
+        self.last_ts = None
+        self.last_datetime = None
+        self.wind_speed = WindowSum(WIND_WINDOW)
+        self.wind_u = WindowSum(WIND_WINDOW)  # unit vectors of the direction, as in the rollups
+        self.wind_v = WindowSum(WIND_WINDOW)
+        self.gust = WindowMax(GUST_WINDOW)
+        self.pressure = WindowFirst(PRESSURE_WINDOW, PRESSURE_SAMPLE_INTERVAL)
+        self.pressure_now = None
+        self.rain = WindowSum(RAIN_WINDOW)
+        self.rain_counters = (None, None)  # (total_rain_in, daily_rain_in) of the previous reading
+
+    def add(self, data):
+        """Fold one reading in; returns False for a reading not newer than the last one"""
+        ts = data.get('ts')
+        if ts is None or (self.last_ts is not None and ts <= self.last_ts):
+            return False
+        self.last_ts = ts
+        self.last_datetime = data.get('datetime')
+
+        speed = to_number(data.get('windspeed_kmh'))
+        if speed is not None:
+            self.wind_speed.add(ts, speed)
+        direction = to_number(data.get('wind_direction'))
+        if direction is not None:
+            radians = math.radians(direction)
+            self.wind_u.add(ts, math.sin(radians))
+            self.wind_v.add(ts, math.cos(radians))
+        gust = to_number(data.get('wind_gust_kmh'))
+        if gust is not None:
+            self.gust.add(ts, gust)
+        pressure = to_number(data.get('barometric_pressure_rel_in'))
+        if pressure:
+            self.pressure.add(ts, pressure)
+            self.pressure_now = pressure
+
+        # Same counter choice as the rollups: total_rain_in when the station sends it
+        total_rain = to_number(data.get('total_rain_in'))
+        daily_rain = to_number(data.get('daily_rain_in'))
+        previous_total, previous_daily = self.rain_counters
+        if total_rain:
+            rain = rain_delta(previous_total, total_rain)
+        else:
+            rain = rain_delta(previous_daily, daily_rain)
+        self.rain_counters = (total_rain, daily_rain)
+        self.rain.add(ts, rain)
+        return True
+
+    def snapshot(self):
+        """Window values as of the newest reading"""
+        now = self.last_ts
+        for window in (self.wind_speed, self.wind_u, self.wind_v, self.gust, self.rain):
+            window.expire(now)
+
+        direction = steadiness = None
+        if self.wind_u.count:
+            u = self.wind_u.total / self.wind_u.count
+            v = self.wind_v.total / self.wind_v.count
+            steadiness = math.hypot(u, v)  # 1: constant direction, 0: no prevailing direction
+            if steadiness > 1e-6:
+                direction = round(math.degrees(math.atan2(u, v)) % 360, 1)
+
+        change = change_hpa = span = None
+        first = self.pressure.first
+        if first is not None and self.pressure_now is not None and now > first[0]:
+            change = self.pressure_now - first[1]
+            change_hpa = change * HPA_PER_INHG
+            span = now - first[0]
+
+        return {
+            "as_of": self.last_datetime,
+            "as_of_ts": now,
+            "wind_avg_10m_kmh": round(self.wind_speed.total / self.wind_speed.count, 2) if self.wind_speed.count else None,
+            "wind_dir_avg_10m": direction,
+            "wind_dir_steadiness_10m": round(steadiness, 3) if steadiness is not None else None,
+            "gust_max_1h_kmh": self.gust.value,
+            "pressure_tendency_3h_in": round(change, 3) if change is not None else None,
+            "pressure_tendency_3h_hpa": round(change_hpa, 2) if change_hpa is not None else None,
+            "pressure_tendency_span_s": span,
+            "pressure_trend": pressure_trend(change_hpa) if change_hpa is not None else None,
+            "rain_1h_in": round(max(self.rain.total, 0.0), 3) if self.rain.count else None,
+        }
+
+
+class RollingWindows:
+    """DeviceWindows per device_id
+
+    Windows end at each device's newest reading (`as_of`), not at the
+    server's clock, so a replayed backlog or a station with a skewed clock
+    still gets consistent values. Readings older than the newest one seen
+    for their device are skipped, which also makes feeding the same
+    readings twice harmless.
+    """
+
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def warm(self, conn):
+        """Rebuild the windows of the devices stored in `conn` from their readings of the last hours"""
+        devices = {}
+        for device_id, newest in conn.execute('SELECT device_id, datetime FROM latest_reading').fetchall():
+            try:
+                cutoff = format_timestamp(parse_timestamp(str(newest)) - LONGEST_WINDOW)
+            except ValueError:
+                continue
+            windows = devices[device_id] = DeviceWindows()
+            cursor = conn.execute(f'''
+                SELECT {', '.join(WARM_COLUMNS)} FROM weather_data
+                WHERE device_id = ? AND datetime >= ? ORDER BY datetime
+            ''', (device_id, cutoff))
+            for row in cursor:
+                windows.add(dict(zip(WARM_COLUMNS, row)))
+        with self._lock:
+            self._devices.update(devices)
+        return len(devices)
+
+    def update(self, readings):
+        """Fold stored readings in, in the order given"""
+        with self._lock:
+            for data in readings:
+                device_id = data.get('device_id', 1)
+                windows = self._devices.get(device_id)
+                if windows is None:
+                    windows = self._devices[device_id] = DeviceWindows()
+                windows.add(data)
+
+    def get(self, device_id):
+        """Window values of a device, None if it has none"""
+        with self._lock:
+            windows = self._devices.get(device_id)
+            if windows is None or windows.last_ts is None:
+                return None
+            return windows.snapshot()
+
+    def all(self):
+        """Window values of every device, keyed by device_id"""
+        with self._lock:
+            return {device_id: windows.snapshot()
+                    for device_id, windows in sorted(self._devices.items()) if windows.last_ts is not None}
+
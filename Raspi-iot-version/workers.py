@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Process coordination for multi-worker serving
+When the app runs under several worker processes (gunicorn), exactly one of
+them owns the background services, elected with an exclusive file lock, and
+state every worker needs to see lives outside process memory
+"""
+
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not on POSIX; a single process owns everything anyway
+    fcntl = None
+
+
+class OwnerLock:
+    """Non-blocking exclusive lock on a file, held for the life of the process
+
+    The kernel releases the lock when the owning process exits (or is
+    killed), so a surviving worker can take over on its next attempt.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """Take the lock if no other process holds it, returns whether this process owns it"""
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def holder(self):
+        """Pid of the process that took the lock last (it may have exited since), or None"""
+        try:
+            with open(self.path) as file:
+                return int(file.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def release(self):
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+        self._fd = None
+
+
+class ActivityClock:
+    """Time of the last ingested reading
+
+    In-process it is a plain timestamp; with a path it is the mtime of that
+    file, so a reading taken by any worker is seen by the watchdog in the
+    owner process (one utime() call per reading).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._last = time.time()
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.touch()
+
+    def touch(self):
+        now = time.time()
+        self._last = now
+        if self.path:
+            try:
+                os.utime(self.path, (now, now))
+            except FileNotFoundError:
+                with open(self.path, 'a'):
+                    pass
+
+    @property
+    def last(self):
+        """Epoch seconds of the last activity"""
+        if self.path:
+            try:
+                return os.stat(self.path).st_mtime
+            except OSError:
+                pass
+        return self._last
+
+    def idle_seconds(self):
+        return max(0.0, time.time() - self.last)